@@ -3,9 +3,10 @@ import threading
 import asyncio
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from watchdog.observers import Observer
-from osfoffline.database_manager.utils import save
+from osfoffline.database_manager.utils import save, get_unit_of_work
 import osfoffline.database_manager.models as models
 import osfoffline.polling_osf_manager.polling as polling
+from osfoffline.polling_osf_manager.transport import get_transport, close_transport
 import osfoffline.filesystem_manager.osf_event_handler as osf_event_handler
 from osfoffline.database_manager.db import session
 from osfoffline.filesystem_manager.sync_local_filesytem_and_db import LocalDBSync
@@ -31,6 +32,8 @@ class BackgroundWorker(threading.Thread):
 
         logging.info('run in background tasks called for first time.')
         self.loop = self.ensure_event_loop()
+        # connect while the user is looked up. the connections outlive pausing and resuming the poller.
+        self.loop.create_task(get_transport(self.loop).warm_up())
         self.run_background_tasks()
         self.loop.run_forever()
 
@@ -56,6 +59,8 @@ class BackgroundWorker(threading.Thread):
 
             self.stop_observing_osf_folder()
 
+            self.commit_pending_saves()
+
             # self.stop_loop()
 
             self.running = False
@@ -70,6 +75,18 @@ class BackgroundWorker(threading.Thread):
 
 
 
+    def commit_pending_saves(self):
+        # the poller and the event handler commit in batches. runs on the loop before it is stopped.
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(get_unit_of_work(self.loop).flush)
+
+    def close_connections(self):
+        # the connections belong to the loop. closed on it, after the pending saves, before it is stopped.
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(close_transport)
+        else:
+            close_transport()
+
     # todo: can refactor this code out to somewhere
 
     def get_current_user(self):
@@ -101,6 +118,8 @@ class BackgroundWorker(threading.Thread):
         logging.info('stop polling')
         self.stop_observing_osf_folder()
         logging.info('stop observing')
+        self.commit_pending_saves()
+        self.close_connections()
         self.stop_loop(close=True)
 
 
@@ -1,11 +1,13 @@
 import shutil
 import os
 from appdirs import user_data_dir
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import SingletonThreadPool
-from osfoffline.database_manager.models import Base
-from osfoffline.settings import PROJECT_NAME, PROJECT_AUTHOR
+from osfoffline.database_manager.models import Base, backfill_rel_paths
+from osfoffline.settings import (
+    PROJECT_NAME, PROJECT_AUTHOR, DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_MMAP_SIZE, DB_CACHE_SIZE
+)
 
 
 DB_DIR = user_data_dir(PROJECT_NAME, PROJECT_AUTHOR)
@@ -15,6 +17,67 @@ URL = 'sqlite:///{}'.format(DB_FILE_PATH)
 # sqlite+pysqlcipher://:passphrase/file_path
 # URL = 'sqlite+pysqlcipher://:PASSWORD/{DB_FILE_PATH}'.format(DB_FILE_PATH=DB_FILE_PATH)
 
+
+def apply_storage_profile(engine, journal_mode=DB_JOURNAL_MODE, synchronous=DB_SYNCHRONOUS,
+                          mmap_size=DB_MMAP_SIZE, cache_size=DB_CACHE_SIZE):
+    """
+    Set the sqlite pragmas of the storage profile on every connection of engine. see settings.py
+    The journal mode is stored in the db file. The others only last as long as the connection.
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode={}'.format(journal_mode))
+        cursor.execute('PRAGMA synchronous={}'.format(synchronous))
+        cursor.execute('PRAGMA mmap_size={}'.format(int(mmap_size)))
+        # a negative cache_size is in KiB instead of pages
+        cursor.execute('PRAGMA cache_size=-{}'.format(int(cache_size)))
+        cursor.close()
+
+
+def add_missing_columns(engine, metadata=Base.metadata):
+    """
+    Add the columns of the models that the tables of an existing db lack, along with their indexes.
+    create_all only creates the tables that are missing, so a db from an older version would fail on the first
+    query that reads a new column. New columns are nullable, and the rows that are already there get NULL.
+    Run before create_all.
+    :return: [(table name, column name)] of the columns that were added
+    """
+    preparer = engine.dialect.identifier_preparer
+    added = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            rows = connection.execute('PRAGMA table_info({})'.format(preparer.quote(table.name)))
+            existing = {row[1] for row in rows}
+            # a missing table is made by create_all
+            if not existing:
+                continue
+            new_columns = [column for column in table.columns if column.name not in existing]
+            for column in new_columns:
+                connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    preparer.format_table(table), preparer.format_column(column), column.type.compile(engine.dialect)
+                ))
+                added.append((table.name, column.name))
+            for index in table.indexes:
+                if any((table.name, column.name) in added for column in index.columns):
+                    index.create(connection)
+    return added
+
+
+def upgrade_db(engine):
+    """
+    Bring a db that an older version made up to the models. The rows of a db from before rel_path was stored
+    get theirs once the column is added. Run once at startup, before anything else uses the db.
+    """
+    add_missing_columns(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        backfill_rel_paths(session)
+    finally:
+        session.close()
+
+
 if not os.path.isdir(DB_DIR):
     os.makedirs(DB_DIR)
 engine = create_engine(
@@ -22,10 +85,15 @@ engine = create_engine(
     # poolclass=SingletonThreadPool,
     connect_args={'check_same_thread': False},
 )
-Base.metadata.create_all(engine)
+apply_storage_profile(engine)
+upgrade_db(engine)
 session_factory = sessionmaker(bind=engine)
 Session = scoped_session(session_factory)
 
+# for reads outside of the sync engine, e.g. the preferences window. see utils.reader_scope
+# each thread gets a session of its own. with WAL it reads the last commit while the sync engine writes.
+ReaderSession = scoped_session(sessionmaker(bind=engine))
+
 
 session = Session()
 
@@ -1,10 +1,12 @@
 __author__ = 'himanshu'
 import hashlib
 import datetime
+import itertools
 import os
 from osfoffline.database_manager.json_type import JSONEncodedDict
-from sqlalchemy import create_engine, ForeignKey, Enum
-from sqlalchemy.orm import sessionmaker, relationship, backref, scoped_session, validates
+from sqlalchemy import create_engine, ForeignKey, Enum, event, inspect, literal, and_, func
+from sqlalchemy.orm import sessionmaker, relationship, backref, scoped_session, validates, mapper, Session
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy import Column, Integer, Boolean, String, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import QueuePool
@@ -70,11 +72,20 @@ class Node(Base):
     date_modified = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     osf_id = Column(String, unique=True, nullable=True, default=None)  # multiple things allowed to be null
 
+    # date_modified of the node on the osf (naive utc) the last time its files and child nodes were fully checked.
+    remote_date_modified = Column(DateTime, nullable=True, default=None)
+    # date (naive utc) of the newest entry in the node's log on the osf whose changes have been synced.
+    # None until the node has been walked with the change feed on.
+    log_cursor = Column(DateTime, nullable=True, default=None)
+    # ids of the log entries at log_cursor that have been synced. entries can share a date.
+    log_cursor_ids = Column(JSONEncodedDict(512), nullable=True, default=None)
 
     locally_created = Column(Boolean, default=False)
     locally_deleted = Column(Boolean, default=False)
     locally_moved = Column(Boolean, default=False)
 
+    # path of the node's folder relative to the osf folder of the user. see _update_rel_paths
+    rel_path = Column(String, nullable=True, default=None, index=True)
 
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     parent_id = Column(Integer, ForeignKey('node.id'))
@@ -100,15 +111,20 @@ class Node(Base):
 
     @hybrid_property
     def path(self):
-        """Recursively walk up the path of the node. Top level node joins with the osf folder path of the user
-        """
-        # +os.path.sep+ instead of os.path.join: http://stackoverflow.com/a/14504695
+        """The rel_path of the node joined with the osf folder path of the user."""
+        return os.path.join(self.user.osf_local_folder_path, self.current_rel_path)
+
+    @property
+    def current_rel_path(self):
+        return self.rel_path if self.rel_path is not None else self.build_rel_path()
 
+    def build_rel_path(self):
+        """Walk up the parents of the node. Only needed until a changed node is flushed."""
+        # +os.path.sep+ instead of os.path.join: http://stackoverflow.com/a/14504695
         if self.parent:
-            return os.path.join(self.parent.path,'Components', self.title)
+            return os.path.join(self.parent.current_rel_path, 'Components', self.title)
         else:
-
-            return os.path.join(self.user.osf_local_folder_path, self.title)
+            return self.title
 
     def locally_create_children(self):
         self.locally_created = True
@@ -177,6 +193,9 @@ class File(Base):
     previous_node_osf_id = Column(String, nullable=True, default=None)
     previous_provider = Column(String, default=DEFAULT_PROVIDER)
 
+    # path of the file/folder relative to the osf folder of the user. see _update_rel_paths
+    rel_path = Column(String, nullable=True, default=None, index=True)
+
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     node_id = Column(Integer, ForeignKey('node.id'), nullable=False)
     parent_id = Column(Integer, ForeignKey('file.id'))
@@ -214,13 +233,20 @@ class File(Base):
 
     @hybrid_property
     def path(self):
-        """Recursively walk up the path of the file/folder. Top level file/folder joins with the path of the containing node.
-        """
+        """The rel_path of the file/folder joined with the osf folder path of the user."""
+        return os.path.join(self.user.osf_local_folder_path, self.current_rel_path)
+
+    @property
+    def current_rel_path(self):
+        return self.rel_path if self.rel_path is not None else self.build_rel_path()
+
+    def build_rel_path(self):
+        """Walk up the parents of the file/folder. Only needed until a changed file/folder is flushed."""
         # +os.path.sep+ instead of os.path.join: http://stackoverflow.com/a/14504695
         if self.parent:
-            return os.path.join(self.parent.path, self.name)
+            return os.path.join(self.parent.current_rel_path, self.name)
         else:
-            return os.path.join(self.node.path, self.name)
+            return os.path.join(self.node.current_rel_path, self.name)
 
     def update_hash(self, block_size=2 ** 20):
         if self.is_file:
@@ -291,4 +317,114 @@ class File(Base):
         )
 
 
+# Node.rel_path and File.rel_path are the paths of the items below the osf folder. They are stored and indexed so
+# that building the path of an item and finding the item at a path do not walk up its parents.
+#
+# Renaming or moving an item resets its rel_path to None, and its path is built from its parents until it is flushed.
+# On flush, its rel_path is stored, and the rel_path of everything below it is rewritten with one UPDATE per table.
+# So the paths of the items below a renamed or moved folder are only up to date once it was flushed.
+
+def _path_changed(target, value, oldvalue, initiator):
+    # reading rel_path loads it if it expired, so the flush still knows where the item was
+    if value != oldvalue and target.rel_path is not None:
+        target.rel_path = None
+
+
+@event.listens_for(mapper, 'after_configured')
+def _listen_for_path_changes():
+    # the parent attributes are backrefs, which only exist once the mappers are configured
+    for attribute in (Node.title, Node.parent, File.name, File.parent, File.node):
+        if not event.contains(attribute, 'set', _path_changed):
+            event.listen(attribute, 'set', _path_changed)
 
+
+def _below(table, prefix):
+    """Rows whose rel_path starts with prefix, a path ending with os.sep. a range, so the index is used."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(table.c.rel_path > prefix, table.c.rel_path < upper)
+
+
+def _rewrite_subtree(session, old_prefix, new_prefix, skip):
+    for table in (Node.__table__, File.__table__):
+        session.execute(
+            table.update().where(_below(table, old_prefix)).values(
+                rel_path=literal(new_prefix, String) + func.substr(table.c.rel_path, len(old_prefix) + 1)
+            )
+        )
+    # loaded items are updated in place, without being flushed again. expired ones load the new value when read.
+    for item in list(session.identity_map.values()):
+        rel_path = item.__dict__.get('rel_path')
+        if isinstance(item, (Node, File)) and item not in skip and rel_path and rel_path.startswith(old_prefix):
+            set_committed_value(item, 'rel_path', new_prefix + rel_path[len(old_prefix):])
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_rel_paths(session, flush_context, instances):
+    changed = [
+        item for item in itertools.chain(session.new, session.dirty)
+        if isinstance(item, (Node, File)) and item.rel_path is None
+    ]
+    if not changed:
+        return
+    new_rel_paths = {item: item.build_rel_path() for item in changed}
+    moved = []
+    for item in changed:
+        old_rel_paths = inspect(item).attrs.rel_path.history.deleted
+        if old_rel_paths and old_rel_paths[0] and old_rel_paths[0] != new_rel_paths[item] and \
+                not (isinstance(item, File) and item.is_file):
+            moved.append((old_rel_paths[0], new_rel_paths[item]))
+    # deepest first, so the prefix of a renamed folder inside a renamed folder is still found
+    for old_rel_path, new_rel_path in sorted(moved, key=lambda paths: len(paths[0]), reverse=True):
+        _rewrite_subtree(session, os.path.join(old_rel_path, ''), os.path.join(new_rel_path, ''), new_rel_paths)
+    for item, rel_path in new_rel_paths.items():
+        item.rel_path = rel_path
+
+
+def backfill_rel_paths(session):
+    """
+    Store the rel_path of the rows that have none, which a db from before rel_path was stored still has.
+    item_at_rel_path can not find them otherwise. Run once at startup, before anything else uses the db.
+    :return: the number of rows that were filled in
+    """
+    missing = session.query(Node).filter(Node.rel_path.is_(None)).all() + \
+        session.query(File).filter(File.rel_path.is_(None)).all()
+    if not missing:
+        return 0
+    rel_paths = {item: item.build_rel_path() for item in missing}
+    for item, rel_path in rel_paths.items():
+        item.rel_path = rel_path
+    session.commit()
+    return len(missing)
+
+
+def item_at_rel_path(session, user, rel_path, is_dir):
+    """The Node or File of user at rel_path below the osf folder, or None. Nodes are folders."""
+    if is_dir:
+        node = session.query(Node).filter(Node.user_id == user.id, Node.rel_path == rel_path).first()
+        if node is not None:
+            return node
+    return session.query(File).filter(
+        File.user_id == user.id,
+        File.rel_path == rel_path,
+        File.type == (File.FOLDER if is_dir else File.FILE)
+    ).first()
+
+
+class HttpValidator(Base):
+    """
+    The ETag and Last-Modified validators of a json page that was fetched from the osf, along with the page itself.
+    They are sent back with the next request for the same url. If the osf answers 304 Not Modified, the page is
+    replayed from here instead of being downloaded and parsed again.
+    """
+    __tablename__ = 'http_validator'
+
+    id = Column(Integer, primary_key=True)
+    url = Column(String, unique=True, nullable=False, index=True)
+    etag = Column(String, nullable=True, default=None)
+    last_modified = Column(String, nullable=True, default=None)
+    body = Column(JSONEncodedDict, nullable=True, default=None)
+
+    def __repr__(self):
+        return "<HttpValidator ({}), url={}, etag={}, last_modified={}>".format(
+            self.id, self.url, self.etag, self.last_modified
+        )
@@ -1,8 +1,10 @@
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from osfoffline.database_manager.models import User
 from contextlib import contextmanager
-from osfoffline.database_manager.db import session, DB_DIR
+from osfoffline.database_manager.db import session, session_factory, ReaderSession, DB_DIR
+from osfoffline.settings import DB_BATCH_MAX_ITEMS, DB_BATCH_MAX_SECONDS
 
+import logging
 import shutil
 def save(session, *items_to_save):
     for item in items_to_save:
@@ -26,6 +28,118 @@ def session_scope():
     finally:
         session.close()
 
+
+@contextmanager
+def reader_scope():
+    """
+    A session of its own for reading, e.g. from the ui. It is closed at the end, so it does not keep an old snapshot
+    of the db open. The items it loaded are detached then, so read what you need inside.
+    """
+    try:
+        yield ReaderSession()
+    finally:
+        ReaderSession.remove()
+
+
+@contextmanager
+def writer_scope():
+    """
+    A session of its own for writing from outside of the sync engine, e.g. from the ui thread. Committed at the end.
+    The session of the sync engine belongs to the thread of its loop. It sees the change once it reads the row again,
+    e.g. Poll.check_osf refreshes the user every cycle.
+    """
+    writer = session_factory()
+    try:
+        yield writer
+        writer.commit()
+    except:
+        writer.rollback()
+        raise
+    finally:
+        writer.close()
+
+
+class UnitOfWork(object):
+    """
+    Commits the saves of the sync engine in batches instead of one by one. Every commit of sqlite waits for the disk,
+    so the first sync of a large project used to spend most of its time committing.
+
+    save() flushes the items right away, so they get their ids and rel_paths and every query of the session sees
+    them. They are committed together once max_items saves are waiting or max_delay seconds after the first of them,
+    whichever comes first, and whenever flush() is called: at the end of every poll walk and event queue run, and
+    when the background worker stops.
+
+    Durability: a save is on disk at most max_delay seconds later. After a crash the saves of the last batch are lost.
+    The next poll creates the missing rows again from the osf and downloads their files again. Local changes whose
+    rows were lost are not sent to the osf until they change again. If a flush or commit fails, the whole batch is
+    rolled back, not just the item that failed. Code outside the sync engine keeps using save(), which also commits
+    whatever the batch holds.
+
+    Only use it from the thread of its loop. The poller and the event handler share the one of get_unit_of_work().
+    """
+    def __init__(self, session, loop, max_items=DB_BATCH_MAX_ITEMS, max_delay=DB_BATCH_MAX_SECONDS):
+        self.session = session
+        self._loop = loop
+        self.max_items = max_items
+        self.max_delay = max_delay
+        # saves since the last commit
+        self.pending = 0
+        self.commits = 0
+        self._flush_handle = None
+
+    def save(self, *items_to_save):
+        for item in items_to_save:
+            self.session.add(item)
+        try:
+            self.session.flush()
+        except:
+            self._discard()
+            raise
+        self.pending += 1
+        if self.pending >= self.max_items:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.max_delay, self._flush_later)
+
+    def flush(self):
+        """Commit every save that is waiting."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.pending:
+            return
+        try:
+            self.session.commit()
+        except:
+            self._discard()
+            raise
+        self.pending = 0
+        self.commits += 1
+
+    def _flush_later(self):
+        self._flush_handle = None
+        try:
+            self.flush()
+        except Exception:
+            logging.exception('could not commit a batch of {} saves. it was rolled back.'.format(self.pending))
+
+    def _discard(self):
+        logging.warning('rolling back a batch of {} saves'.format(self.pending))
+        self.session.rollback()
+        self.pending = 0
+
+
+_unit_of_work = None
+
+
+def get_unit_of_work(loop):
+    """The UnitOfWork of the db session for the sync engine. A new one is made if the loop changed."""
+    global _unit_of_work
+    if _unit_of_work is None or _unit_of_work._loop is not loop:
+        _unit_of_work = UnitOfWork(session, loop)
+    return _unit_of_work
+
+
 def remove_db():
     shutil.rmtree(DB_DIR)
 
@@ -1,3 +1,6 @@
+import aiohttp
+
+
 # OSF ERROR
 class OSFError(Exception):
     pass
@@ -39,6 +42,13 @@ class NodeNotFound(NotFound):
     pass
 
 
+class ServerUnavailable(aiohttp.errors.ClientConnectionError):
+    """Raised without sending the request while the circuit breaker for a host is open."""
+    def __init__(self, host):
+        super().__init__('{} is not reachable. waiting for it to come back'.format(host))
+        self.host = host
+
+
 class StateError(Exception):
     pass
 
@@ -6,3 +6,6 @@ class Poll(Exception):
     pass
 
 
+class RangesNotSupported(Poll):
+    """The server answered a request for a byte range of a file with something other than that range."""
+    pass
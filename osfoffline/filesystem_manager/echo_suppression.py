@@ -0,0 +1,146 @@
+"""
+The changes that the sync engine makes to the osf folder come back from watchdog as events, just like the changes
+the user makes. Before it changes a path, the engine registers the events it expects in echo_registry, and the event
+handler drops the events that match, instead of looking them up, hashing files and syncing them back to the osf.
+
+A registration drops as many events as the change causes: one for a single path, and one for every file and folder
+below a folder that is moved or deleted as well, counted when it is registered. Later events for the same paths are
+the user's. A file that the engine wrote is registered with its size and modification time, so a change the user makes
+to it afterwards is not taken for an echo. A registration is forgotten after ECHO_SUPPRESSION_SECONDS, even if some
+of its events never came.
+
+The engine registers from the event loop thread and watchdog matches from its own thread, so both go through a lock.
+"""
+import collections
+import os
+import threading
+import time
+
+from osfoffline.settings import ECHO_SUPPRESSION_SECONDS
+
+EVENT_TYPE_MOVED = 'moved'
+EVENT_TYPE_DELETED = 'deleted'
+EVENT_TYPE_CREATED = 'created'
+EVENT_TYPE_MODIFIED = 'modified'
+
+# remaining: number of events that are still to be dropped
+Expected = collections.namedtuple('Expected', ['dest_path', 'tree', 'fingerprint', 'deadline', 'remaining'])
+
+
+def fingerprint(path):
+    """(size, modification time) of the file at path, or None if there is no such file."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def count_below(path):
+    """Number of files and folders below the folder at path."""
+    return sum(len(dir_names) + len(file_names) for _, dir_names, file_names in os.walk(path))
+
+
+def _normalize(path):
+    # watchdog reports folders without the trailing slash that ProperPath.full_path has
+    return os.path.normpath(path)
+
+
+class EchoRegistry(object):
+    def __init__(self, timeout=ECHO_SUPPRESSION_SECONDS, clock=time.monotonic):
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (event type, path) -> Expected
+        self._expected = {}
+        # (deadline, key) in the order of registration, to forget expired registrations
+        self._deadlines = collections.deque()
+
+    def __len__(self):
+        return len(self._expected)
+
+    def expect(self, event_type, path, dest_path=None, tree=False):
+        """
+        Drop the next event of event_type for path, with dest_path for moves. With tree, also drop one event for
+        everything below path, as watchdog reports them when a folder is moved or deleted.
+        Register before the change, while what is below path can still be counted.
+        """
+        remaining = 1 + count_below(path) if tree else 1
+        self._register(event_type, path, Expected(
+            _normalize(dest_path) if dest_path else None, tree, None, self._clock() + self.timeout, remaining
+        ))
+
+    def expect_file(self, path, file_fingerprint):
+        """
+        Drop the next created and the next modified event for path, as long as the file there has file_fingerprint.
+        Register a file that is moved into place with the fingerprint it has before the move.
+        """
+        deadline = self._clock() + self.timeout
+        for event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED):
+            self._register(event_type, path, Expected(None, False, file_fingerprint, deadline, 1))
+
+    def is_echo(self, event_type, src_path, dest_path=None):
+        """Whether a watchdog event is the echo of a registered change. The registration it matches is used up."""
+        src_path = _normalize(src_path)
+        with self._lock:
+            self._forget_expired()
+            key, expected, below = self._find(event_type, src_path)
+        if expected is None or not self._matches(expected, event_type, src_path, dest_path, below):
+            return False
+        with self._lock:
+            self._consume(key, expected)
+        return True
+
+    def _matches(self, expected, event_type, src_path, dest_path, below):
+        if expected.fingerprint is not None:
+            return fingerprint(src_path) == expected.fingerprint
+        if event_type == EVENT_TYPE_MOVED:
+            if dest_path is None or expected.dest_path is None:
+                return False
+            expected_dest_path = os.path.join(expected.dest_path, below) if below else expected.dest_path
+            return _normalize(dest_path) == expected_dest_path
+        return True
+
+    def _consume(self, key, expected):
+        current = self._expected.get(key)
+        # another event used it up, or it was registered again, in the meantime
+        if current is None or current.deadline != expected.deadline:
+            return
+        if current.remaining > 1:
+            self._expected[key] = current._replace(remaining=current.remaining - 1)
+        else:
+            del self._expected[key]
+
+    def _register(self, event_type, path, expected):
+        key = (event_type, _normalize(path))
+        with self._lock:
+            self._forget_expired()
+            self._expected[key] = expected
+            self._deadlines.append((expected.deadline, key))
+
+    def _find(self, event_type, path):
+        """(key of the registration that path falls under, the registration, the part of path below its path)"""
+        key = (event_type, path)
+        expected = self._expected.get(key)
+        if expected is not None:
+            return key, expected, ''
+        parent, below = os.path.split(path)
+        while parent and below:
+            key = (event_type, parent)
+            expected = self._expected.get(key)
+            if expected is not None and expected.tree:
+                return key, expected, os.path.relpath(path, parent)
+            parent, below = os.path.split(parent)
+        return None, None, None
+
+    def _forget_expired(self):
+        now = self._clock()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, key = self._deadlines.popleft()
+            expected = self._expected.get(key)
+            # a later registration of the same key replaced this one
+            if expected is not None and expected.deadline == deadline:
+                del self._expected[key]
+
+
+echo_registry = EchoRegistry()
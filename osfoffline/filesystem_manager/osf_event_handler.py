@@ -3,15 +3,18 @@ This is the most important file in the system. OSFEventHandler is responsible fo
 storing the data into the db, and then sending a request to the remote server.
 """
 import asyncio
+import os
 
-from watchdog.events import FileSystemEventHandler, DirModifiedEvent
+from watchdog.events import FileSystemEventHandler, DirModifiedEvent, FileModifiedEvent
 import logging
-from osfoffline.database_manager.models import Node, File,User
+from osfoffline.database_manager.models import Node, File,User, item_at_rel_path
 from osfoffline.database_manager.db import session
-from osfoffline.database_manager.utils import save, session_scope
+from osfoffline.database_manager.utils import get_unit_of_work
 from osfoffline.utils.path import ProperPath
 from osfoffline.exceptions.event_handler_exceptions import MovedNodeUnderFile
 from osfoffline.exceptions.item_exceptions import ItemNotInDB
+from osfoffline.polling_osf_manager.transfers import is_part_file
+from osfoffline.filesystem_manager.echo_suppression import echo_registry
 import osfoffline.alerts as AlertHandler
 
 EVENT_TYPE_MOVED = 'moved'
@@ -29,6 +32,8 @@ class OSFEventHandler(FileSystemEventHandler):
         self._loop = loop or asyncio.get_event_loop()
         self.osf_folder = ProperPath(osf_folder, True)
         self.user = session.query(User).filter(User.logged_in).one()
+        # the handlers run on the loop. a burst of events is committed together. see database_manager/utils.py
+        self.unit_of_work = get_unit_of_work(self._loop)
 
 
 
@@ -68,7 +73,7 @@ class OSFEventHandler(FileSystemEventHandler):
         if item.name != dest_path.name:
             item.name = dest_path.name
             item.locally_renamed = True
-            save(session, item)
+            self.unit_of_work.save(item)
             logging.info("renamed a file {}".format(dest_path.full_path))
         # move
         elif src_path != dest_path:
@@ -76,7 +81,7 @@ class OSFEventHandler(FileSystemEventHandler):
             try:
                 item_to_replace = self._get_item_by_path(dest_path)
                 session.delete(item_to_replace)
-                save(session)
+                self.unit_of_work.save()
             except ItemNotInDB:
                 logging.info('file does not already exist in moved destination: {}'.format(dest_path.full_path))
 
@@ -102,7 +107,7 @@ class OSFEventHandler(FileSystemEventHandler):
             #flags
             item.locally_moved = True
 
-            save(session, item)
+            self.unit_of_work.save(item)
             logging.info('moved from {} to {}'.format(src_path.full_path, dest_path.full_path))
 
 
@@ -149,7 +154,7 @@ class OSFEventHandler(FileSystemEventHandler):
             except FileNotFoundError:
                 # if file doesnt exist just as we create it, then file is likely temp file. thus don't put it in db.
                 return
-        save(session, new_item, containing_item)
+        self.unit_of_work.save(new_item, containing_item)
         logging.info("created new {} {}".format('folder' if event.is_directory else 'file', src_path.full_path))
 
     @asyncio.coroutine
@@ -179,7 +184,7 @@ class OSFEventHandler(FileSystemEventHandler):
         item.update_hash()
 
         # save
-        save(session, item)
+        self.unit_of_work.save(item)
 
 
     @asyncio.coroutine
@@ -205,10 +210,10 @@ class OSFEventHandler(FileSystemEventHandler):
         # nodes cannot be deleted online. THUS, delete it inside database. It will be recreated locally.
         if isinstance(item, Node):
             session.delete(item)
-            save(session)
+            self.unit_of_work.save()
             return
 
-        save(session, item)
+        self.unit_of_work.save(item)
 
         logging.info('{} set to be deleted'.format(src_path.full_path))
 
@@ -220,6 +225,17 @@ class OSFEventHandler(FileSystemEventHandler):
             AlertHandler.warn('Cannot have a custom file or folder named Components')
             return
 
+        # staging files of downloads are not synced. when a finished download is moved into place,
+        # the file it replaces changed.
+        if is_part_file(event.src_path):
+            dest_path = getattr(event, 'dest_path', None)
+            if event.event_type != EVENT_TYPE_MOVED or dest_path is None or is_part_file(dest_path):
+                return
+            event = FileModifiedEvent(dest_path)
+
+        # changes that the sync engine made itself. see echo_suppression.py
+        if echo_registry.is_echo(event.event_type, event.src_path, getattr(event, 'dest_path', None)):
+            return
 
         _method_map = {
             EVENT_TYPE_MODIFIED: self.on_modified,
@@ -255,17 +271,16 @@ class OSFEventHandler(FileSystemEventHandler):
 
         return self._get_item_by_path(containing_folder_path)
 
-    # todo: figure out how you can improve this
     def _get_item_by_path(self, path):
+        """Look the item up by its indexed rel_path. see models.py"""
         assert isinstance(path, ProperPath)
-        for node in session.query(Node):
-            if ProperPath(node.path, True) == path:
-                return node
-        for file_folder in session.query(File):
-            file_path = ProperPath(file_folder.path, file_folder.is_folder)
-            if file_path == path:
-                return file_folder
-        raise ItemNotInDB('item has path: {}'.format(path.full_path))
+        rel_path = os.path.relpath(path.full_path, self.osf_folder.full_path)
+        item = None
+        if rel_path != os.curdir and not rel_path.startswith(os.pardir):
+            item = item_at_rel_path(session, self.user, rel_path, path.is_dir)
+        if item is None:
+            raise ItemNotInDB('item has path: {}'.format(path.full_path))
+        return item
 
 
     def _event_is_for_components_file_folder(self, event):
@@ -15,6 +15,7 @@ from osfoffline.database_manager.models import User, Node, File, Base
 from osfoffline.exceptions.item_exceptions import InvalidItemType, FolderNotInFileSystem
 from osfoffline.exceptions.local_db_sync_exceptions import LocalDBBothNone, IncorrectLocalDBMatch
 from osfoffline.utils.path import ProperPath
+from osfoffline.polling_osf_manager.transfers import is_part_file
 
 
 class LocalDBSync(object):
@@ -94,7 +95,7 @@ class LocalDBSync(object):
                 return []
             else:
                 children = []
-                for child in os.listdir(item.full_path):
+                for child in self._list_local_folder(item.full_path):
                     child_item_path = os.path.join(item.full_path, child)
                     is_dir = os.path.isdir(child_item_path)
                     child_item = ProperPath(child_item_path, is_dir)
@@ -125,6 +126,9 @@ class LocalDBSync(object):
                                       'ype '
                                       '{item_type}'.format(item_type=type(item)))
 
+    def _list_local_folder(self, path):
+        """Names in a local folder, without the staging files of unfinished downloads."""
+        return [child for child in os.listdir(path) if not is_part_file(child)]
 
     def _get_proper_path(self, item):
         if isinstance(item, ProperPath):
@@ -9,11 +9,49 @@ FILES = 'files'
 APPLICATIONS = 'applications'
 CHILDREN = 'children'
 RESOURCES = 'resources'
+LOGS = 'logs'
 def _ensure_trailing_slash(url):
     url.rstrip('/')
     return url+'/'
 
-def api_url_for(endpoint_type, related_type=None, **kwargs):
+
+def with_listing_params(url, filters=None, fields=None, page_size=None):
+    """
+    Add json api query parameters to a listing url. Parameters already in the url are replaced.
+    :param filters: {'parent': 'null'} -> filter[parent]=null. the osf only returns matching items.
+    :param fields: {'nodes': ['title', 'category']} -> fields[nodes]=title,category. the osf only returns these
+        attributes and relationships of each item.
+    :param page_size: page[size]. items per page.
+    """
+    listing_url = furl(url)
+    for key, value in (filters or {}).items():
+        listing_url.args['filter[{}]'.format(key)] = value
+    for item_type, item_fields in (fields or {}).items():
+        listing_url.args['fields[{}]'.format(item_type)] = ','.join(item_fields)
+    if page_size is not None:
+        listing_url.args['page[size]'] = page_size
+    return listing_url.url
+
+
+def _node_segments(related_type=None, node_id=None, provider=None, file_id=None, **kwargs):
+    segments = []
+    if node_id is not None:
+        segments.append(str(node_id))
+    if related_type:
+        assert related_type in [FILES, CHILDREN, LOGS]
+        segments.append(related_type)
+        # /v2/nodes/<node_id>/files/<provider>/ lists the top of a provider, .../<provider>/<file_id>/ a folder
+        if provider is not None:
+            segments.append(provider)
+            if file_id is not None:
+                segments.append(str(file_id))
+    return segments
+
+
+def api_url_for(endpoint_type, related_type=None, filters=None, fields=None, page_size=None, **kwargs):
+    """
+    :param filters, fields, page_size: query parameters for listings. see with_listing_params.
+    """
     base = furl(API_BASE)
     files_base = furl(FILE_BASE)
     assert endpoint_type in [USERS, NODES, FILES, APPLICATIONS, RESOURCES]
@@ -28,13 +66,7 @@ def api_url_for(endpoint_type, related_type=None, **kwargs):
     elif endpoint_type == NODES:
 
         base.path.segments.extend(['v2',NODES])
-        if 'node_id' in kwargs and kwargs['node_id'] is not None:
-            base.path.segments.append(str(kwargs['node_id']))
-        if related_type:
-            assert related_type in [FILES, CHILDREN]
-            base.path.segments.append(related_type)
-            if 'provider' in kwargs and 'file_id' in kwargs and kwargs['provider'] is not None and kwargs['file_id'] is not None:
-                base.path.segments.extend([kwargs['provider'], str(kwargs['file_id'])])
+        base.path.segments.extend(_node_segments(related_type, **kwargs))
     elif endpoint_type == FILES:
         base.path.segments.extend(['v2',FILES])
         if 'file_id' in kwargs and kwargs['file_id'] is not None:
@@ -49,4 +81,4 @@ def api_url_for(endpoint_type, related_type=None, **kwargs):
         if 'file_id' in kwargs and kwargs['file_id'] is not None:
             files_base.path.segments.append(str(kwargs['file_id']))
         return _ensure_trailing_slash(files_base.url)
-    return _ensure_trailing_slash(base.url)
\ No newline at end of file
+    return with_listing_params(_ensure_trailing_slash(base.url), filters=filters, fields=fields, page_size=page_size)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Counters and timings for a single poll cycle. At the end of every cycle they are logged as one json record
+on the 'osfoffline.metrics' logger, so they can be collected and graphed.
+
+Phase timings are cumulative. Listings run concurrently, so the listing time of a cycle can be longer
+than the cycle itself.
+"""
+import collections
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from furl import furl
+
+LISTING = 'listing'
+RECONCILIATION = 'reconciliation'
+DB_COMMIT = 'db_commit'
+EVENT_EXECUTION = 'event_execution'
+RATE_LIMIT = 'rate_limit'
+
+metrics_logger = logging.getLogger('osfoffline.metrics')
+
+
+def endpoint_type(method, url):
+    """
+    Group urls by the kind of endpoint they point to, ignoring ids.
+    e.g. GET https://staging-api.osf.io/v2/nodes/abcde/files/osfstorage/123/ -> 'GET nodes/files'
+    """
+    segments = [segment for segment in furl(url).path.segments if segment]
+    if segments[:2] == ['v1', 'resources']:
+        kind = 'resources'
+    elif len(segments) >= 2 and segments[0] == 'v2':
+        kind = segments[1]
+        if len(segments) >= 4:
+            kind = '{}/{}'.format(segments[1], segments[3])
+    else:
+        kind = 'other'
+    return '{} {}'.format(method.upper(), kind)
+
+
+class CycleStats(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self._started_monotonic = time.monotonic()
+        self.requests = collections.Counter()
+        self.response_bytes = 0
+        self.retries = 0
+        self.throttled = 0
+        self.phase_seconds = collections.Counter()
+        self.events = collections.Counter()
+        # free form values that describe the cycle, e.g. whether it was a full walk
+        self.info = {}
+
+    def count_request(self, method, url, num_bytes):
+        self.requests[endpoint_type(method, url)] += 1
+        self.response_bytes += num_bytes or 0
+
+    def count_retry(self):
+        self.retries += 1
+
+    def count_throttled(self):
+        self.throttled += 1
+
+    def count_event(self, event):
+        self.events[event.__class__.__name__] += 1
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phase_seconds[phase] += time.monotonic() - start
+
+    def as_record(self):
+        return {
+            'started': self.started,
+            'duration': time.monotonic() - self._started_monotonic,
+            'requests': dict(self.requests),
+            'total_requests': sum(self.requests.values()),
+            'response_bytes': self.response_bytes,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'phase_seconds': dict(self.phase_seconds),
+            'events': dict(self.events),
+            'info': dict(self.info),
+        }
+
+    def emit(self):
+        """Log the record for the cycle that just ended and start counting a new cycle."""
+        metrics_logger.info(json.dumps(self.as_record(), sort_keys=True))
+        self.reset()
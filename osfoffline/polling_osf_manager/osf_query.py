@@ -3,24 +3,109 @@ import asyncio
 import aiohttp
 import json
 from osfoffline.polling_osf_manager.remote_objects \
-    import (dict_to_remote_object, RemoteUser, RemoteFolder, RemoteFile, RemoteNode, RemoteObject )
+    import (dict_to_remote_object, page_to_remote_objects, RemoteUser, RemoteFolder, RemoteFile, RemoteNode, RemoteObject,
+            RemoteFileFolder, RemoteLog)
 from osfoffline.database_manager.models import File,Node,User
-from osfoffline.polling_osf_manager.api_url_builder import api_url_for, NODES, RESOURCES, FILES
+from osfoffline.polling_osf_manager.api_url_builder import api_url_for, with_listing_params, NODES, RESOURCES, FILES, LOGS
+from osfoffline.polling_osf_manager.validator_cache import ValidatorCache
+from osfoffline.polling_osf_manager.instrumentation import CycleStats, LISTING, RATE_LIMIT
+from osfoffline.polling_osf_manager.transport import get_transport
+from osfoffline.polling_osf_manager.retry import RetryPolicy, RETRY_STATUSES, is_stream, is_success
+from osfoffline.polling_osf_manager.rate_limit import is_throttled, retry_after_seconds, SERVICE_UNAVAILABLE
+from osfoffline.polling_osf_manager.transfers import (
+    read_chunks, received_bytes, content_range, TransferProgress, RESUMABLE, RESUME_INCOMPLETE
+)
+from osfoffline.database_manager.db import session
+from osfoffline.database_manager.utils import get_unit_of_work
+from osfoffline.settings import (
+    CONDITIONAL_REQUESTS, LISTING_PAGE_SIZE, SPARSE_FIELDSETS, HTTP_REQUEST_TIMEOUT, RATE_LIMIT_MAX_THROTTLED_RETRIES,
+    UPLOAD_CHUNK_SIZE, RESUMABLE_UPLOADS, RESUMABLE_UPLOAD_MIN_SIZE, UPLOAD_MAX_RESUMES
+)
 import osfoffline.alerts as AlertHandler
 import concurrent
 import logging
+import os
 OK = 200
 CREATED = 201
 ACCEPTED = 202
+NOT_MODIFIED = 304
+BAD_REQUEST = 400
+NOT_FOUND = 404
+METHOD_NOT_ALLOWED = 405
+
+REQUEST_ERRORS = (aiohttp.errors.ClientTimeoutError, aiohttp.errors.ClientConnectionError, concurrent.futures._base.TimeoutError)
+
+
+class PageIterator(object):
+    """
+    The pages of a paginated listing, as lists of RemoteObjects.
+    There are no async iterators before python 3.5. Instead, the next_page coroutine returns one page per call
+    and None once the listing is done. The request for the next page is sent as soon as a page arrives, so it is
+    downloaded while the caller works on the current page.
+    """
+    def __init__(self, osf_query, url, loop):
+        self._osf_query = osf_query
+        self._loop = loop
+        # this is for the case that a new folder is created so does not have the proper links.
+        self._next = self._fetch(url) if url else None
+
+    def _fetch(self, url):
+        return self._loop.create_task(self._osf_query.make_request(url, get_json=True))
+
+    @asyncio.coroutine
+    def next_page(self):
+        if self._next is None:
+            return None
+        with self._osf_query.stats.timed(LISTING):
+            try:
+                resp = yield from self._next
+            except Exception:
+                self._next = None
+                raise
+        next_url = resp['links']['next']
+        self._next = self._fetch(next_url) if next_url else None
+        return page_to_remote_objects(resp['data'])
+
+    def close(self):
+        """Stop fetching pages. Call when the rest of the listing is not needed."""
+        if self._next is not None:
+            self._next.cancel()
+            self._next = None
+
+
+def _listing_url(url, item_type, fields, page_size=LISTING_PAGE_SIZE, filters=None):
+    """The url of a listing of item_type items with larger pages and, if SPARSE_FIELDSETS, only the used fields."""
+    if url is None:
+        return None
+    return with_listing_params(
+        url,
+        filters=filters,
+        fields={item_type: fields} if SPARSE_FIELDSETS else None,
+        page_size=page_size
+    )
 
 
 class OSFQuery(object):
-    def __init__(self, loop, oauth_token):
+    def __init__(self, loop, oauth_token, conditional_requests=CONDITIONAL_REQUESTS, stats=None, transport=None,
+                 retry_policy=None):
         self.headers = {
             # 'Authorization': 'Bearer {}'.format(oauth_token),
             'Cookie':'osf_staging={}'.format(oauth_token)
         }
-        self.request_session = aiohttp.ClientSession(loop=loop, headers=self.headers)
+        self._loop = loop
+        # the connections belong to the process wide transport and stay open after this query is closed.
+        self.transport = transport or get_transport(loop)
+        self.request_session = self.transport.session(headers=self.headers)
+        # when set, json GETs are made conditional and their pages are replayed from the db on 304.
+        self.validator_cache = ValidatorCache(session, get_unit_of_work(loop)) if conditional_requests else None
+        self.stats = stats or CycleStats()
+        self.retry_policy = retry_policy or RetryPolicy()
+        # turned off for good once the server turns down a resumable upload.
+        self.resumable_uploads = RESUMABLE_UPLOADS
+
+    @property
+    def loop(self):
+        return self._loop
 
     @asyncio.coroutine
     def _get_all_paginated_members(self, remote_url):
@@ -30,47 +115,107 @@ class OSFQuery(object):
         if remote_url is None:
             return remote_children
 
+        with self.stats.timed(LISTING):
+            resp = yield from self.make_request(remote_url, get_json=True)
 
-        resp = yield from self.make_request(remote_url, get_json=True)
-
-        remote_children.extend(resp['data'])
-        while resp['links']['next']:
+            remote_children.extend(resp['data'])
+            while resp['links']['next']:
 
-            resp = yield from self.make_request(resp['links']['next'], get_json=True)
+                resp = yield from self.make_request(resp['links']['next'], get_json=True)
 
-            remote_children.extend(resp['data'])
+                remote_children.extend(resp['data'])
 
         for child in remote_children:
             assert isinstance(child, dict)
 
         return remote_children
 
+    def iter_paginated_members(self, remote_url):
+        """Like _get_all_paginated_members, but page by page. see PageIterator."""
+        return PageIterator(self, remote_url, self._loop)
 
     @asyncio.coroutine
     def get_top_level_nodes(self, url):
         assert isinstance(url, str)
+        # the osf leaves out components. they are still checked for here, in case a server ignores the filter.
+        url = _listing_url(url, NODES, RemoteNode.FIELDS, filters={'parent': 'null'})
         all_remote_nodes = yield from self._get_all_paginated_members(url)
-        remote_top_level_nodes = []
-        for remote in all_remote_nodes:
-            as_remote_node = RemoteNode(remote)
-
-            if as_remote_node.is_top_level:
-                remote_top_level_nodes.append(as_remote_node)
-        for node in remote_top_level_nodes:
-            assert node.is_top_level
-        return remote_top_level_nodes
+        return [node for node in page_to_remote_objects(all_remote_nodes) if node.is_top_level]
 
     @asyncio.coroutine
     def get_child_nodes(self, remote_node):
         assert isinstance(remote_node, RemoteNode)
-        nodes = yield from self._get_all_paginated_members(remote_node.child_nodes_url)
-        return [dict_to_remote_object(node) for node in nodes]
+        url = _listing_url(remote_node.child_nodes_url, NODES, RemoteNode.FIELDS)
+        nodes = yield from self._get_all_paginated_members(url)
+        return page_to_remote_objects(nodes)
 
     @asyncio.coroutine
     def get_child_files(self, remote_node_or_folder):
         assert isinstance(remote_node_or_folder, RemoteNode) or isinstance(remote_node_or_folder, RemoteFolder)
-        file_folders = yield from self._get_all_paginated_members(remote_node_or_folder.child_files_url)
-        return [dict_to_remote_object(file_folder) for file_folder in file_folders]
+        url = _listing_url(remote_node_or_folder.child_files_url, FILES, RemoteFileFolder.FIELDS)
+        file_folders = yield from self._get_all_paginated_members(url)
+        return page_to_remote_objects(file_folders)
+
+    def iter_child_files(self, remote_node_or_folder):
+        assert isinstance(remote_node_or_folder, RemoteNode) or isinstance(remote_node_or_folder, RemoteFolder)
+        return self.iter_paginated_members(
+            _listing_url(remote_node_or_folder.child_files_url, FILES, RemoteFileFolder.FIELDS)
+        )
+
+    def iter_local_folder_children(self, local_node, local_folder=None):
+        """List the remote children of a local folder, or of the top of the node's osfstorage if no folder is given.
+        Used to check a single folder without first listing its parents.
+        """
+        assert isinstance(local_node, Node)
+        assert local_folder is None or local_folder.is_folder
+        url = api_url_for(
+            NODES,
+            related_type=FILES,
+            node_id=local_node.osf_id,
+            provider=local_folder.provider if local_folder else File.DEFAULT_PROVIDER,
+            file_id=local_folder.osf_id if local_folder else None
+        )
+        return self.iter_paginated_members(_listing_url(url, FILES, RemoteFileFolder.FIELDS))
+
+    @asyncio.coroutine
+    def get_node_logs(self, node_id, since, since_ids, max_logs):
+        """
+        The log entries of a node that are newer than since, newest first.
+        Entries from the same moment as since are new as well, unless they are in since_ids.
+        Pages are requested only until an entry that is older than since is found.
+        :param since: utc datetime of the newest entry that is already known
+        :param since_ids: ids of the entries at since that are already known
+        :param max_logs: if there are more new entries than this, stop and return None
+        """
+        url = _listing_url(api_url_for(NODES, related_type=LOGS, node_id=node_id), LOGS, RemoteLog.FIELDS)
+        new_logs = []
+        with self.stats.timed(LISTING):
+            while url:
+                resp = yield from self.make_request(url, get_json=True)
+                for log in page_to_remote_objects(resp['data']):
+                    if log.date < since:
+                        return new_logs
+                    if log.date == since and log.id in since_ids:
+                        continue
+                    if len(new_logs) == max_logs:
+                        return None
+                    new_logs.append(log)
+                url = resp['links']['next']
+        return new_logs
+
+    @asyncio.coroutine
+    def get_log_cursor(self, node_id):
+        """
+        (utc datetime of the newest log entry of a node, ids of the entries at that datetime),
+        or None if the node has no log entries.
+        """
+        url = _listing_url(api_url_for(NODES, related_type=LOGS, node_id=node_id), LOGS, RemoteLog.FIELDS)
+        with self.stats.timed(LISTING):
+            resp = yield from self.make_request(url, get_json=True)
+        logs = page_to_remote_objects(resp['data'])
+        if not logs:
+            return None
+        return logs[0].date, [log.id for log in logs if log.date == logs[0].date]
 
     @asyncio.coroutine
     def download_file(self, remote_file):
@@ -115,10 +260,13 @@ class OSFQuery(object):
         return dict_to_remote_object(resp_json['data'])
 
     @asyncio.coroutine
-    def upload_file(self, local_file):
+    def upload_file(self, local_file, progress=None):
         """
         THROWS FileNotFoundError !!!!!!
+        The file is streamed, UPLOAD_CHUNK_SIZE bytes at a time. Large files are uploaded in a resumable session
+        if RESUMABLE_UPLOADS is on and the server offers it (see transfers.py).
         :param local_file:
+        :param progress: TransferProgress to report to. by default progress is logged.
         :return:
         """
         assert isinstance(local_file, File)
@@ -132,12 +280,77 @@ class OSFQuery(object):
 
         parent_osf_id = local_file.parent.osf_id if local_file.has_parent else None
         files_url = api_url_for(RESOURCES, node_id=local_file.node.osf_id, provider=local_file.provider, file_id=parent_osf_id)
-        file = open(local_file.path, 'rb')
-        resp_json = yield from self.make_request(files_url, method="PUT", params=params, data=file, get_json=True)
+        with open(local_file.path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            progress = progress or TransferProgress(local_file.name, size, 'uploading')
+            resp_json = None
+            if self.resumable_uploads and size >= RESUMABLE_UPLOAD_MIN_SIZE:
+                resp_json = yield from self._resumable_upload(files_url, params, file, size, progress)
+            if resp_json is None:
+                resp_json = yield from self.make_request(
+                    files_url,
+                    method="PUT",
+                    params=params,
+                    data=read_chunks(file, UPLOAD_CHUNK_SIZE, size, progress),
+                    headers={'Content-Length': str(size)},
+                    get_json=True
+                )
         AlertHandler.info(local_file.name, AlertHandler.UPLOAD)
 
         return RemoteFile(resp_json['data'])
 
+    @asyncio.coroutine
+    def _resumable_upload(self, files_url, params, file, size, progress):
+        """
+        Upload file in a resumable session. A chunk whose connection breaks is sent again from the last byte the
+        server has, up to UPLOAD_MAX_RESUMES times.
+        :return: the json of the uploaded file, or None if the server does not offer resumable uploads.
+        """
+        resp = yield from self.make_request(
+            files_url,
+            method='POST',
+            params=dict(params, kind='file', uploadType=RESUMABLE),
+            headers={'X-Upload-Content-Length': str(size)},
+            expects=(CREATED, BAD_REQUEST, NOT_FOUND, METHOD_NOT_ALLOWED)
+        )
+        yield from resp.release()
+        session_url = resp.headers.get('Location') if resp.status == CREATED else None
+        if session_url is None:
+            logging.info('resumable uploads are not supported by {}. uploading in one request'.format(files_url))
+            self.resumable_uploads = False
+            return None
+
+        offset = 0
+        resumes = 0
+        while True:
+            file.seek(offset)
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            try:
+                resp = yield from self.make_request(
+                    session_url,
+                    method='PUT',
+                    data=chunk,
+                    headers={'Content-Range': content_range(offset, len(chunk), size)},
+                    expects=(OK, CREATED, RESUME_INCOMPLETE)
+                )
+            except REQUEST_ERRORS:
+                resumes += 1
+                if resumes > UPLOAD_MAX_RESUMES:
+                    raise
+                # an empty chunk asks how far the upload got.
+                resp = yield from self.make_request(
+                    session_url,
+                    method='PUT',
+                    headers={'Content-Range': content_range(0, 0, size)},
+                    expects=(OK, CREATED, RESUME_INCOMPLETE)
+                )
+            if resp.status != RESUME_INCOMPLETE:
+                body = yield from resp.read()
+                progress.update(size)
+                return json.loads(body.decode('utf-8'))
+            offset = received_bytes(resp.headers.get('Range'))
+            yield from resp.release()
+            progress.update(offset)
 
     @asyncio.coroutine
     def rename_remote_file(self, local_file, remote_file):
@@ -168,7 +381,8 @@ class OSFQuery(object):
         }
 
         resp = yield from self.make_request(url, method="POST", data=json.dumps(data))
-        resp.close()
+        # read the rest of the answer, so the connection goes back to the pool instead of being dropped.
+        yield from resp.release()
 
         remote.name = local.name
         return remote
@@ -206,7 +420,7 @@ class OSFQuery(object):
         }
 
         resp = yield from self.make_request(url, method="POST", data=json.dumps(data))
-        resp.close()
+        yield from resp.release()
 
         local_file_folder.locally_moved = False
 
@@ -247,49 +461,131 @@ class OSFQuery(object):
         assert isinstance(remote_file_folder, RemoteFile) or isinstance(remote_file_folder, RemoteFolder)
         url = remote_file_folder.delete_url
         resp = yield from self.make_request(url, method='DELETE')
-        resp.close()
+        yield from resp.release()
 
     @asyncio.coroutine
-    def make_request(self, url, method=None,params=None, expects=None, get_json=False, timeout=180, data=None):
+    def make_request(self, url, method=None,params=None, expects=None, get_json=False, timeout=HTTP_REQUEST_TIMEOUT, data=None, headers=None):
         if method is None:
             method = 'GET'
-        try:
-            response = yield from asyncio.wait_for(
-                self.request_session.request(
-                    url=url,
-                    method=method.upper(),
-                    params=params,
-                    data=data
-                ),
-                timeout
-            )
-        except (aiohttp.errors.ClientTimeoutError, aiohttp.errors.ClientConnectionError, concurrent.futures._base.TimeoutError):
-            # internally, if a timeout occurs, aiohttp tries up to 3 times. thus we already technically have retries in.
-            AlertHandler.warn("Bad Internet Connection")
-            raise
-        except aiohttp.errors.BadHttpMessage:
 
-            raise
-        except aiohttp.errors.HttpMethodNotAllowed:
+        # concurrent requests for the same json page share one request and one parsed answer.
+        if method.upper() == 'GET' and get_json and not (params or expects or data or headers):
+            return (yield from self.transport.single_flight.do(
+                (self.headers['Cookie'], url),
+                lambda: self._make_request(url, method, get_json=True, timeout=timeout)
+            ))
+        return (yield from self._make_request(url, method, params, expects, get_json, timeout, data, headers))
+
+    @asyncio.coroutine
+    def _make_request(self, url, method, params=None, expects=None, get_json=False, timeout=HTTP_REQUEST_TIMEOUT, data=None, headers=None):
+        # only plain json GETs are cached. their url alone identifies the page.
+        conditional = self.validator_cache is not None and method.upper() == 'GET' and get_json and not params
+        if conditional:
+            headers = dict(headers or {}, **self.validator_cache.headers_for(url))
+
+        response = yield from self._send(url, method.upper(), params, data, headers, timeout)
 
-            raise
 
+        if conditional and response.status == NOT_MODIFIED:
+            self.stats.count_request(method, url, 0)
+            response.close()
+            cached_json = self.validator_cache.cached_json(url)
+            if cached_json is not None:
+                return cached_json
+            # the cached page disappeared between sending the request and getting the answer. ask again.
+            self.validator_cache.forget(url)
+            return (yield from self._make_request(url, method, expects=expects, get_json=get_json, timeout=timeout))
 
         if expects:
             if response.status not in expects:
                 raise aiohttp.errors.BadStatusLine(response.status)
         elif 400 <= response.status < 600:
             content = yield from response.read()
+            self.stats.count_request(method, url, len(content))
             error_message = '[status code: {}]:: {} @url '.format(str(response.status),str(content), str(url))
             logging.error(error_message)
             raise aiohttp.errors.HttpBadRequest(error_message)
 
         if get_json:
-            json_response = yield from response.json()
+            body = yield from response.read()
+            self.stats.count_request(method, url, len(body))
+            json_response = json.loads(body.decode('utf-8'))
+            if conditional:
+                self.validator_cache.store(url, response.headers, json_response)
             return json_response
+        # the body is read by the caller. count what the server says it will send.
+        self.stats.count_request(method, url, int(response.headers.get('Content-Length', 0)))
         return response
 
 
+    @asyncio.coroutine
+    def _send(self, url, method, params, data, headers, timeout):
+        """
+        Send a request and return the response, retrying as described in retry.py.
+        Every attempt first waits for the host's rate limiter. A throttled request (see rate_limit.py) is sent
+        again once the host's pause is over, without counting as a failed attempt.
+        :raises ServerUnavailable: if the host's circuit is open. it is a ClientConnectionError.
+        """
+        breaker = self.transport.breaker_for(url)
+        limiter = self.transport.limiter_for(url)
+        can_resend = not is_stream(data)
+        can_retry = self.retry_policy.can_retry(method, data)
+        attempt = 0
+        throttled = 0
+        while True:
+            breaker.check()
+            with self.stats.timed(RATE_LIMIT):
+                yield from limiter.acquire()
+            try:
+                response = yield from asyncio.wait_for(
+                    self.request_session.request(
+                        url=url,
+                        method=method,
+                        params=params,
+                        data=data,
+                        headers=headers
+                    ),
+                    timeout,
+                    loop=self._loop
+                )
+            except REQUEST_ERRORS:
+                attempt += 1
+                breaker.record_failure()
+                if not can_retry or attempt >= self.retry_policy.max_attempts or breaker.is_open:
+                    AlertHandler.warn("Bad Internet Connection")
+                    raise
+            else:
+                if is_throttled(response):
+                    self._record_throttled(response, breaker, limiter)
+                    throttled += 1
+                    if not can_resend or throttled > RATE_LIMIT_MAX_THROTTLED_RETRIES or breaker.is_open:
+                        return response
+                    yield from response.release()
+                    continue
+                if response.status not in RETRY_STATUSES:
+                    if is_success(response.status):
+                        breaker.record_success()
+                    return response
+                attempt += 1
+                breaker.record_failure()
+                if not can_retry or attempt >= self.retry_policy.max_attempts or breaker.is_open:
+                    return response
+                yield from response.release()
+
+            delay = self.retry_policy.delay(attempt)
+            logging.info('retrying {} {} in {:.1f} seconds'.format(method, url, delay))
+            self.stats.count_retry()
+            yield from asyncio.sleep(delay, loop=self._loop)
+
+    def _record_throttled(self, response, breaker, limiter):
+        """Hold the requests to the host of a throttled response for as long as it asks."""
+        # a 429 comes from a host that is up and wants fewer requests. a 503 is an outage, even when the host says
+        # when to come back, and counts against its circuit.
+        if response.status == SERVICE_UNAVAILABLE:
+            breaker.record_failure()
+        limiter.pause(retry_after_seconds(response.headers))
+        self.stats.count_throttled()
+
     def close(self):
-        self.request_session.close()
+        self.transport.release_session(self.request_session)
 
@@ -0,0 +1,241 @@
+"""
+Dry run of a poll. Walks the remote tree and the local db the same way Poll does and lists every operation a
+real poll would perform, without queueing PollingEvents or changing anything in the db or on the osf.
+Useful for estimating bandwidth and duration before syncing a large project. The plan also carries the request
+counts and listing/reconciliation timings of the walk, so they can be measured apart from transfer time.
+"""
+import asyncio
+import collections
+import os
+
+import osfoffline.alerts as AlertHandler
+from osfoffline.polling_osf_manager.api_url_builder import api_url_for, USERS, NODES
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.traversal import TraversalEngine, CONNECTION_ERRORS, listing_failure
+from osfoffline.polling_osf_manager.reconciliation import (
+    CreateLocal, CreateRemote, DeleteLocal, DeleteRemote
+)
+from osfoffline.polling_osf_manager.instrumentation import CycleStats, RECONCILIATION
+from osfoffline.polling_osf_manager.remote_objects import RemoteFile
+from osfoffline.settings import POLL_MAX_CONCURRENCY
+
+
+class PlannedOperation(object):
+    CREATE_LOCAL_FOLDER = 'create_local_folder'
+    DOWNLOAD = 'download'
+    RENAME_LOCAL = 'rename_local'
+    DELETE_LOCAL = 'delete_local'
+    CREATE_REMOTE_FOLDER = 'create_remote_folder'
+    UPLOAD = 'upload'
+    RENAME_REMOTE = 'rename_remote'
+    MOVE_REMOTE = 'move_remote'
+    DELETE_REMOTE = 'delete_remote'
+
+    __slots__ = ('action', 'path', 'size', 'new_path')
+
+    def __init__(self, action, path, size=0, new_path=None):
+        self.action = action
+        self.path = path
+        self.size = size or 0
+        self.new_path = new_path
+
+    def as_dict(self):
+        return {'action': self.action, 'path': self.path, 'size': self.size, 'new_path': self.new_path}
+
+    def __repr__(self):
+        return "<PlannedOperation({}, path={}, size={}, new_path={})>".format(
+            self.action, self.path, self.size, self.new_path
+        )
+
+
+class SyncPlan(object):
+    def __init__(self, operations, stats):
+        self.operations = operations
+        # CycleStats record of the walk that produced the plan
+        self.stats = stats
+
+    @property
+    def download_bytes(self):
+        return sum(op.size for op in self.operations if op.action == PlannedOperation.DOWNLOAD)
+
+    @property
+    def upload_bytes(self):
+        return sum(op.size for op in self.operations if op.action == PlannedOperation.UPLOAD)
+
+    def summary(self):
+        return {
+            'operations': dict(collections.Counter(op.action for op in self.operations)),
+            'download_bytes': self.download_bytes,
+            'upload_bytes': self.upload_bytes,
+            'requests': self.stats['total_requests'],
+            'phase_seconds': self.stats['phase_seconds'],
+        }
+
+
+class SyncPlanner(object):
+    def __init__(self, poll):
+        """
+        :param poll: the Poll whose decisions are being planned. only its read only helpers are used.
+        """
+        self.poll = poll
+        self.stats = CycleStats()
+        # not conditional, since replies to conditional requests are cached in the db
+        self.osf_query = OSFQuery(
+            loop=poll._loop, oauth_token=poll.user.oauth_token, conditional_requests=False, stats=self.stats
+        )
+        self.traversal = TraversalEngine(loop=poll._loop, max_concurrency=POLL_MAX_CONCURRENCY)
+        self.operations = []
+
+    @asyncio.coroutine
+    def plan(self, remote_user_id, guids):
+        """
+        :param remote_user_id: osf id of the user
+        :param guids: guids of the top level nodes to plan for. they do not have to be in the sync list.
+        :return: SyncPlan
+        """
+        self.stats.reset()
+        self.operations = []
+        try:
+            url = api_url_for(USERS, related_type=NODES, user_id=remote_user_id)
+            remote_top_level_nodes = yield from self.osf_query.get_top_level_nodes(url)
+            diffs = self._reconcile(self.poll.node_reconciler, self.poll.user.top_level_nodes, remote_top_level_nodes)
+            for diff in diffs:
+                if diff.remote and diff.remote.id in guids:
+                    self.traversal.push(self._plan_node, diff.local, diff.remote, parent_path=self.poll.user.osf_local_folder_path)
+            yield from self.traversal.run()
+        finally:
+            self.osf_query.close()
+        return SyncPlan(self.operations, self.stats.as_record())
+
+    def _reconcile(self, reconciler, local_list, remote_list):
+        with self.stats.timed(RECONCILIATION):
+            return reconciler.reconcile(local_list, remote_list)
+
+    def _listing_succeeded(self, listing, remote_node):
+        # not Poll._listing_succeeded, which counts the failure as an error of the poll's walk
+        warning = listing_failure(listing, remote_node)
+        if warning is not None:
+            AlertHandler.warn(warning)
+            return False
+        return True
+
+    def _add(self, action, path, size=0, new_path=None):
+        self.operations.append(PlannedOperation(action, path, size, new_path))
+
+    @asyncio.coroutine
+    def _plan_node(self, local_node, remote_node, parent_path):
+        if local_node is None:
+            path = os.path.join(parent_path, remote_node.name)
+            self._add(PlannedOperation.CREATE_LOCAL_FOLDER, path)
+        elif remote_node is None:
+            self._add(PlannedOperation.DELETE_LOCAL, local_node.path)
+            return
+        else:
+            path = local_node.path
+            if local_node.title != remote_node.name:
+                new_path = os.path.join(os.path.dirname(path), remote_node.name)
+                self._add(PlannedOperation.RENAME_LOCAL, path, new_path=new_path)
+                path = new_path
+
+        remote_node_files, remote_children = yield from asyncio.gather(
+            self.osf_query.get_child_files(remote_node),
+            self.osf_query.get_child_nodes(remote_node),
+            loop=self.poll._loop,
+            return_exceptions=True
+        )
+
+        if self._listing_succeeded(remote_node_files, remote_node):
+            for node_file in remote_node_files:
+                if node_file.name == 'osfstorage':
+                    remote_top_level_file_folders = yield from self.osf_query.get_child_files(node_file)
+                    local_top_level_file_folders = local_node.top_level_file_folders if local_node else []
+                    diffs = self._reconcile(self.poll.file_folder_reconciler, local_top_level_file_folders, remote_top_level_file_folders)
+                    for diff in diffs:
+                        self.traversal.push(self._plan_file_folder, diff, parent_path=path)
+
+        if self._listing_succeeded(remote_children, remote_node):
+            local_children = local_node.child_nodes if local_node else []
+            for diff in self._reconcile(self.poll.node_reconciler, local_children, remote_children):
+                self.traversal.push(self._plan_node, diff.local, diff.remote, parent_path=os.path.join(path, 'Components'))
+
+    @asyncio.coroutine
+    def _plan_file_folder(self, diff, parent_path):
+        """Plan a file or folder the way Poll._check_file_folder checks it, and plan the children of its folders."""
+        local, remote = diff.local, diff.remote
+
+        if isinstance(diff, CreateLocal):
+            path = yield from self._plan_create_local(remote, parent_path)
+        elif isinstance(diff, (CreateRemote, DeleteRemote, DeleteLocal)):
+            self._plan_one_sided(diff)
+            return
+        else:
+            path = yield from self._plan_modify(local, remote, parent_path)
+        # files, and items that are left alone, have no children to plan
+        if path is None:
+            return
+
+        try:
+            remote_children = yield from self.osf_query.get_child_files(remote)
+        except CONNECTION_ERRORS:
+            AlertHandler.warn('Bad Internet Connection')
+            return
+        local_children = local.files if local is not None else []
+        for child_diff in self._reconcile(self.poll.file_folder_reconciler, local_children, remote_children):
+            self.traversal.push(self._plan_file_folder, child_diff, parent_path=path)
+
+    @asyncio.coroutine
+    def _plan_create_local(self, remote, parent_path):
+        """:return: the path of the folder to be created, or None"""
+        if (yield from self.poll.is_locally_moved(remote)):
+            return None
+        path = os.path.join(parent_path, remote.name)
+        if isinstance(remote, RemoteFile):
+            self._add(PlannedOperation.DOWNLOAD, path, size=remote.size)
+            return None
+        self._add(PlannedOperation.CREATE_LOCAL_FOLDER, path)
+        return path
+
+    def _plan_one_sided(self, diff):
+        """Items that are only local or only remote, except the ones to be created locally."""
+        local, remote = diff.local, diff.remote
+        if isinstance(diff, CreateRemote):
+            if not local.is_provider:
+                self._plan_upload(local)
+        elif isinstance(diff, DeleteRemote):
+            if remote is not None:
+                self._add(PlannedOperation.DELETE_REMOTE, local.path)
+        elif local.locally_moved:
+            self._add(PlannedOperation.MOVE_REMOTE, local.path)
+        else:
+            self._add(PlannedOperation.DELETE_LOCAL, local.path)
+
+    @asyncio.coroutine
+    def _plan_modify(self, local, remote, parent_path):
+        """:return: the path of the folder after its rename, or None for a file"""
+        if local.locally_created:
+            raise ValueError('newly created local file_folder was already on server')
+        path = local.path
+        if local.name != remote.name:
+            new_path = os.path.join(parent_path, remote.name)
+            if local.locally_renamed:
+                self._add(PlannedOperation.RENAME_REMOTE, path, new_path=os.path.join(parent_path, local.name))
+            else:
+                self._add(PlannedOperation.RENAME_LOCAL, path, new_path=new_path)
+                path = new_path
+        if not local.is_file:
+            return path
+        if local.size != remote.size:
+            if (yield from self.poll.local_is_newer(local, remote)):
+                self._add(PlannedOperation.UPLOAD, path, size=local.size)
+            elif (yield from self.poll.remote_is_newer(local, remote)):
+                self._add(PlannedOperation.DOWNLOAD, path, size=remote.size)
+        return None
+
+    def _plan_upload(self, local):
+        """A locally created folder is uploaded along with everything in it."""
+        if local.is_file:
+            self._add(PlannedOperation.UPLOAD, local.path, size=local.size)
+            return
+        self._add(PlannedOperation.CREATE_REMOTE_FOLDER, local.path)
+        for child in local.files:
+            self._plan_upload(child)
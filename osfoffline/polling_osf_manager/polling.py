@@ -1,26 +1,40 @@
 __author__ = 'himanshu'
 import json
 import os
+import time
 import asyncio
 import shutil
-import concurrent
+import functools
 import pytz
 import aiohttp
 import logging
+import posixpath
 from osfoffline.database_manager.models import User, Node, File, Base
 from osfoffline.database_manager.db import session
-from osfoffline.database_manager.utils import save
+from osfoffline.database_manager.utils import get_unit_of_work
 from osfoffline.polling_osf_manager.api_url_builder import api_url_for, USERS, NODES
 from osfoffline.polling_osf_manager.osf_query import OSFQuery
 from osfoffline.polling_osf_manager.remote_objects import RemoteObject, RemoteNode, RemoteFile, RemoteFolder,RemoteFileFolder
 from osfoffline.polling_osf_manager.polling_event_queue import PollingEventQueue
 from osfoffline.polling_osf_manager.polling_events import CreateFile,CreateFolder,RenameFile,RenameFolder, DeleteFile,DeleteFolder,UpdateFile
+from osfoffline.polling_osf_manager.traversal import TraversalEngine, CONNECTION_ERRORS, listing_failure
+from osfoffline.polling_osf_manager.reconciliation import (
+    Reconciler, CreateLocal, CreateRemote, DeleteLocal, DeleteRemote
+)
+from osfoffline.polling_osf_manager.scheduler import PollScheduler
+from osfoffline.polling_osf_manager.planner import SyncPlanner
+from osfoffline.polling_osf_manager.instrumentation import CycleStats, RECONCILIATION, DB_COMMIT
+from osfoffline.settings import (
+    POLL_MAX_CONCURRENCY, POLL_FULL_WALK_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF_FACTOR,
+    POLL_MAX_REQUESTS_PER_CYCLE, POLL_MAX_SECONDS_PER_CYCLE, POLL_CHANGE_FEED, POLL_CHANGE_FEED_MAX_LOGS
+)
 import iso8601
 import osfoffline.alerts as AlertHandler
 from osfoffline.exceptions.item_exceptions import InvalidItemType
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy import or_
 
-RECHECK_TIME = 5  # seconds
+RECHECK_TIME = 5  # seconds. how often to look for projects that are due to be checked
 
 
 class Poll(object):
@@ -32,8 +46,34 @@ class Poll(object):
         self.user = user
 
         self._loop = loop
-        self.osf_query = OSFQuery(loop=self._loop, oauth_token=self.user.oauth_token)
-        self.polling_event_queue = PollingEventQueue(loop=self._loop)
+        self.stats = CycleStats()
+        self.osf_query = OSFQuery(loop=self._loop, oauth_token=self.user.oauth_token, stats=self.stats)
+        self.polling_event_queue = PollingEventQueue(loop=self._loop, stats=self.stats)
+        # saves are committed in batches. see database_manager/utils.py
+        self.unit_of_work = get_unit_of_work(self._loop)
+        self.traversal = TraversalEngine(loop=self._loop, max_concurrency=POLL_MAX_CONCURRENCY)
+        self.node_reconciler = Reconciler(get_id=self.get_id, get_local_name=lambda node: node.title)
+        self.file_folder_reconciler = Reconciler(get_id=self.get_id)
+        self.scheduler = PollScheduler(
+            min_interval=POLL_MIN_INTERVAL,
+            max_interval=POLL_MAX_INTERVAL,
+            backoff_factor=POLL_BACKOFF_FACTOR
+        )
+
+        # nodes whose remote date_modified has not changed are skipped, except during a full walk.
+        self._full_walk = True
+        self._last_full_walk = None
+        # [(local node, remote date_modified)] for nodes that were walked during the current walk
+        self._walked_nodes = []
+        # [(local node, (date of its newest log entry, ids of the entries at that date))]
+        # for nodes whose changes were synced during the current walk
+        self._log_cursors = []
+
+        # a walk that does not fit in one cycle is continued from the traversal frontier next cycle.
+        # project guid -> whether there were changes to sync, for the projects in the current walk
+        self._walk_projects = {}
+        self._walk_started = None
+        self._walk_errors = 0
 
 
     def stop(self):
@@ -63,13 +103,16 @@ class Poll(object):
 
         url = api_url_for(USERS, user_id=self.user.osf_id)
         logging.info(url)
+        attempt = 0
         while self._keep_running:
             try:
                 resp = yield from self.osf_query.make_request(url, get_json=True)
                 future.set_result(resp['data'])
                 break
-            except (concurrent.futures._base.TimeoutError, aiohttp.errors.ClientTimeoutError):
-                AlertHandler.warn("Bad Internet Connection")
+            except CONNECTION_ERRORS:
+                # make_request already retried and warned. wait longer every time the osf is still unreachable.
+                attempt += 1
+                yield from asyncio.sleep(self.osf_query.retry_policy.delay(attempt), loop=self._loop)
 
     def get_id(self, item):
         """
@@ -96,67 +139,6 @@ class Poll(object):
         else:
             raise InvalidItemType
 
-    def make_local_remote_tuple_list(self, local_list, remote_list):
-        """
-        Create a list of tuples where the local and remote representation of the node/file are grouped together.
-        This allows us to determine differences between the local and remote versions and perform appropriate functions
-        on them. This tuple list is the backbone behind the polling scheme in this file.
-
-        Notably, the connection between the local and remote is made in differing manners depending on whether
-        the input is a node or file. Each input is given an id, as determined by the get function above.
-        These id's are then matched to create a tuple. If an id has no match, it is matched with None.
-
-
-        :param local_list: list of local node or file sql alchemy objects
-        :param remote_list: list of dicts from the osf v2 api representing nodes or files
-        :return: list of tuples with the left being the local version of node or file and
-                 the right being the remote version. aka. [ (local, remote),... ]
-        """
-        assert None not in local_list
-        assert None not in remote_list
-
-        combined_list = local_list + remote_list
-        sorted_combined_list = sorted(combined_list, key=self.get_id)
-
-        local_remote_tuple_list = []
-        i = 0
-        while i < len(sorted_combined_list):
-
-
-            both_exist = i + 1 < len(sorted_combined_list) and \
-                self.get_id(sorted_combined_list[i]) == \
-                self.get_id(sorted_combined_list[i + 1])
-            if both_exist:
-
-                # (local, remote)
-                if isinstance(sorted_combined_list[i], RemoteObject):  # remote
-                    new_tuple = (sorted_combined_list[i + 1], sorted_combined_list[i])
-                elif isinstance(sorted_combined_list[i], Base):  # local
-                    new_tuple = (sorted_combined_list[i], sorted_combined_list[i + 1])
-                else:
-                    raise TypeError('invalid type: {}'.format(type(sorted_combined_list[i])))
-
-                # add an extra 1 because both values should be added to tuple list
-                i += 1
-            elif isinstance(sorted_combined_list[i], RemoteObject):
-
-                new_tuple = (None, sorted_combined_list[i])
-
-            else:
-
-                new_tuple = (sorted_combined_list[i], None)
-
-            local_remote_tuple_list.append(new_tuple)
-            i += 1
-
-        for local, remote in local_remote_tuple_list:
-            assert isinstance(local, Base) or local is None
-            assert isinstance(remote, RemoteObject) or remote is None
-            if isinstance(local, Base) and isinstance(remote, dict):
-                assert local.osf_id == remote.id
-
-        return local_remote_tuple_list
-
     # Check
 
     @asyncio.coroutine
@@ -172,45 +154,144 @@ class Poll(object):
         all_remote_nodes_url = api_url_for(USERS, related_type=NODES, user_id=remote_user_id)
         while self._keep_running:
 
-            # get remote top level nodes
-            try:
-                remote_top_level_nodes = yield from self.osf_query.get_top_level_nodes(all_remote_nodes_url)
-            except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-                # NOTE: can't work with partial list! That would suggest that nodes were created online.
-                AlertHandler.warn("Bad Internet Connection")
-                # waits till the end of a sleep to stop. thus can make numerous smaller sleeps
-                for i in range(RECHECK_TIME):
-                    yield from asyncio.sleep(1)
-                continue
+            session.refresh(self.user)
+            sync_list = self.user.guid_for_top_level_nodes_to_sync
+            logging.info('sync list is: {}'.format(sync_list))
+
+            cycle_start = time.monotonic()
+            due_projects = self._due_projects(sync_list, cycle_start)
+
+            if due_projects or self.traversal.pending:
+                logging.info('checking projects: {}'.format(due_projects))
+                self.stats.reset()
+                self.stats.info.update(
+                    projects=len(due_projects),
+                    full_walk=self._full_walk,
+                    resumed=self.traversal.pending > 0
+                )
+                try:
+                    yield from self._check_projects(all_remote_nodes_url, due_projects, cycle_start)
+                except CONNECTION_ERRORS:
+                    # NOTE: can't work with partial list! That would suggest that nodes were created online.
+                    AlertHandler.warn("Bad Internet Connection")
+                    self.stats.info['failed'] = True
+                self.stats.info['traversal_errors'] = self.traversal.errors
+                self.stats.info['pending'] = self.traversal.pending
+                self.stats.info['hosts'] = self.osf_query.transport.host_states()
+                self.stats.emit()
 
+            # waits till the end of a sleep to stop. thus can make numerous smaller sleeps
+            for i in range(RECHECK_TIME):
+                yield from asyncio.sleep(1)
 
-            # get local top level nodes
-            local_top_level_nodes = self.user.top_level_nodes
+    def _due_projects(self, sync_list, cycle_start):
+        """The projects of the sync list to walk this cycle. Also decides whether this cycle starts a full walk."""
+        # a walk that is continued keeps the kind it started with
+        if not self._walk_projects:
+            self._full_walk = self._last_full_walk is None or cycle_start - self._last_full_walk >= POLL_FULL_WALK_INTERVAL
+        # projects that are still being walked are not started again
+        if self._full_walk:
+            return [guid for guid in sync_list if guid not in self._walk_projects]
+        return [
+            guid for guid in sync_list
+            if guid not in self._walk_projects and
+            (self.scheduler.is_due(guid) or self._project_has_local_changes(guid))
+        ]
 
-            local_remote_top_level_nodes = self.make_local_remote_tuple_list(local_top_level_nodes, remote_top_level_nodes)
+    @asyncio.coroutine
+    def plan(self, remote_user, guids=None):
+        """
+        Work out what a poll would do, without doing any of it.
+        :param remote_user: remote user dict, as returned by get_remote_user
+        :param guids: top level nodes to plan for. defaults to the sync list.
+        :return: SyncPlan
+        """
+        if guids is None:
+            guids = self.user.guid_for_top_level_nodes_to_sync
+        planner = SyncPlanner(self)
+        return (yield from planner.plan(remote_user['id'], guids))
 
-            session.refresh(self.user)
-            sync_list = self.user.guid_for_top_level_nodes_to_sync
-            for local, remote in local_remote_top_level_nodes:
-                logging.info('sync list is: {}'.format(sync_list))
-                if remote and remote.id in sync_list:
-                    try:
-                        yield from self.check_node(local, remote, local_parent_node=None)
-                    except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-                        AlertHandler.warn('Bad Internet Connection')
+    @asyncio.coroutine
+    def _check_projects(self, all_remote_nodes_url, due_projects, cycle_start):
+        """
+        Walk the due projects, and continue the walk left over from the last cycle.
+        Once the cycle has used up its request or time budget no new nodes or folders are started.
+        The rest of the walk stays on the traversal frontier and is continued next cycle.
+        The events found so far are run at the end of every cycle, so local changes never wait for a whole walk.
+        """
+        if not self._walk_projects:
+            self._walk_started = cycle_start
+            self._walk_errors = 0
+            self._walked_nodes = []
+            self._log_cursors = []
 
-            yield from self.polling_event_queue.run()
+        if due_projects:
+            # get remote top level nodes
+            remote_top_level_nodes = yield from self.osf_query.get_top_level_nodes(all_remote_nodes_url)
 
-            AlertHandler.up_to_date()
-            logging.info('---------SHOULD HAVE ALL OSF FILES---------')
+            # get local top level nodes
+            local_top_level_nodes = self.user.top_level_nodes
 
+            top_level_node_diffs = self._reconcile(self.node_reconciler, local_top_level_nodes, remote_top_level_nodes)
+
+            # project guid -> whether there were changes to sync before the walk started
+            for guid in due_projects:
+                self._walk_projects[guid] = False
+            for diff in top_level_node_diffs:
+                if diff.remote and diff.remote.id in due_projects:
+                    self._walk_projects[diff.remote.id] = self._project_changed(diff.local, diff.remote)
+                    if self._can_use_change_feed(diff.local, diff.remote):
+                        self.traversal.push(self.check_node_changes, diff.local, diff.remote)
+                    else:
+                        self.traversal.push(self.check_node, diff.local, diff.remote, local_parent_node=None)
+
+        # siblings are checked concurrently. returns once the whole tree has been walked or the budget is spent.
+        yield from self.traversal.run(should_stop=lambda: self._cycle_budget_spent(cycle_start))
+        self._walk_errors += self.traversal.errors
+        self._commit()
+
+        if self.traversal.pending:
+            logging.info('cycle budget spent. {} nodes/folders left to check next cycle'.format(self.traversal.pending))
+        else:
+            self._finish_walk()
 
+        yield from self.polling_event_queue.run()
+        self._commit()
 
-            # waits till the end of a sleep to stop. thus can make numerous smaller sleeps
-            for i in range(RECHECK_TIME):
-                yield from asyncio.sleep(1)
+        if not self.traversal.pending:
+            AlertHandler.up_to_date()
+            logging.info('---------SHOULD HAVE ALL OSF FILES---------')
 
+    def _cycle_budget_spent(self, cycle_start):
+        if POLL_MAX_REQUESTS_PER_CYCLE is not None and \
+                sum(self.stats.requests.values()) >= POLL_MAX_REQUESTS_PER_CYCLE:
+            return True
+        if POLL_MAX_SECONDS_PER_CYCLE is not None and time.monotonic() - cycle_start >= POLL_MAX_SECONDS_PER_CYCLE:
+            return True
+        return False
+
+    def _finish_walk(self):
+        # projects whose walk failed stay due.
+        if not self._walk_errors:
+            for guid, changed in self._walk_projects.items():
+                self.scheduler.record(guid, changed)
+        self._record_walked_nodes(self._walk_started)
+        self._walk_projects = {}
+
+    def _project_changed(self, local_node, remote_node):
+        """
+        The osf updates the date_modified of a node whenever something in it changes.
+        A project also counts as changed if there are local changes in it that still need to be sent to the osf.
+        """
+        if local_node is None or local_node.remote_date_modified is None:
+            return True
+        if local_node.remote_date_modified != self._as_naive_utc(remote_node.last_modified):
+            return True
+        return self._has_local_changes(local_node)
 
+    def _project_has_local_changes(self, guid):
+        local_node = session.query(Node).filter(Node.osf_id == guid).first()
+        return local_node is not None and self._has_local_changes(local_node)
 
     @asyncio.coroutine
     def check_node(self, local_node, remote_node, local_parent_node):
@@ -241,47 +322,66 @@ class Poll(object):
         elif local_node is not None and remote_node is not None:
             if local_node.title != remote_node.name:
                 yield from self.modify_local_node(local_node, remote_node)
+            elif self._can_skip_node(local_node, remote_node):
+                logging.info('node {} has not changed since it was last checked. skipping.'.format(local_node.title))
+                return
+
+        yield from self._check_node_listings(local_node, remote_node)
+
+    @asyncio.coroutine
+    def _check_node_listings(self, local_node, remote_node):
+        """List the files and the child nodes of a node that exists locally and on the osf, and check them."""
+        log_cursor = None
+        if self._needs_log_cursor(local_node, remote_node):
+            # read before listing, so that changes made while the node is walked are found in the log next cycle
+            log_cursor = yield from self.osf_query.get_log_cursor(remote_node.id)
+
+        # the file listing and the child node listing do not depend on each other. get them at the same time.
+        remote_node_files, remote_children = yield from asyncio.gather(
+            self.osf_query.get_child_files(remote_node),
+            self.osf_query.get_child_nodes(remote_node),
+            loop=self._loop,
+            return_exceptions=True
+        )
 
         # handle file_folders for node
-        try:
-            yield from self.check_file_folder(local_node, remote_node)
-        except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-            AlertHandler.warn('Bad Internet Connection')
+        files_listed = False
+        if self._listing_succeeded(remote_node_files, remote_node):
+            files_listed = yield from self.check_file_folder(local_node, remote_node, remote_node_files)
 
         # ensure that local node has Components folder
         self._ensure_components_folder(local_node)
 
-        # recursively handle node's children
-        try:
-            remote_children = yield from self.osf_query.get_child_nodes(remote_node)
-        except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-            AlertHandler.warn('Bad Internet Connection')
+        # handle node's children. they are checked concurrently by the traversal engine.
+        if not self._listing_succeeded(remote_children, remote_node):
             return
+        # the node only counts as walked once both of its listings arrived
+        if files_listed:
+            self._walked_nodes.append((local_node, self._as_naive_utc(remote_node.last_modified)))
+            if log_cursor is not None:
+                self._log_cursors.append((local_node, (self._as_naive_utc(log_cursor[0]), log_cursor[1])))
 
-        local_remote_nodes = self.make_local_remote_tuple_list(local_node.child_nodes, remote_children)
-        for local, remote in local_remote_nodes:
-            try:
-                yield from self.check_node(local, remote, local_parent_node=local_node)
-            except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-                AlertHandler.warn('Bad Internet Connection')
+        for diff in self._reconcile(self.node_reconciler, local_node.child_nodes, remote_children):
+            self.traversal.push(self.check_node, diff.local, diff.remote, local_parent_node=local_node)
+
+    def _needs_log_cursor(self, local_node, remote_node):
+        """
+        Whether the log cursor of a node is read before it is listed. The osf updates the date_modified of a node
+        with every log entry, so the cursor of a node whose date_modified did not change since its last walk is current.
+        """
+        if not POLL_CHANGE_FEED:
+            return False
+        return (
+            local_node.log_cursor is None or
+            local_node.remote_date_modified != self._as_naive_utc(remote_node.last_modified)
+        )
 
     @asyncio.coroutine
-    def check_file_folder(self, local_node, remote_node):
+    def check_file_folder(self, local_node, remote_node, remote_node_files):
+        """Check the top level files and folders of a node. returns whether they could be listed."""
         logging.info('checking file_folder')
-        #todo: probably can put this step into get_child_files for nodes.
         #fixme: doesnt handle multiple providers right now...
 
-        try:
-            remote_node_files = yield from self.osf_query.get_child_files(remote_node)
-
-        except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-            AlertHandler.warn('Bad Internet Connection')
-            return
-        except aiohttp.errors.HttpBadRequest:
-            AlertHandler.warn('could not access files for node {}. Node might have been deleted.'.format(remote_node.name))
-            return
-
-
         assert len(remote_node_files) >= 1
         for node_file in remote_node_files:
             if node_file.name ==  'osfstorage':
@@ -290,56 +390,296 @@ class Poll(object):
 
 
         try:
-            remote_node_top_level_file_folders = yield from self.osf_query.get_child_files(osfstorage_folder)
-        except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-            AlertHandler.warn('Bad Internet Connection')
-            return
+            yield from self._reconcile_pages(
+                self.file_folder_reconciler,
+                local_node.top_level_file_folders,
+                self.osf_query.iter_child_files(osfstorage_folder),
+                lambda diff: self.traversal.push(
+                    self._check_file_folder,
+                    diff,
+                    local_parent_file_folder=None,
+                    local_node=local_node
+                )
+            )
+        except CONNECTION_ERRORS:
+            self._listing_failed('Bad Internet Connection')
+            return False
         except aiohttp.errors.HttpBadRequest:
-            AlertHandler.warn('could not access files for node {}. Node might have been deleted.'.format(remote_node.name))
+            self._listing_failed('could not access files for node {}. Node might have been deleted.'.format(remote_node.name))
+            return False
+        return True
+
+    def _can_use_change_feed(self, local_node, remote_node):
+        return (
+            POLL_CHANGE_FEED and
+            not self._full_walk and
+            local_node is not None and
+            remote_node is not None and
+            local_node.title == remote_node.name
+        )
+
+    @asyncio.coroutine
+    def check_node_changes(self, local_node, remote_node):
+        """
+        Find the remote changes of a project in the logs of its nodes instead of walking its whole tree.
+        Only the folders that new log entries mention, and the folders with local changes, are listed again.
+        The project is walked instead if one of its nodes has no log cursor, has more than POLL_CHANGE_FEED_MAX_LOGS
+        new log entries, or has new log entries that are not about its files and folders (e.g. a new component).
+        """
+        logging.info('checking node changes')
+        assert isinstance(local_node, Node)
+        assert isinstance(remote_node, RemoteNode)
+
+        nodes = self._node_and_descendants(local_node)
+        if any(node.osf_id is None or node.log_cursor is None for node in nodes):
+            yield from self.check_node(local_node, remote_node, local_parent_node=None)
             return
 
-        local_remote_files = self.make_local_remote_tuple_list(
-            local_node.top_level_file_folders,
-            remote_node_top_level_file_folders
+        # one log listing per node, all at the same time. usually a single page each.
+        new_logs = yield from asyncio.gather(
+            *[
+                self.osf_query.get_node_logs(
+                    node.osf_id,
+                    since=node.log_cursor.replace(tzinfo=pytz.utc),
+                    since_ids=node.log_cursor_ids or [],
+                    max_logs=POLL_CHANGE_FEED_MAX_LOGS
+                )
+                for node in nodes
+            ],
+            loop=self._loop
         )
 
-        for local, remote in local_remote_files:
-            try:
-                yield from self._check_file_folder(
-                    local,
-                    remote,
-                    local_parent_file_folder=None,
-                    local_node=local_node
+        if not all(self._can_follow_logs(logs) for logs in new_logs):
+            yield from self.check_node(local_node, remote_node, local_parent_node=None)
+            return
+
+        for node, logs in zip(nodes, new_logs):
+            if logs:
+                self._log_cursors.append((node, self._advance_log_cursor(node, logs)))
+            for folder in self._folders_to_recheck(node, logs):
+                self.traversal.push(self._recheck_folder, node, folder)
+
+        self._walked_nodes.append((local_node, self._as_naive_utc(remote_node.last_modified)))
+
+    def _node_and_descendants(self, local_node):
+        nodes = []
+        nodes_to_visit = [local_node]
+        while nodes_to_visit:
+            node = nodes_to_visit.pop()
+            nodes.append(node)
+            nodes_to_visit.extend(node.child_nodes)
+        return nodes
+
+    def _can_follow_logs(self, logs):
+        """Whether the changes in the new log entries of a node can be synced by listing only the folders they name."""
+        return logs is not None and all(log.describes_file_folders or log.name in log.IGNORED_ACTIONS for log in logs)
+
+    def _advance_log_cursor(self, local_node, logs):
+        """The log cursor of a node once its new log entries (newest first) are synced. see OSFQuery.get_node_logs"""
+        newest_date = self._as_naive_utc(logs[0].date)
+        ids = [log.id for log in logs if self._as_naive_utc(log.date) == newest_date]
+        # entries that were added at the same moment as the old cursor do not replace the ones it already has
+        if newest_date == local_node.log_cursor:
+            ids += local_node.log_cursor_ids or []
+        return newest_date, ids
+
+    def _folders_to_recheck(self, local_node, logs):
+        """The folders of a node that new log entries name, and the ones with local changes, each once."""
+        # local folder id (None for the top of the node) -> local folder
+        folders = {}
+        for log in logs:
+            if log.describes_file_folders:
+                for materialized_path in log.materialized_paths:
+                    folder = self._find_local_parent_folder(local_node, materialized_path)
+                    folders[folder.id if folder else None] = folder
+        for folder in self._locally_changed_folders(local_node):
+            folders[folder.id if folder else None] = folder
+        return list(folders.values())
+
+    @asyncio.coroutine
+    def _recheck_folder(self, local_node, local_folder):
+        """List a single folder again and check its children, without going into the child folders it already had."""
+        local_children = local_folder.files if local_folder else local_node.top_level_file_folders
+        try:
+            yield from self._reconcile_pages(
+                self.file_folder_reconciler,
+                local_children,
+                self.osf_query.iter_local_folder_children(local_node, local_folder),
+                lambda diff: self.traversal.push(
+                    self._check_file_folder,
+                    diff,
+                    local_parent_file_folder=local_folder,
+                    local_node=local_node,
+                    recurse=False
                 )
-            except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-                AlertHandler.warn('Bad Internet Connection')
+            )
+        except aiohttp.errors.HttpBadRequest:
+            # the folder is gone. its parent is checked as well, and deletes it.
+            self._walk_errors += 1
+            logging.warning('could not list folder {}. it might have been deleted.'.format(
+                local_folder.name if local_folder else local_node.title
+            ))
+
+    def _find_local_parent_folder(self, local_node, materialized_path):
+        """
+        The local folder that holds the file or folder at materialized_path on the osf ('/a/b/file.txt' -> folder b).
+        If part of the way is not there locally yet, the deepest local folder on the way is returned. Checking it
+        creates the rest. None stands for the top of the node.
+        """
+        parent_path = posixpath.dirname(materialized_path.rstrip('/'))
+        folder = None
+        children = local_node.top_level_file_folders
+        for name in [segment for segment in parent_path.split('/') if segment]:
+            matches = [child for child in children if child.is_folder and child.name == name]
+            if not matches:
+                break
+            folder = matches[0]
+            children = folder.files
+        return folder
+
+    def _locally_changed_folders(self, local_node):
+        """The folders of a node that hold local changes to be sent to the osf. None stands for the top of the node.
+        New local folders can not be listed on the osf yet, so the nearest folder above them that can is used.
+        """
+        changed_file_folders = session.query(File).filter(
+            File.node_id == local_node.id,
+            or_(File.locally_created, File.locally_deleted, File.locally_renamed, File.locally_moved)
+        ).all()
+        folders = []
+        for file_folder in changed_file_folders:
+            folder = file_folder.parent
+            while folder is not None and folder.osf_id is None:
+                folder = folder.parent
+            folders.append(folder)
+        return folders
+
+    def _can_skip_node(self, local_node, remote_node):
+        """
+        A node whose date_modified on the osf is the same as when it was last walked has no new remote changes.
+        Its files and child nodes do not need to be listed unless this is a full walk or there are local
+        changes below it that still need to be sent to the osf.
+        """
+        if self._full_walk or local_node.remote_date_modified is None:
+            return False
+        if local_node.remote_date_modified != self._as_naive_utc(remote_node.last_modified):
+            return False
+        return not self._has_local_changes(local_node)
+
+    def _has_local_changes(self, local_node):
+        node_ids = [node.id for node in self._node_and_descendants(local_node)]
+        changed_file_folder = session.query(File).filter(
+            File.node_id.in_(node_ids),
+            or_(File.locally_created, File.locally_deleted, File.locally_renamed, File.locally_moved)
+        ).first()
+        return changed_file_folder is not None
+
+    def _record_walked_nodes(self, walk_start):
+        """Remember the remote date_modified of every node walked during the walk that just finished.
+        If any part of the walk failed, nothing is recorded so that the nodes are walked again next cycle.
+        """
+        if self._walk_errors:
+            self._walked_nodes = []
+            self._log_cursors = []
+            return
+        for local_node, remote_date_modified in self._walked_nodes:
+            local_node.remote_date_modified = remote_date_modified
+        for local_node, (log_cursor, log_cursor_ids) in self._log_cursors:
+            local_node.log_cursor = log_cursor
+            local_node.log_cursor_ids = log_cursor_ids
+        if self._walked_nodes or self._log_cursors:
+            self._save(*[local_node for local_node, _ in self._walked_nodes + self._log_cursors])
+        if self._full_walk:
+            self._last_full_walk = walk_start
+        self._walked_nodes = []
+        self._log_cursors = []
+
+    def _reconcile(self, reconciler, local_list, remote_list):
+        with self.stats.timed(RECONCILIATION):
+            return reconciler.reconcile(local_list, remote_list)
+
+    @asyncio.coroutine
+    def _reconcile_pages(self, reconciler, local_list, pages, handle_diff):
+        """
+        Reconcile with a remote listing while it is still arriving. handle_diff is called with every Diff as soon
+        as its page is in, while the next page downloads. Diffs for local items that are missing remotely come last,
+        and only if the whole listing arrived.
+        :param pages: PageIterator
+        """
+        reconciliation = reconciler.start(local_list)
+        try:
+            while True:
+                page = yield from pages.next_page()
+                if page is None:
+                    break
+                with self.stats.timed(RECONCILIATION):
+                    diffs = reconciliation.feed(page)
+                for diff in diffs:
+                    handle_diff(diff)
+        finally:
+            pages.close()
+
+        with self.stats.timed(RECONCILIATION):
+            diffs = reconciliation.finish()
+        for diff in diffs:
+            handle_diff(diff)
+
+    def _save(self, *items_to_save):
+        with self.stats.timed(DB_COMMIT):
+            self.unit_of_work.save(*items_to_save)
+
+    def _commit(self):
+        with self.stats.timed(DB_COMMIT):
+            self.unit_of_work.flush()
+
+    def _listing_failed(self, warning):
+        """
+        Listings that fail are not raised to the traversal engine, so they are counted as errors of the walk here.
+        A walk with errors records nothing, and its projects stay due. see _finish_walk
+        """
+        self._walk_errors += 1
+        AlertHandler.warn(warning)
+
+    def _as_naive_utc(self, remote_time):
+        return remote_time.astimezone(pytz.utc).replace(tzinfo=None)
+
+    def _listing_succeeded(self, listing, remote_node):
+        """Check the result of a listing that was gathered with return_exceptions=True. see listing_failure"""
+        warning = listing_failure(listing, remote_node)
+        if warning is not None:
+            self._listing_failed(warning)
+            return False
+        return True
 
     @asyncio.coroutine
     def _check_file_folder(self,
-                           local_file_folder,
-                           remote_file_folder,
+                           diff,
                            local_parent_file_folder,
-                           local_node):
+                           local_node,
+                           recurse=True):
         """
-        VARIOUS STATES (update as neccessary):
-        (None, None) -> Error                                     --
-        (None, remote) ->
+        VARIOUS STATES (update as neccessary). see reconciliation.py for how they are determined:
+        CreateLocal ->
             if locally moved -> do nothing
             else -> create local
-        (local.create, None) -> create remote                     --
-        (local.create, remote) -> ERROR                           --
-        (local.delete, None) -> ERROR                             --
-        (local.delete, remote) - > delete remote                  --
-        (local, None) ->
+        CreateRemote -> create remote
+        DeleteRemote ->
+            if remote is None -> forget local. it was never on the server
+            else -> delete remote
+        DeleteLocal ->
             if locally moved -> move
             else -> delete local
-        (local, remote) -> check modifications                    --
+        Rename, Modify, Unchanged ->
+            if locally created -> ERROR
+            else -> check modifications
 
+        :param recurse: whether to also check the children of a folder that already existed locally.
+            the children of a folder that was just created locally are always checked.
         """
 
-        assert local_file_folder or remote_file_folder  # both shouldnt be None.
+        local_file_folder = diff.local
+        remote_file_folder = diff.remote
         logging.info('checking file_folder internal')
-        if local_file_folder is None:
+        if isinstance(diff, CreateLocal):
             locally_moved = yield from self.is_locally_moved(remote_file_folder)
             if locally_moved:
                 return
@@ -349,21 +689,19 @@ class Poll(object):
                     local_parent_file_folder,
                     local_node
                 )
-        elif local_file_folder.locally_created and remote_file_folder is None:
+        elif isinstance(diff, CreateRemote):
             if not local_file_folder.is_provider:
                 remote_file_folder = yield from self.create_remote_file_folder(local_file_folder, local_node)
             return
-        elif local_file_folder.locally_created and remote_file_folder is not None:
-            raise ValueError('newly created local file_folder was already on server')
-        elif local_file_folder.locally_deleted and remote_file_folder is None:
+        elif isinstance(diff, DeleteRemote) and remote_file_folder is None:
             session.delete(local_file_folder)
-            save(session)
+            self._save()
             logging.warning('local file_folder is to be deleted, however, it was never on the server.')
             return
-        elif local_file_folder.locally_deleted and remote_file_folder is not None:
+        elif isinstance(diff, DeleteRemote):
             yield from self.delete_remote_file_folder(local_file_folder, remote_file_folder)
             return
-        elif local_file_folder is not None and remote_file_folder is None:
+        elif isinstance(diff, DeleteLocal):
             if local_file_folder.locally_moved:
                 # todo: we are ignoring return value for now because to start going down new tree would require
                 # todo: us to have the new node. we currently use the head node instead of dynamically determining
@@ -374,42 +712,38 @@ class Poll(object):
                 logging.warning('delete_local_file_folder called on {}'.format(local_file_folder.name))
                 yield from self.delete_local_file_folder(local_file_folder)
                 return
-        elif local_file_folder is not None and remote_file_folder is not None:
+        elif local_file_folder.locally_created:
+            raise ValueError('newly created local file_folder was already on server')
+        else:
             possibly_new_remote_file_folder = yield from self.modify_file_folder_logic(local_file_folder, remote_file_folder)
             # if we do not need to modify things, remote file folder and local file folder does not change
             # we do not need to get a new local file folder because it is updated internally by the db
             if possibly_new_remote_file_folder:
                 remote_file_folder = possibly_new_remote_file_folder
-        else:
-            raise ValueError('in some weird state. figure it out.')
 
         assert local_file_folder is not None
         assert remote_file_folder is not None
 
-        # recursively handle folder's children
-        if local_file_folder.is_folder:
+        # handle folder's children. they are checked concurrently by the traversal engine.
+        if local_file_folder.is_folder and (recurse or isinstance(diff, CreateLocal)):
 
             try:
-                remote_children = yield from self.osf_query.get_child_files(remote_file_folder)
-            except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-                AlertHandler.warn('Bad Internet Connection')
-                return
-
-            local_remote_file_folders = self.make_local_remote_tuple_list(local_file_folder.files, remote_children)
-
-
-            for local, remote in local_remote_file_folders:
-                try:
-                    yield from self._check_file_folder(
-                        local,
-                        remote,
+                yield from self._reconcile_pages(
+                    self.file_folder_reconciler,
+                    local_file_folder.files,
+                    self.osf_query.iter_child_files(remote_file_folder),
+                    lambda child_diff: self.traversal.push(
+                        self._check_file_folder,
+                        child_diff,
                         local_parent_file_folder=local_file_folder,
                         local_node=local_node
                     )
-                except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError, concurrent.futures._base.TimeoutError):
-                    AlertHandler.warn('Bad Internet Connection')
-
-                # if we are unable to get children, then we do not try to get and manipulate children
+                )
+            except CONNECTION_ERRORS:
+                # if we are unable to get children, then we do not try to get and manipulate children.
+                # children on the pages that did arrive are checked already. missing ones are not deleted.
+                self._listing_failed('Bad Internet Connection')
+                return
 
 
 
@@ -429,7 +763,7 @@ class Poll(object):
             user=self.user,
             parent=local_parent_node
         )
-        save(session, new_node)
+        self._save(new_node)
 
 
         if local_parent_node:
@@ -464,14 +798,16 @@ class Poll(object):
             parent=local_parent_folder,
             node=local_node
         )
-        save(session, new_file_folder)
+        self._save(new_file_folder)
 
 
         if type == File.FILE:
             event = CreateFile(
                 path=new_file_folder.path,
                 download_url=remote_file_folder.download_url,
-                osf_query=self.osf_query
+                osf_query=self.osf_query,
+                size=remote_file_folder.size,
+                on_downloaded=functools.partial(self._downloaded, new_file_folder)
             )
             self.polling_event_queue.put(event)
         elif type == File.FOLDER:
@@ -504,7 +840,7 @@ class Poll(object):
         local_file_folder.osf_path = remote_file_folder.id
         local_file_folder.locally_created = False
 
-        save(session,local_file_folder)
+        self._save(local_file_folder)
 
         return remote_file_folder
 
@@ -521,7 +857,7 @@ class Poll(object):
 
         local_node.category = remote_node.category
 
-        save(session, local_node)
+        self._save(local_node)
 
 
 
@@ -566,7 +902,7 @@ class Poll(object):
         # update model
         local_file_folder.name = remote_file_folder.name
 
-        save(session, local_file_folder)
+        self._save(local_file_folder)
 
         if local_file_folder.is_folder:
             self.polling_event_queue.put(RenameFolder(old_path, local_file_folder.path))
@@ -587,10 +923,17 @@ class Poll(object):
         event = UpdateFile(
                 path=local_file.path,
                 download_url=remote_file.download_url,
-                osf_query=self.osf_query
+                osf_query=self.osf_query,
+                size=remote_file.size,
+                on_downloaded=functools.partial(self._downloaded, local_file)
         )
         self.polling_event_queue.put(event)
 
+    def _downloaded(self, local_file, md5):
+        # the event handler drops the echo of the download, so the hash it would have taken is stored here.
+        local_file.hash = md5
+        self._save(local_file)
+
     @asyncio.coroutine
     def update_remote_file(self, local_file, remote_file):
         logging.info('update_remote_file')
@@ -649,7 +992,7 @@ class Poll(object):
 
         # delete model
         session.delete(local_node)
-        save(session)
+        self._save()
 
         self.polling_event_queue.put(DeleteFolder(path))
 
@@ -662,7 +1005,7 @@ class Poll(object):
         is_folder = local_file_folder.is_folder
         # delete model
         session.delete(local_file_folder)
-        save(session)
+        self._save()
 
 
         # delete from local
@@ -687,7 +1030,7 @@ class Poll(object):
 
         local_file_folder.deleted = False
         session.delete(local_file_folder)
-        save(session)
+        self._save()
 
 
     @asyncio.coroutine
@@ -1,6 +1,7 @@
 __author__ = 'himanshu'
 import asyncio
 import os
+from osfoffline.polling_osf_manager.instrumentation import CycleStats, EVENT_EXECUTION
 
 """
 # todo: FIGURE OUT HOW TO MAKE POLLINGEVENTQUEUE WORK WITH LOOP PROPERLY....
@@ -8,14 +9,17 @@ https://github.com/python/asyncio/blob/f4111812967fded634637936225205f29035a449/
 """
 
 class PollingEventQueue(object):
-    def __init__(self, loop):
+    def __init__(self, loop, stats=None):
         self._queue = asyncio.Queue(loop=loop)
+        self.stats = stats or CycleStats()
 
     @asyncio.coroutine
     def run(self):
         while not self._queue.empty():
             event = self._queue.get_nowait()
-            yield from event.run()
+            with self.stats.timed(EVENT_EXECUTION):
+                yield from event.run()
+            self.stats.count_event(event)
 
     def put(self, event):
         self._queue.put_nowait(event)
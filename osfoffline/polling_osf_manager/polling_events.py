@@ -1,11 +1,34 @@
 from osfoffline.utils.path import ProperPath
-from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.osf_query import OSFQuery, OK
 import os
 import shutil
 import asyncio
 import osfoffline.alerts as AlertHandler
 import logging
 import aiohttp
+import concurrent.futures
+import hashlib
+from osfoffline.polling_osf_manager.transfers import (
+    part_path, part_size, content_range_start, content_range_total, resume_validator, saved_resume_validator,
+    save_resume_validator, remove_staging_files, DownloadSink, get_io_executor, create_preallocated, file_md5,
+    PARTIAL_CONTENT, RANGE_NOT_SATISFIABLE
+)
+from osfoffline.filesystem_manager.echo_suppression import (
+    echo_registry, fingerprint, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED
+)
+from osfoffline.exceptions.poll_exceptions import RangesNotSupported
+from osfoffline.settings import (
+    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MAX_RESUMES, DOWNLOAD_PREALLOCATE, PARALLEL_DOWNLOAD_MIN_SIZE,
+    PARALLEL_DOWNLOAD_CONNECTIONS, PARALLEL_DOWNLOAD_MIN_RANGE
+)
+
+DOWNLOAD_INTERRUPTED_ERRORS = (
+    aiohttp.errors.ClientConnectionError,
+    aiohttp.errors.ClientTimeoutError,
+    aiohttp.errors.DisconnectedError,
+    concurrent.futures.TimeoutError
+)
+
 class PollingEvent(object):
     def __init__(self, path):
         assert isinstance(path, str)
@@ -25,15 +48,20 @@ class CreateFolder(PollingEvent):
         # create local node folder on filesystem
         if not os.path.exists(self.path.full_path):
             AlertHandler.info(self.path.name, AlertHandler.DOWNLOAD)
+            echo_registry.expect(EVENT_TYPE_CREATED, self.path.full_path)
             os.makedirs(self.path.full_path)
 
 
 class CreateFile(PollingEvent):
-    def __init__(self, path, download_url, osf_query):
+    def __init__(self, path, download_url, osf_query, size=None, on_downloaded=None):
         super().__init__(path)
         self.path = ProperPath(path, is_dir=False)
         self.osf_query = osf_query
         self.download_url = download_url
+        # size of the remote file, if known. large files are downloaded in several ranges at once.
+        self.size = size
+        # called with the md5 of the file once it is in place. the event handler does not hash downloads.
+        self.on_downloaded = on_downloaded
         assert self.path
         assert isinstance(self.osf_query, OSFQuery)
         assert isinstance(self.download_url, str)
@@ -41,7 +69,9 @@ class CreateFile(PollingEvent):
     @asyncio.coroutine
     def run(self):
         AlertHandler.info(self.path.name, AlertHandler.DOWNLOAD)
-        yield from _download_file(self.path, self.download_url, self.osf_query)
+        md5 = yield from _download_file(self.path, self.download_url, self.osf_query, self.size)
+        if self.on_downloaded is not None:
+            self.on_downloaded(md5)
 
 
 class RenameFolder(PollingEvent):
@@ -74,14 +104,20 @@ class RenameFile(PollingEvent):
     @asyncio.coroutine
     def run(self):
         AlertHandler.info(self.new_path.name, AlertHandler.MODIFYING)
+        # an unfinished download of the old path is of no use to the new one
+        remove_staging_files(self.old_path.full_path)
         yield from _rename(self.old_path, self.new_path)
 
 class UpdateFile(PollingEvent):
-    def __init__(self, path, download_url, osf_query):
+    def __init__(self, path, download_url, osf_query, size=None, on_downloaded=None):
         super().__init__(path)
         self.path = ProperPath(path, is_dir=False)
         self.osf_query = osf_query
         self.download_url = download_url
+        # size of the remote file, if known. large files are downloaded in several ranges at once.
+        self.size = size
+        # called with the md5 of the file once it is in place. the event handler does not hash downloads.
+        self.on_downloaded = on_downloaded
         assert isinstance(self.osf_query, OSFQuery)
         assert isinstance(self.download_url, str)
 
@@ -89,7 +125,9 @@ class UpdateFile(PollingEvent):
     def run(self):
         AlertHandler.info(self.path.name, AlertHandler.MODIFYING)
         try:
-            yield from _download_file(self.path, self.download_url, self.osf_query)
+            md5 = yield from _download_file(self.path, self.download_url, self.osf_query, self.size)
+            if self.on_downloaded is not None:
+                self.on_downloaded(md5)
         except Exception as e:
             logging.warning(e)
             # AlertHandler.warn("File unable to be updated online")
@@ -106,6 +144,7 @@ class DeleteFolder(PollingEvent):
         # todo: is windows supported??
         if shutil.rmtree.avoids_symlink_attacks:
             AlertHandler.info(self.path.name, AlertHandler.DELETING)
+            echo_registry.expect(EVENT_TYPE_DELETED, self.path.full_path, tree=True)
             shutil.rmtree(
                 self.path.full_path,
                 onerror=lambda a, b, c: logging.warning('local node not deleted because not exists.')
@@ -121,36 +160,215 @@ class DeleteFile(PollingEvent):
 
     @asyncio.coroutine
     def run(self):
+        remove_staging_files(self.path.full_path)
         try:
+            echo_registry.expect(EVENT_TYPE_DELETED, self.path.full_path)
             os.remove(self.path.full_path)
         except FileNotFoundError:
             logging.warning('file not deleted because does not exist on local filesystem. inside delete_local_file_folder (2)')
 
 @asyncio.coroutine
-def _download_file(path, url, osf_query):
+def _download_file(path, url, osf_query, size=None):
+    """
+    Download into the staging file of path, then move it over path. A download that breaks off is continued
+    where it stopped, up to DOWNLOAD_MAX_RESUMES times. If it still fails, the staging file is kept, so a later
+    download of the same version of the file continues from there.
+    Files of at least PARALLEL_DOWNLOAD_MIN_SIZE bytes are fetched in several ranges at once, see _download_ranges.
+    :return: the md5 of the downloaded file
+    """
     assert isinstance(path, ProperPath)
     assert isinstance(url, str)
     try:
-        resp = yield from osf_query.make_request(url)
-    except (aiohttp.errors.ClientConnectionError, aiohttp.errors.ClientTimeoutError):
-        AlertHandler.warn("Bad Internet Connection")
-        logging.warning("Bad Internet Connection")
-        raise
+        md5 = yield from _download_with_resumes(path, url, osf_query, size)
     except (aiohttp.errors.HttpMethodNotAllowed, aiohttp.errors.BadHttpMessage):
         AlertHandler.warn("Do not have access to file.")
         logging.warning("Do not have access to file.")
         raise
+    part = part_path(path.full_path)
+    if md5 is None:
+        # the file was not written in one piece from its start
+        md5 = yield from osf_query.loop.run_in_executor(get_io_executor(), file_md5, part)
+    # moving a file keeps its size and modification time
+    echo_registry.expect_file(path.full_path, fingerprint(part))
+    try:
+        os.replace(part, path.full_path)
+    except OSError:
+        AlertHandler.warn("unable to open file")
+        raise
+    save_resume_validator(path.full_path, None)
+    return md5
+
+
+@asyncio.coroutine
+def _download_with_resumes(path, url, osf_query, size=None):
+    """:return: the md5 of the staging file if it was written in one stream from its start, else None"""
+    parallel = size is not None and size >= PARALLEL_DOWNLOAD_MIN_SIZE and PARALLEL_DOWNLOAD_CONNECTIONS > 1
+    resumes = 0
+    while True:
+        try:
+            if parallel:
+                parallel = yield from _download_ranges_if_supported(path, url, osf_query, size)
+                if parallel:
+                    return None
+            return (yield from _download_to_part(path, url, osf_query, size))
+        except DOWNLOAD_INTERRUPTED_ERRORS:
+            resumes += 1
+            if resumes > DOWNLOAD_MAX_RESUMES:
+                AlertHandler.warn("Bad Internet Connection")
+                logging.warning("Bad Internet Connection")
+                raise
+            logging.info('download of {} broke off. continuing it'.format(path.name))
+
+
+@asyncio.coroutine
+def _download_ranges_if_supported(path, url, osf_query, size):
+    """:return: whether the file was downloaded in ranges. if not, it is to be downloaded in one stream."""
+    try:
+        yield from _download_ranges(path, url, osf_query, size)
+        return True
+    except RangesNotSupported:
+        logging.info('{} is not sent in ranges. downloading it in one stream'.format(path.name))
+        return False
+
+
+@asyncio.coroutine
+def _download_to_part(path, url, osf_query, size=None):
+    """:return: the md5 of the staging file if it was written from its start, else None"""
+    part = part_path(path.full_path)
+    offset = part_size(path.full_path)
+    validator = saved_resume_validator(path.full_path)
+    if offset and validator:
+        resp = yield from osf_query.make_request(
+            url,
+            headers={'Range': 'bytes={}-'.format(offset), 'If-Range': validator},
+            expects=(OK, PARTIAL_CONTENT, RANGE_NOT_SATISFIABLE)
+        )
+        if resp.status == RANGE_NOT_SATISFIABLE:
+            # the staging file is not a prefix of the file. start over.
+            resp.close()
+            remove_staging_files(path.full_path)
+            return (yield from _download_to_part(path, url, osf_query, size))
+    else:
+        resp = yield from osf_query.make_request(url)
+
+    if resp.status == PARTIAL_CONTENT and content_range_start(resp.headers.get('Content-Range')) == offset:
+        sink = DownloadSink(osf_query.loop, part, 'r+b', offset)
+    else:
+        # the whole file is sent, because it changed or because the server ignored the range.
+        sink = DownloadSink(
+            osf_query.loop, part, 'wb', size=size if DOWNLOAD_PREALLOCATE else None, digest=hashlib.md5()
+        )
+    save_resume_validator(path.full_path, resume_validator(resp.headers))
+
     try:
-        with open(path.full_path, 'wb') as fd:
+        try:
+            yield from sink.open()
             while True:
-                chunk = yield from resp.content.read(2048)
+                chunk = yield from resp.content.read(DOWNLOAD_CHUNK_SIZE)
                 if not chunk:
                     break
-                fd.write(chunk)
-        resp.close()
+                yield from sink.write(chunk)
+        finally:
+            resp.close()
+            # what arrived before the connection broke is kept, to continue from.
+            yield from sink.close()
     except OSError:
         AlertHandler.warn("unable to open file")
         raise
+    return sink.digest.hexdigest() if sink.digest is not None else None
+
+
+def _split_ranges(size, num_ranges):
+    """[(first byte, last byte)] of at most num_ranges ranges of about the same length that cover size bytes."""
+    range_size = max(1, -(-size // num_ranges))
+    return [(first, min(first + range_size, size) - 1) for first in range(0, size, range_size)]
+
+
+@asyncio.coroutine
+def _download_ranges(path, url, osf_query, size):
+    """
+    Download a file over up to PARALLEL_DOWNLOAD_CONNECTIONS connections, one range of it each, into a staging file
+    that is preallocated to size. The first range is asked for alone, and the rest with If-Range on the version it
+    came from, so every range is of the same version of the file. A range that breaks off is continued where it
+    stopped, up to DOWNLOAD_MAX_RESUMES times.
+    The staging file is removed if the download fails, since a single stream could not continue it.
+    :raises RangesNotSupported: if the server does not send ranges, the file is not of the given size,
+        or the file changed during the download
+    """
+    part = part_path(path.full_path)
+    num_ranges = min(PARALLEL_DOWNLOAD_CONNECTIONS, -(-size // PARALLEL_DOWNLOAD_MIN_RANGE))
+    ranges = _split_ranges(size, max(1, num_ranges))
+    save_resume_validator(path.full_path, None)
+    yield from osf_query.loop.run_in_executor(get_io_executor(), create_preallocated, part, size)
+    tasks = []
+    try:
+        first_resp = yield from _request_range(url, osf_query, ranges[0], None)
+        validator = resume_validator(first_resp.headers)
+        # without a validator, the other ranges could come from another version of the file.
+        # if the file is not of the size in its listing, the ranges would not cover it.
+        if validator is None or content_range_total(first_resp.headers.get('Content-Range')) != size:
+            first_resp.close()
+            raise RangesNotSupported(url)
+        tasks.append(osf_query.loop.create_task(
+            _download_range(part, url, osf_query, ranges[0], validator, first_resp)
+        ))
+        for byte_range in ranges[1:]:
+            tasks.append(osf_query.loop.create_task(_download_range(part, url, osf_query, byte_range, validator)))
+        yield from asyncio.gather(*tasks, loop=osf_query.loop)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            yield from asyncio.wait(tasks, loop=osf_query.loop)
+        os.remove(part)
+        raise
+
+
+@asyncio.coroutine
+def _request_range(url, osf_query, byte_range, validator):
+    first, last = byte_range
+    headers = {'Range': 'bytes={}-{}'.format(first, last)}
+    if validator:
+        headers['If-Range'] = validator
+    resp = yield from osf_query.make_request(url, headers=headers, expects=(OK, PARTIAL_CONTENT))
+    if resp.status != PARTIAL_CONTENT or content_range_start(resp.headers.get('Content-Range')) != first:
+        resp.close()
+        raise RangesNotSupported(url)
+    return resp
+
+
+@asyncio.coroutine
+def _download_range(part, url, osf_query, byte_range, validator, resp=None):
+    """Write bytes first to last of the file at url to the same place in part, with a sink of its own."""
+    first, last = byte_range
+    resumes = 0
+    sink = DownloadSink(osf_query.loop, part, 'r+b', first)
+    try:
+        yield from sink.open()
+        while first <= last:
+            try:
+                if resp is None:
+                    resp = yield from _request_range(url, osf_query, (first, last), validator)
+                while first <= last:
+                    chunk = yield from resp.content.read(min(DOWNLOAD_CHUNK_SIZE, last - first + 1))
+                    if not chunk:
+                        raise aiohttp.errors.ServerDisconnectedError()
+                    yield from sink.write(chunk)
+                    first += len(chunk)
+            except DOWNLOAD_INTERRUPTED_ERRORS:
+                resumes += 1
+                if resumes > DOWNLOAD_MAX_RESUMES:
+                    raise
+                logging.info('range of {} broke off at byte {}. continuing it'.format(part, first))
+            finally:
+                if resp is not None:
+                    resp.close()
+                    resp = None
+    finally:
+        if resp is not None:
+            resp.close()
+        yield from sink.close()
+
 
 @asyncio.coroutine
 def _rename(old_path, new_path):
@@ -158,6 +376,7 @@ def _rename(old_path, new_path):
     assert isinstance(new_path, ProperPath)
     try:
         AlertHandler.info(new_path.name, AlertHandler.MODIFYING)
+        echo_registry.expect(EVENT_TYPE_MOVED, old_path.full_path, new_path.full_path, tree=old_path.is_dir)
         os.renames(old_path.full_path, new_path.full_path)
     except FileNotFoundError:
         logging.warning('renaming of file/folder failed because file/folder not there')
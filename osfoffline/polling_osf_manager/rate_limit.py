@@ -0,0 +1,113 @@
+"""
+Requests to a host are spread out by a token bucket: RATE_LIMIT_PER_SECOND tokens are added every second, up to
+RATE_LIMIT_BURST, and every request takes one. A large first sync then sends a steady stream of requests instead
+of bursts that get it throttled.
+
+When the host throttles anyway (429, or 503 with a Retry-After header), the bucket is paused for as long as the
+host asks, up to RATE_LIMIT_MAX_PAUSE. Every request to the host waits out the pause, and the throttled request is sent
+again afterwards. A 503 still counts as a failure of the host for its circuit breaker (see retry.py), so an outage
+opens the circuit even if the host sends Retry-After.
+"""
+import asyncio
+import datetime
+import email.utils
+import math
+
+from osfoffline.settings import RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, RATE_LIMIT_DEFAULT_PAUSE, RATE_LIMIT_MAX_PAUSE
+
+TOO_MANY_REQUESTS = 429
+SERVICE_UNAVAILABLE = 503
+
+
+def is_throttled(response):
+    return response.status == TOO_MANY_REQUESTS or (
+        response.status == SERVICE_UNAVAILABLE and 'Retry-After' in response.headers
+    )
+
+
+def retry_after_seconds(headers, default=RATE_LIMIT_DEFAULT_PAUSE, maximum=RATE_LIMIT_MAX_PAUSE):
+    """
+    The Retry-After header in seconds, at most maximum. It is either a number of seconds or an http date.
+    default if the header is missing or invalid.
+    """
+    value = headers.get('Retry-After')
+    seconds = default if value is None else _parse_retry_after(value, default)
+    return min(maximum, max(0, seconds))
+
+
+def _parse_retry_after(value, default):
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        # float() also reads 'inf' and 'nan'
+        return seconds if math.isfinite(seconds) else default
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
+
+class TokenBucket(object):
+    def __init__(self, loop, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST):
+        """
+        :param rate: tokens added per second. None for no limit, so that only pauses are waited for.
+        :param burst: most tokens the bucket holds
+        """
+        assert rate is None or rate > 0
+        self._loop = loop
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = loop.time()
+        self.paused_until = 0
+
+        # number of requests that are waiting for a token right now
+        self.waiting = 0
+        # number of times the host throttled us
+        self.throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Wait until a request may be sent and take a token for it."""
+        self.waiting += 1
+        try:
+            while True:
+                now = self._loop.time()
+                if now < self.paused_until:
+                    yield from asyncio.sleep(self.paused_until - now, loop=self._loop)
+                    continue
+                if self.rate is None:
+                    return
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                yield from asyncio.sleep((1 - self.tokens) / self.rate, loop=self._loop)
+        finally:
+            self.waiting -= 1
+
+    def pause(self, seconds):
+        """Hold every request for seconds. The bucket starts empty after the pause."""
+        now = self._loop.time()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self._updated = self.paused_until
+        self.throttled += 1
+
+    def as_record(self):
+        return {
+            'rate': self.rate,
+            'tokens': self.tokens,
+            'waiting': self.waiting,
+            'paused_for': max(0, self.paused_until - self._loop.time()),
+            'throttled': self.throttled,
+        }
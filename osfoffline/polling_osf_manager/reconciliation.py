@@ -0,0 +1,136 @@
+"""
+Matches the local (db) children of a node/folder with its remote (osf) children and describes each difference
+as a typed Diff record. Matching is a single dictionary-keyed pass over both lists. The remote list can also be
+fed in pages as it arrives (see IncrementalReconciliation).
+
+VARIOUS STATES (update as neccessary):
+(None, remote) -> CreateLocal
+(local.create, None) -> CreateRemote
+(local.delete, None) -> DeleteRemote (there is nothing left to delete on the osf)
+(local.delete, remote) -> DeleteRemote
+(local, None) -> DeleteLocal (the item may also have been moved locally. the poller decides.)
+(local, remote) with differing names -> Rename (the file may also be modified)
+(local, remote) with differing file sizes -> Modify
+(local, remote) -> Unchanged
+"""
+
+
+class Diff(object):
+    """A difference between the local and the remote version of a single node or file_folder."""
+    __slots__ = ('local', 'remote')
+
+    def __init__(self, local, remote):
+        assert (local is not None) or (remote is not None)  # both shouldnt be none.
+        self.local = local
+        self.remote = remote
+
+    def __repr__(self):
+        return "<{}(local={}, remote={})>".format(self.__class__.__name__, self.local, self.remote)
+
+
+class CreateLocal(Diff):
+    __slots__ = ()
+
+
+class CreateRemote(Diff):
+    __slots__ = ()
+
+
+class DeleteLocal(Diff):
+    __slots__ = ()
+
+
+class DeleteRemote(Diff):
+    __slots__ = ()
+
+
+class Rename(Diff):
+    __slots__ = ()
+
+
+class Modify(Diff):
+    __slots__ = ()
+
+
+class Unchanged(Diff):
+    __slots__ = ()
+
+
+def _local_name(local):
+    return local.name
+
+
+class Reconciler(object):
+    def __init__(self, get_id, get_local_name=_local_name):
+        """
+        :param get_id: function that returns the id of a local or remote item. matching items share an id.
+        :param get_local_name: function that returns the name of a local item, compared with remote.name
+        """
+        self.get_id = get_id
+        self.get_local_name = get_local_name
+
+    def reconcile(self, local_list, remote_list):
+        """
+        :param local_list: local node or file sql alchemy objects
+        :param remote_list: RemoteObjects from the osf
+        :return: list of Diff records. one for every item in either list.
+        """
+        reconciliation = self.start(local_list)
+        diffs = reconciliation.feed(remote_list)
+        diffs.extend(reconciliation.finish())
+        return diffs
+
+    def start(self, local_list):
+        """Reconcile with a remote listing that arrives a page at a time. see IncrementalReconciliation."""
+        return IncrementalReconciliation(self, local_list)
+
+    def classify(self, local, remote):
+        if local is None:
+            return CreateLocal(None, remote)
+
+        locally_created = getattr(local, 'locally_created', False)
+        locally_deleted = getattr(local, 'locally_deleted', False)
+
+        if remote is None:
+            if locally_created:
+                return CreateRemote(local, None)
+            elif locally_deleted:
+                return DeleteRemote(local, None)
+            return DeleteLocal(local, None)
+
+        if locally_deleted and not locally_created:
+            return DeleteRemote(local, remote)
+        if self.get_local_name(local) != remote.name:
+            return Rename(local, remote)
+        if getattr(local, 'is_file', False) and getattr(remote, 'size', None) is not None and local.size != remote.size:
+            return Modify(local, remote)
+        return Unchanged(local, remote)
+
+
+class IncrementalReconciliation(object):
+    """
+    Matching of a remote listing that arrives in pages. Every remote item is classified as soon as its page arrives.
+    Local items that are missing remotely are only known once the whole listing has been fed.
+    """
+    def __init__(self, reconciler, local_list):
+        get_id = reconciler.get_id
+        self._get_id = get_id
+        self._classify = reconciler.classify
+        self._local_by_id = {get_id(local): local for local in local_list}
+
+    def feed(self, remote_list):
+        """:return: list of Diff records, one for every item of remote_list"""
+        get_id = self._get_id
+        classify = self._classify
+        pop_local = self._local_by_id.pop
+        return [classify(pop_local(get_id(remote), None), remote) for remote in remote_list]
+
+    def finish(self):
+        """Call once every page has been fed. A listing that failed part way must not be finished, as the local
+        items on the missing pages would be taken for deleted.
+        :return: list of Diff records for the local items that no page had
+        """
+        classify = self._classify
+        diffs = [classify(local, None) for local in self._local_by_id.values()]
+        self._local_by_id = {}
+        return diffs
@@ -9,8 +9,14 @@ Things to validate:
 """
 import iso8601
 
+# RemoteObjects are built for every item of every listing on every poll cycle, so they are kept small:
+# each class only stores the fields that are used, in __slots__, and timestamps are parsed when first read.
+# validate() is no longer called on construction. call it where a malformed response should fail loudly.
+
 
 class RemoteObject(object):
+    __slots__ = ('id', 'name')
+
     def __init__(self, remote_dict):
         assert isinstance(remote_dict, dict)
         assert 'type' in remote_dict
@@ -23,6 +29,8 @@ class RemoteObject(object):
 
 
 class RemoteUser(RemoteObject):
+    __slots__ = ('child_nodes_url',)
+
     def __init__(self, remote_dict):
         super().__init__(remote_dict)
         assert remote_dict['type'] == 'users'
@@ -30,24 +38,36 @@ class RemoteUser(RemoteObject):
         self.name = remote_dict['attributes']['full_name']
         self.child_nodes_url = remote_dict['relationships']['nodes']['links']['related']
 
-        self.validate()
-
 
 class RemoteNode(RemoteObject):
+    # attributes and relationships that are read. listings ask the osf for only these.
+    FIELDS = ('title', 'category', 'date_modified', 'files', 'parent', 'children')
+
+    __slots__ = ('category', 'child_files_url', 'is_top_level', 'child_nodes_url', '_date_modified', '_last_modified')
+
     def __init__(self, remote_dict):
         super().__init__(remote_dict)
         assert remote_dict['type'] == 'nodes'
+        attributes = remote_dict['attributes']
+        relationships = remote_dict['relationships']
         self.id = remote_dict['id']
-        self.name = remote_dict['attributes']['title']
-        self.category = remote_dict['attributes']['category']
-        self.child_files_url = remote_dict['relationships']['files']['links']['related']['href']
-        self.is_top_level = remote_dict['relationships']['parent']['links']['related']['href'] is None
-        self.child_nodes_url = remote_dict['relationships']['children']['links']['related']['href']
+        self.name = attributes['title']
+        self.category = attributes['category']
+        self.child_files_url = relationships['files']['links']['related']['href']
+        self.is_top_level = relationships['parent']['links']['related']['href'] is None
+        self.child_nodes_url = relationships['children']['links']['related']['href']
         # self.num_child_nodes = remote_dict['relationships']['children']['links']['related']['meta']['count']
-        self.last_modified = remote_to_local_datetime(remote_dict['attributes']['date_modified'])
-
-        self.validate()
+        self._date_modified = attributes['date_modified']
+        self._last_modified = None
 
+    @property
+    def last_modified(self):
+        """date_modified as a utc datetime. parsed the first time it is needed.
+            throws iso8601.ParseError. Handle as needed.
+        """
+        if self._last_modified is None:
+            self._last_modified = remote_to_local_datetime(self._date_modified)
+        return self._last_modified
 
     def validate(self):
         super().validate()
@@ -59,20 +79,23 @@ class RemoteNode(RemoteObject):
 
 
 class RemoteFileFolder(RemoteObject):
+    # attributes and relationships that are read, for files and folders. listings ask the osf for only these.
+    FIELDS = ('name', 'kind', 'provider', 'size', 'files')
+
+    __slots__ = ('provider', 'move_url', 'delete_url')
+
     def __init__(self, remote_dict):
         super().__init__(remote_dict)
         assert remote_dict['type'] == 'files'
+        attributes = remote_dict['attributes']
+        links = remote_dict['links']
         self.id = remote_dict['id']
         if '/' in self.id:
             self.id = self.id.split('/')[1]
-        self.name = remote_dict['attributes']['name']
-        self.provider = remote_dict['attributes']['provider']
-        self.move_url = remote_dict['links']['move'] if 'move' in remote_dict['links'] else None
-        self.delete_url = remote_dict['links']['delete'] if 'delete' in remote_dict['links'] else None
-
-
-
-
+        self.name = attributes['name']
+        self.provider = attributes['provider']
+        self.move_url = links.get('move')
+        self.delete_url = links.get('delete')
 
     def validate(self):
         super().validate()
@@ -83,19 +106,20 @@ class RemoteFileFolder(RemoteObject):
 
 
 class RemoteFolder(RemoteFileFolder):
+    __slots__ = ('child_files_url', 'upload_file_url', 'upload_folder_url')
+
     def __init__(self, remote_dict):
 
         super().__init__(remote_dict)
         assert remote_dict['attributes']['kind'] == 'folder'
 
+        links = remote_dict['links']
         self.child_files_url = remote_dict['relationships']['files']['links']['related']['href']
-        self.upload_file_url = remote_dict['links']['upload']
-        self.upload_folder_url = remote_dict['links']['new_folder']
+        self.upload_file_url = links['upload']
+        self.upload_folder_url = links['new_folder']
 
         # self.has_write_privileges = 'POST' in remote_dict['links']['self_methods'] #todo: await decision. can use OPTION
 
-        self.validate()
-
     def validate(self):
         super().validate()
         assert self.child_files_url
@@ -105,21 +129,21 @@ class RemoteFolder(RemoteFileFolder):
 
 
 class RemoteFile(RemoteFileFolder):
+    __slots__ = ('download_url', 'overwrite_url', 'size')
+
     def __init__(self, remote_dict):
         super().__init__(remote_dict)
         assert remote_dict['attributes']['kind'] == 'file'
 
-
-        self.download_url = remote_dict['links']['download']
-        self.overwrite_url = remote_dict['links']['upload']
+        links = remote_dict['links']
+        self.download_url = links['download']
+        self.overwrite_url = links['upload']
         # self.hash = remote_dict['metadata']['extra']['hash']
         # self.rented = remote_dict['metadata']['extra']['rented']
         self.size = remote_dict['attributes']['size']
         # self.last_modified = remote_to_local_datetime(remote_dict['attributes']['date_modified']) #todo: IS THIS ON ACTUAL SERVER YET? Chris said it would be up there soon.
         # self._write_privileges = 'POST' in remote_dict['links']['self_methods']
 
-        self.validate()
-
     # @property
     # def has_write_privileges(self):
     #     # if self.rented:
@@ -136,6 +160,92 @@ class RemoteFile(RemoteFileFolder):
         # assert self.has_write_privileges is not None
 
 
+class RemoteLog(RemoteObject):
+    """An entry of the activity log of a node. name is the action that was logged."""
+    # actions on osfstorage files and folders. params describe them by materialized path ('/folder/file.txt')
+    FILE_ACTIONS = frozenset([
+        'osf_storage_file_added',
+        'osf_storage_file_updated',
+        'osf_storage_file_removed',
+        'osf_storage_folder_created',
+        'addon_file_moved',
+        'addon_file_renamed',
+        'addon_file_copied',
+    ])
+    # actions that do not change anything that is synced
+    IGNORED_ACTIONS = frozenset([
+        'contributor_added',
+        'contributor_removed',
+        'contributors_reordered',
+        'permissions_updated',
+        'made_public',
+        'made_private',
+        'tag_added',
+        'tag_removed',
+        'edit_description',
+        'license_changed',
+        'wiki_updated',
+        'wiki_deleted',
+        'wiki_renamed',
+        'checked_in',
+        'checked_out',
+        'file_tag_added',
+        'file_tag_removed',
+        'view_only_link_added',
+        'view_only_link_removed',
+    ])
+
+    FIELDS = ('action', 'date', 'params')
+
+    __slots__ = ('params', '_date', '_parsed_date')
+
+    def __init__(self, remote_dict):
+        super().__init__(remote_dict)
+        assert remote_dict['type'] == 'logs'
+        attributes = remote_dict['attributes']
+        self.id = remote_dict['id']
+        self.name = attributes['action']
+        self.params = attributes.get('params') or {}
+        self._date = attributes['date']
+        self._parsed_date = None
+
+    @property
+    def date(self):
+        """when the action happened, as a utc datetime. parsed the first time it is needed.
+            throws iso8601.ParseError. Handle as needed.
+        """
+        if self._parsed_date is None:
+            self._parsed_date = remote_to_local_datetime(self._date)
+        return self._parsed_date
+
+    @property
+    def materialized_paths(self):
+        """materialized paths of the files and folders the action was on. folders end with a '/'."""
+        paths = []
+        for key in ('source', 'destination'):
+            if isinstance(self.params.get(key), dict) and self.params[key].get('materialized'):
+                paths.append(self.params[key]['materialized'])
+        if isinstance(self.params.get('path'), str):
+            paths.append(self.params['path'])
+        return paths
+
+    @property
+    def describes_file_folders(self):
+        """Whether the action is on files and folders of a single node, and says which."""
+        if self.name not in self.FILE_ACTIONS or not self.materialized_paths:
+            return False
+        # moves and copies between nodes are left to a walk
+        source = self.params.get('source')
+        destination = self.params.get('destination')
+        if isinstance(source, dict) and isinstance(destination, dict):
+            return source.get('node', {}).get('_id') == destination.get('node', {}).get('_id')
+        return True
+
+    def validate(self):
+        super().validate()
+        assert self.date
+
+
 def dict_to_remote_object(remote_dict):
     assert isinstance(remote_dict, dict)
     if remote_dict['type'] == 'files':
@@ -147,10 +257,34 @@ def dict_to_remote_object(remote_dict):
         return RemoteNode(remote_dict)
     elif remote_dict['type'] == 'users':
         return RemoteUser(remote_dict)
+    elif remote_dict['type'] == 'logs':
+        return RemoteLog(remote_dict)
     else:
         raise TypeError('unable to convert dict {} to RemoteObject'.format(remote_dict))
 
 
+def page_to_remote_objects(remote_dicts):
+    """Convert the 'data' list of one or more listing pages in one pass.
+    Files, folders, nodes and logs, which make up nearly every listing, are built directly.
+    """
+    remote_objects = []
+    append = remote_objects.append
+    for remote_dict in remote_dicts:
+        kind = remote_dict['type']
+        if kind == 'files':
+            if remote_dict['attributes']['kind'] == 'file':
+                append(RemoteFile(remote_dict))
+            else:
+                append(RemoteFolder(remote_dict))
+        elif kind == 'nodes':
+            append(RemoteNode(remote_dict))
+        elif kind == 'logs':
+            append(RemoteLog(remote_dict))
+        else:
+            append(dict_to_remote_object(remote_dict))
+    return remote_objects
+
+
 def remote_to_local_datetime(remote_utc_time_string):
         """convert osf utc time string to a proper datetime (with utc timezone).
             throws iso8601.ParseError. Handle as needed.
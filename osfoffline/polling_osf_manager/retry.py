@@ -0,0 +1,152 @@
+"""
+What OSFQuery.make_request does when a request fails.
+
+A request that times out, cannot connect or gets a 502/503/504 is sent again after a random, exponentially
+growing wait, if sending it twice does no harm: its method is idempotent and its body can be sent again.
+
+Failures are also counted per host. After CIRCUIT_FAILURE_THRESHOLD of them in a row the host's circuit opens.
+While it is open, requests to the host raise ServerUnavailable without being sent, and the host is probed in the
+background with a growing wait between probes. The first successful probe closes the circuit again. An error response
+that is not retried, e.g. a 404, neither counts as a failure nor resets the count.
+"""
+import asyncio
+import inspect
+import logging
+import random
+from urllib.parse import urlsplit
+
+import osfoffline.alerts as AlertHandler
+from osfoffline.exceptions.osf_exceptions import ServerUnavailable
+from osfoffline.settings import (
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_MAX_RESET_TIMEOUT
+)
+
+# rfc 7231 4.2.2
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+# the server or a proxy in front of it is down or overloaded. the request can succeed later.
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+def is_success(status):
+    """Whether a response shows that the host works. Only these reset the failures counted against its circuit."""
+    return 200 <= status < 400
+
+
+def host_of(url):
+    parts = urlsplit(url)
+    return '{}://{}'.format(parts.scheme, parts.netloc)
+
+
+def is_stream(data):
+    """Whether a request body is read as it is sent, from a file or a generator, so it cannot be sent twice."""
+    return hasattr(data, 'read') or inspect.isgenerator(data)
+
+
+class RetryPolicy(object):
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        assert max_attempts >= 1
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def can_retry(method, data=None):
+        """Whether a request can be sent again."""
+        return method.upper() in IDEMPOTENT_METHODS and not is_stream(data)
+
+    def delay(self, attempt):
+        """Seconds to wait before sending attempt number attempt + 1. Full jitter, so clients do not retry in step."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(
+            self,
+            loop,
+            host,
+            probe,
+            failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=CIRCUIT_RESET_TIMEOUT,
+            max_reset_timeout=CIRCUIT_MAX_RESET_TIMEOUT
+    ):
+        """
+        :param probe: coroutine function without arguments. returns whether the host answered.
+        """
+        self._loop = loop
+        self.host = host
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self._next_reset_timeout = reset_timeout
+        self._probe_handle = None
+        self._probe_task = None
+
+    @property
+    def is_open(self):
+        return self.state == self.OPEN
+
+    def check(self):
+        """Raise ServerUnavailable instead of letting a request through while the circuit is open."""
+        if self.is_open:
+            raise ServerUnavailable(self.host)
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if not self.is_open and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        logging.warning('{} failed {} times in a row. holding requests to it'.format(self.host, self.failures))
+        AlertHandler.warn("Bad Internet Connection")
+        self.state = self.OPEN
+        self._next_reset_timeout = self.reset_timeout
+        self._schedule_probe()
+
+    def _close(self):
+        logging.info('{} is reachable again'.format(self.host))
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def _schedule_probe(self):
+        self._probe_handle = self._loop.call_later(self._next_reset_timeout, self._start_probe)
+        self._next_reset_timeout = min(self.max_reset_timeout, self._next_reset_timeout * 2)
+
+    def _start_probe(self):
+        self._probe_handle = None
+        self._probe_task = self._loop.create_task(self._run_probe())
+
+    @asyncio.coroutine
+    def _run_probe(self):
+        try:
+            reachable = yield from self._probe()
+        except Exception:
+            logging.exception('probe of {} failed'.format(self.host))
+            reachable = False
+        self._probe_task = None
+        if reachable:
+            self._close()
+        else:
+            self._schedule_probe()
+
+    def stop(self):
+        """Stop probing. The circuit stays in its current state."""
+        if self._probe_handle is not None:
+            self._probe_handle.cancel()
+            self._probe_handle = None
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def as_record(self):
+        return {'state': self.state, 'failures': self.failures}
@@ -0,0 +1,50 @@
+"""
+Decides when each synced project should be checked again.
+A project that changed is checked again soon. Every check that finds nothing new doubles the wait,
+up to an upper bound, so idle projects stop costing requests while busy ones stay fresh.
+"""
+import time
+
+
+class PollScheduler(object):
+    def __init__(self, min_interval, max_interval, backoff_factor=2, clock=time.monotonic):
+        """
+        :param min_interval: seconds to wait after a check that found changes
+        :param max_interval: upper bound in seconds on the wait after checks that found nothing
+        :param backoff_factor: the wait is multiplied by this after every check that found nothing
+        :param clock: function returning the current time in seconds
+        """
+        assert 0 < min_interval <= max_interval
+        assert backoff_factor >= 1
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self._clock = clock
+
+        self._interval = {}  # project guid -> seconds to wait after its last check
+        self._next_check = {}  # project guid -> time of its next check
+
+    def is_due(self, guid):
+        """Projects that were never checked are due right away."""
+        return guid not in self._next_check or self._next_check[guid] <= self._clock()
+
+    def due(self, guids):
+        return [guid for guid in guids if self.is_due(guid)]
+
+    def record(self, guid, changed):
+        """Schedule the next check of a project that was just checked.
+        :param changed: whether the check found any local or remote changes
+        """
+        if changed or guid not in self._interval:
+            interval = self.min_interval
+        else:
+            interval = min(self._interval[guid] * self.backoff_factor, self.max_interval)
+        self._interval[guid] = interval
+        self._next_check[guid] = self._clock() + interval
+
+    def interval(self, guid):
+        return self._interval.get(guid, self.min_interval)
+
+    def forget(self, guid):
+        self._interval.pop(guid, None)
+        self._next_check.pop(guid, None)
@@ -0,0 +1,45 @@
+"""
+Identical calls that overlap in time share one run. The first caller of a key starts the call, and callers that
+arrive before it finishes wait for the same result instead of starting their own.
+
+A caller that is cancelled stops waiting without cancelling the call for the others. The call is only cancelled
+when no caller is left waiting for it.
+"""
+import asyncio
+
+
+class SingleFlight(object):
+    def __init__(self, loop):
+        self._loop = loop
+        # key -> [task, number of callers waiting for it]
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    @asyncio.coroutine
+    def do(self, key, coroutine_function):
+        """
+        The result of coroutine_function(), shared with every overlapping caller with the same key.
+        The result is the same object for all of them, so they must not modify it.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            task = self._loop.create_task(coroutine_function())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda done: self._forget(key, done))
+        task = call[0]
+        call[1] += 1
+        try:
+            return (yield from asyncio.shield(task, loop=self._loop))
+        except asyncio.CancelledError:
+            if call[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            call[1] -= 1
+
+    def _forget(self, key, task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
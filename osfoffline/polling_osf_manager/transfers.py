@@ -0,0 +1,326 @@
+"""
+Helpers for moving file contents to and from the osf without holding whole files in memory.
+
+Resumable uploads follow the resumable upload protocol of Google Cloud Storage, which a server can offer next to
+the plain waterbutler PUT (the mock osf server does):
+    POST <folder upload url>?kind=file&name=<name>&uploadType=resumable with X-Upload-Content-Length: <size>
+        -> 201 with the url of the upload session in the Location header
+    PUT <session url> with Content-Range: bytes <first>-<last>/<size> and those bytes as body
+        -> 308 while the upload is incomplete, with Range: bytes=0-<last byte received>
+        -> 200/201 with the json of the file once every byte arrived
+    PUT <session url> with Content-Range: bytes */<size> and no body
+        -> the same answers, without sending anything. used to find where to continue after a connection broke.
+
+Downloads are written to a staging file next to the target, named by part_path. The staging file is only moved
+over the target, with an atomic rename, once the whole file arrived. A download that breaks off is continued with a
+Range request, as long as the server vouches with If-Range that the file did not change in the meantime. The If-Range
+value is kept in a file next to the staging file, named by validator_path, so a download can also be continued after
+a restart. Both are removed when the target is deleted or renamed.
+
+Downloads are written by a DownloadSink, which leaves the writes to a pool of I/O threads so a slow disk does not
+hold up the event loop.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import re
+
+from osfoffline.settings import DOWNLOAD_BUFFER_SIZE, DOWNLOAD_BUFFERS, DOWNLOAD_WRITER_THREADS
+
+RESUMABLE = 'resumable'
+RESUME_INCOMPLETE = 308
+PARTIAL_CONTENT = 206
+RANGE_NOT_SATISFIABLE = 416
+
+# suffixes of the staging files of downloads and of their If-Range values. the event handler ignores files that
+# end in them.
+PART_SUFFIX = '.osfoffline.part'
+VALIDATOR_SUFFIX = '.osfoffline.validator'
+
+_io_executor = None
+
+_RANGE_RE = re.compile(r'bytes=0-(\d+)')
+_CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+def read_chunks(file, chunk_size, limit, progress=None):
+    """
+    A generator over the next limit bytes of an open binary file, chunk_size bytes at a time.
+    aiohttp sends a generator of bytes as the body of a request without reading all of it first.
+    """
+    sent = 0
+    while sent < limit:
+        chunk = file.read(min(chunk_size, limit - sent))
+        if not chunk:
+            return
+        yield chunk
+        sent += len(chunk)
+        if progress is not None:
+            progress.update(sent)
+
+
+def received_bytes(range_header):
+    """How many bytes of an upload the server has, from the Range header of a 308."""
+    if not range_header:
+        return 0
+    match = _RANGE_RE.match(range_header)
+    return int(match.group(1)) + 1 if match else 0
+
+
+def content_range(first, num_bytes, total):
+    if num_bytes == 0:
+        return 'bytes */{}'.format(total)
+    return 'bytes {}-{}/{}'.format(first, first + num_bytes - 1, total)
+
+
+def part_path(path):
+    """The staging file of a download to path."""
+    return path + PART_SUFFIX
+
+
+def validator_path(path):
+    """The file that keeps the If-Range value of the version of the file in the staging file of path."""
+    return path + VALIDATOR_SUFFIX
+
+
+def is_part_file(path):
+    return path.endswith((PART_SUFFIX, VALIDATOR_SUFFIX))
+
+
+def part_size(path):
+    """Bytes of a download to path that are already in its staging file."""
+    try:
+        return os.path.getsize(part_path(path))
+    except OSError:
+        return 0
+
+
+def content_range_start(content_range_header):
+    """The first byte of a 206 response, from its Content-Range header. None if the header is missing or invalid."""
+    match = _CONTENT_RANGE_RE.match(content_range_header or '')
+    return int(match.group(1)) if match else None
+
+
+def content_range_total(content_range_header):
+    """The size of the whole file, from the Content-Range header of a 206 response.
+    None if the header is missing or invalid, or the size is not known.
+    """
+    match = _CONTENT_RANGE_RE.match(content_range_header or '')
+    return int(match.group(3)) if match and match.group(3) != '*' else None
+
+
+def resume_validator(headers):
+    """The value for If-Range that makes the server send the rest of this version of a file, and no other."""
+    return headers.get('ETag') or headers.get('Last-Modified')
+
+
+def saved_resume_validator(path):
+    """The If-Range value saved for the staging file of path, or None."""
+    try:
+        with open(validator_path(path)) as fd:
+            return fd.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_resume_validator(path, validator):
+    """Save the If-Range value of the staging file of path. None forgets it."""
+    if validator is None:
+        _remove(validator_path(path))
+        return
+    with open(validator_path(path), 'w') as fd:
+        fd.write(validator)
+
+
+def remove_staging_files(path):
+    """Remove the staging file of a download to path and its If-Range value, if there are any."""
+    _remove(part_path(path))
+    _remove(validator_path(path))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class TransferProgress(object):
+    """Logs how much of a file was transferred, every step percent."""
+    def __init__(self, name, total, action, step=10):
+        self.name = name
+        self.total = total
+        self.action = action
+        self.step = step
+        self.done = 0
+        self._logged_percent = 0
+
+    @property
+    def percent(self):
+        return 100 if not self.total else 100 * self.done // self.total
+
+    def update(self, done):
+        self.done = done
+        percent = self.percent
+        if percent - self._logged_percent >= self.step or (percent == 100 and self._logged_percent < 100):
+            self._logged_percent = percent
+            logging.info('{} {}: {}% of {} bytes'.format(self.action, self.name, percent, self.total))
+
+
+def get_io_executor():
+    """The thread pool that downloads are written to disk in. shared by every download of the process."""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = concurrent.futures.ThreadPoolExecutor(DOWNLOAD_WRITER_THREADS)
+    return _io_executor
+
+
+def preallocate(file, size):
+    """Reserve size bytes on disk for an open file, so writing it does not fragment it or run out of space halfway."""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+            return
+        except OSError:
+            # not supported by the file system
+            pass
+    file.truncate(size)
+
+
+def file_md5(path, block_size=2 ** 20):
+    """The md5 of the file at path, as File.update_hash computes it. blocks, so run it in the io executor."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def create_preallocated(path, size):
+    """Create (or empty) the file at path, with size bytes reserved. blocks, so run it in the io executor."""
+    with open(path, 'wb') as file:
+        preallocate(file, size)
+
+
+class DownloadSink(object):
+    """
+    Writes a download to a file, from offset on, without blocking the event loop.
+    Chunks are copied into buffers of buffer_size bytes, and every full buffer is written by the io executor while
+    the next one fills. The buffers are reused, and there are num_buffers of them, so a download that arrives faster
+    than the disk takes it waits in write() until a buffer was written. The buffers of one sink are written one
+    after another, so the file always holds an unbroken run of the download from offset on.
+
+    With size, the file is preallocated to size bytes when it is opened, and cut back to what was written when it
+    is closed, so a staging file that is closed early can still be continued from its end.
+    With digest, a hashlib hash, every written byte is also hashed by the io executor.
+    """
+    def __init__(self, loop, path, mode='wb', offset=0, size=None, digest=None, buffer_size=DOWNLOAD_BUFFER_SIZE,
+                 num_buffers=DOWNLOAD_BUFFERS, executor=None):
+        self._loop = loop
+        self.path = path
+        self.mode = mode
+        self.offset = offset
+        self.size = size
+        self.digest = digest
+        # bytes that were written to the file
+        self.flushed = 0
+        self._executor = executor or get_io_executor()
+        self._file = None
+        self._error = None
+        self._free_buffers = asyncio.Queue(loop=loop)
+        for _ in range(num_buffers):
+            self._free_buffers.put_nowait(bytearray(buffer_size))
+        self._full_buffers = asyncio.Queue(loop=loop)
+        self._buffer = None
+        self._filled = 0
+        self._writer = None
+
+    @asyncio.coroutine
+    def open(self):
+        self._file = yield from self._loop.run_in_executor(self._executor, self._open)
+        self._writer = self._loop.create_task(self._write_buffers())
+
+    @asyncio.coroutine
+    def write(self, chunk):
+        """Copy chunk into the buffers. waits while every buffer is full and not yet written."""
+        self._raise_error()
+        chunk = memoryview(chunk)
+        while chunk:
+            if self._buffer is None:
+                self._buffer = yield from self._free_buffers.get()
+                self._filled = 0
+            num_bytes = min(len(chunk), len(self._buffer) - self._filled)
+            self._buffer[self._filled:self._filled + num_bytes] = chunk[:num_bytes]
+            self._filled += num_bytes
+            chunk = chunk[num_bytes:]
+            if self._filled == len(self._buffer):
+                self._hand_over()
+
+    @asyncio.coroutine
+    def close(self):
+        """Write what is left in the buffers and close the file. raises the error of a write that failed."""
+        try:
+            if self._writer is not None:
+                if self._buffer is not None and self._filled:
+                    self._hand_over()
+                self._full_buffers.put_nowait((None, 0))
+                yield from asyncio.shield(self._writer, loop=self._loop)
+        finally:
+            if self._file is not None:
+                file, self._file = self._file, None
+                yield from self._loop.run_in_executor(self._executor, self._close, file)
+        self._raise_error()
+
+    def _hand_over(self):
+        self._full_buffers.put_nowait((self._buffer, self._filled))
+        self._buffer = None
+        self._filled = 0
+
+    @asyncio.coroutine
+    def _write_buffers(self):
+        while True:
+            buffer, length = yield from self._full_buffers.get()
+            if buffer is None:
+                return
+            # after a failed write, the rest is dropped. write() raises the error.
+            if self._error is None:
+                try:
+                    yield from self._loop.run_in_executor(self._executor, self._write, buffer, length)
+                    self.flushed += length
+                except (OSError, ValueError) as e:
+                    # ValueError: the file was closed under the write, by a close() that was cancelled
+                    self._error = e
+            self._free_buffers.put_nowait(buffer)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _open(self):
+        file = open(self.path, self.mode)
+        try:
+            if self.size is not None:
+                preallocate(file, self.size)
+            file.seek(self.offset)
+        except OSError:
+            file.close()
+            raise
+        return file
+
+    def _write(self, buffer, length):
+        with memoryview(buffer) as view:
+            self._file.write(view[:length])
+            if self.digest is not None:
+                self.digest.update(view[:length])
+
+    def _close(self, file):
+        try:
+            if self.size is not None and self.offset + self.flushed < self.size:
+                file.truncate(self.offset + self.flushed)
+        finally:
+            file.close()
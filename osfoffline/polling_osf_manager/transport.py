@@ -0,0 +1,185 @@
+"""
+The HTTP connections of the process. Every OSFQuery, and so polling, uploads and downloads, sends its requests
+over one connector per event loop. Idle connections are kept open between requests and between Poll restarts,
+so pausing and resuming (e.g. for the preferences dialog) does not cost new dns lookups and tls handshakes.
+
+The circuit breakers (see retry.py) and rate limiters (see rate_limit.py) of the hosts live here too, so every
+query sees that a host is down or throttling. So do the json GETs in flight (see single_flight.py), so a query
+joins an identical request that another query already sent.
+
+The gui makes its few api calls with requests. They share one requests.Session for the same reason.
+"""
+import asyncio
+import logging
+import ssl
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from osfoffline.polling_osf_manager.retry import CircuitBreaker, host_of
+from osfoffline.polling_osf_manager.rate_limit import TokenBucket
+from osfoffline.polling_osf_manager.single_flight import SingleFlight
+from osfoffline.settings import (
+    HTTP_MAX_CONNECTIONS_PER_HOST, HTTP_KEEPALIVE_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_DNS_CACHE_SECONDS,
+    HTTP_WARM_UP_URLS
+)
+
+_ssl_context = None
+_transport = None
+_blocking_session = None
+
+
+def get_ssl_context():
+    """One ssl context for every connection, so certificates are loaded once and tls settings are the same."""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class Transport(object):
+    def __init__(
+            self,
+            loop,
+            max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            connect_timeout=HTTP_CONNECT_TIMEOUT,
+            dns_cache_seconds=HTTP_DNS_CACHE_SECONDS
+    ):
+        self._loop = loop
+        self.connector = aiohttp.TCPConnector(
+            loop=loop,
+            resolve=True,
+            ssl_context=get_ssl_context(),
+            limit=max_connections_per_host,
+            keepalive_timeout=keepalive_timeout,
+            conn_timeout=connect_timeout
+        )
+        self._dns_cache_seconds = dns_cache_seconds
+        self._dns_handle = None
+        self._schedule_dns_expiry()
+        # host -> CircuitBreaker
+        self._breakers = {}
+        # host -> TokenBucket
+        self._limiters = {}
+        self.single_flight = SingleFlight(loop)
+
+    @property
+    def closed(self):
+        return self.connector.closed
+
+    def _schedule_dns_expiry(self):
+        if self._dns_cache_seconds is not None:
+            self._dns_handle = self._loop.call_later(self._dns_cache_seconds, self._expire_dns)
+
+    def _expire_dns(self):
+        self.connector.clear_resolved_hosts()
+        self._schedule_dns_expiry()
+
+    def session(self, headers=None):
+        """
+        A ClientSession that sends its requests over the shared connector.
+        Give it back with release_session. Closing it would close the connections of every other session.
+        """
+        return aiohttp.ClientSession(connector=self.connector, loop=self._loop, headers=headers)
+
+    @staticmethod
+    def release_session(session):
+        session.detach()
+
+    @asyncio.coroutine
+    def warm_up(self, urls=None, timeout=HTTP_CONNECT_TIMEOUT):
+        """
+        Open a connection to each host, so the first real requests find a resolved address and a finished
+        handshake in the pool. Failures are only logged; the requests that follow report them properly.
+        """
+        urls = HTTP_WARM_UP_URLS if urls is None else urls
+        session = self.session()
+        try:
+            yield from asyncio.gather(
+                *[self._warm_up_url(session, url, timeout) for url in urls],
+                loop=self._loop
+            )
+        finally:
+            self.release_session(session)
+
+    @asyncio.coroutine
+    def _warm_up_url(self, session, url, timeout):
+        try:
+            resp = yield from asyncio.wait_for(session.request('HEAD', url), timeout, loop=self._loop)
+            yield from resp.release()
+        except (aiohttp.errors.ClientError, aiohttp.errors.HttpProcessingError, asyncio.TimeoutError, OSError) as e:
+            logging.info('could not warm up connection to {}: {}'.format(url, e))
+
+    def breaker_for(self, url):
+        host = host_of(url)
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self._loop, host, lambda: self._probe(host))
+        return breaker
+
+    def limiter_for(self, url):
+        host = host_of(url)
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = TokenBucket(self._loop)
+        return limiter
+
+    @asyncio.coroutine
+    def _probe(self, host, timeout=HTTP_CONNECT_TIMEOUT):
+        """Whether host answers. Any answer but a server error will do."""
+        session = self.session()
+        try:
+            resp = yield from asyncio.wait_for(session.request('HEAD', host + '/'), timeout, loop=self._loop)
+            yield from resp.release()
+            return resp.status < 500
+        except (aiohttp.errors.ClientError, aiohttp.errors.HttpProcessingError, asyncio.TimeoutError, OSError):
+            return False
+        finally:
+            self.release_session(session)
+
+    def host_states(self):
+        """The circuit and rate limiter of every host that was contacted, for the cycle metrics."""
+        states = {}
+        for host, breaker in self._breakers.items():
+            states.setdefault(host, {})['circuit'] = breaker.as_record()
+        for host, limiter in self._limiters.items():
+            states.setdefault(host, {})['rate_limit'] = limiter.as_record()
+        return states
+
+    def close(self):
+        for breaker in self._breakers.values():
+            breaker.stop()
+        if self._dns_handle is not None:
+            self._dns_handle.cancel()
+            self._dns_handle = None
+        if not self.connector.closed:
+            self.connector.close()
+
+
+def get_transport(loop):
+    """The transport of the process. A new one is made if the loop changed or the old one was closed."""
+    global _transport
+    if _transport is None or _transport.closed or _transport._loop is not loop:
+        close_transport()
+        _transport = Transport(loop)
+    return _transport
+
+
+def close_transport():
+    global _transport
+    if _transport is not None:
+        _transport.close()
+        _transport = None
+
+
+def get_blocking_session():
+    """The requests.Session for calls made outside of the event loop."""
+    global _blocking_session
+    if _blocking_session is None:
+        _blocking_session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST)
+        _blocking_session.mount('https://', adapter)
+        _blocking_session.mount('http://', adapter)
+    return _blocking_session
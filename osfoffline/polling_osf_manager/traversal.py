@@ -0,0 +1,116 @@
+"""
+The remote tree is walked as a frontier of work items rather than as one deep chain of `yield from`s.
+Every work item checks a single node or folder. Children are pushed back onto the frontier, so siblings are
+expanded concurrently and the time to walk a tree grows with its depth rather than with its number of folders.
+
+A run can be cut short. Work items that were not started yet stay on the frontier, and the next run resumes
+from there, so a large tree can be walked in several slices.
+
+A work item that fails on a connection problem or an inaccessible node or folder is counted in errors, and the walk
+goes on without it. Any other error is a bug: the run stops and raises it.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+
+import aiohttp
+
+import osfoffline.alerts as AlertHandler
+
+CONNECTION_ERRORS = (
+    aiohttp.errors.ClientConnectionError,
+    aiohttp.errors.ClientTimeoutError,
+    concurrent.futures._base.TimeoutError
+)
+
+
+def listing_failure(listing, remote_node):
+    """
+    The warning for a listing that was gathered with return_exceptions=True and failed, or None if it succeeded.
+    Connection problems and inaccessible nodes are failures. Anything else is unexpected and is raised.
+    """
+    if isinstance(listing, CONNECTION_ERRORS):
+        return 'Bad Internet Connection'
+    elif isinstance(listing, aiohttp.errors.HttpBadRequest):
+        return 'could not access files for node {}. Node might have been deleted.'.format(remote_node.name)
+    elif isinstance(listing, Exception):
+        raise listing
+    return None
+
+
+class TraversalEngine(object):
+    def __init__(self, loop, max_concurrency):
+        assert max_concurrency >= 1
+        self._loop = loop
+        self.max_concurrency = max_concurrency
+        self._frontier = collections.deque()
+        self._busy = 0
+        self._wakeup = None
+
+        # number of work items that failed during the current run.
+        self.errors = 0
+
+    @property
+    def pending(self):
+        return len(self._frontier)
+
+    def push(self, coroutine_function, *args, **kwargs):
+        """Queue a coroutine function to be called (with the given arguments) by one of the workers.
+        """
+        self._frontier.append((coroutine_function, args, kwargs))
+        self._wake_workers()
+
+    @asyncio.coroutine
+    def run(self, should_stop=None):
+        """Run work items until the frontier is empty and no work item is running anymore.
+        :param should_stop: function without arguments. once it returns True no new work items are started.
+            work items that are already running are finished. the rest stay pending for the next run.
+        """
+        self.errors = 0
+        workers = [self._loop.create_task(self._worker(should_stop)) for _ in range(self.max_concurrency)]
+        done, running = yield from asyncio.wait(workers, loop=self._loop, return_when=asyncio.FIRST_EXCEPTION)
+        for worker in running:
+            worker.cancel()
+        if running:
+            yield from asyncio.wait(running, loop=self._loop)
+        for worker in done:
+            if worker.exception() is not None:
+                raise worker.exception()
+
+    @asyncio.coroutine
+    def _worker(self, should_stop):
+        while True:
+            if should_stop is not None and should_stop():
+                self._wake_workers()
+                return
+            if not self._frontier:
+                if self._busy == 0:
+                    self._wake_workers()
+                    return
+                yield from self._wait_for_work()
+                continue
+
+            coroutine_function, args, kwargs = self._frontier.popleft()
+            self._busy += 1
+            try:
+                yield from coroutine_function(*args, **kwargs)
+            except CONNECTION_ERRORS:
+                self.errors += 1
+                AlertHandler.warn('Bad Internet Connection')
+            except aiohttp.errors.HttpBadRequest as e:
+                self.errors += 1
+                logging.warning(e)
+            finally:
+                self._busy -= 1
+                self._wake_workers()
+
+    @asyncio.coroutine
+    def _wait_for_work(self):
+        if self._wakeup is None or self._wakeup.done():
+            self._wakeup = asyncio.Future(loop=self._loop)
+        yield from self._wakeup
+
+    def _wake_workers(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
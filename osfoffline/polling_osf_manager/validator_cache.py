@@ -0,0 +1,63 @@
+"""
+Persistent cache of http validators (ETag, Last-Modified) for json listing pages.
+Used by OSFQuery to make conditional GET requests.
+Changes are saved through the unit of work of the sync engine, and committed with its next batch.
+"""
+from sqlalchemy.orm.exc import NoResultFound
+
+from osfoffline.database_manager.models import HttpValidator
+
+
+class ValidatorCache(object):
+    def __init__(self, session, unit_of_work):
+        self.session = session
+        self.unit_of_work = unit_of_work
+
+    def _get(self, url):
+        try:
+            return self.session.query(HttpValidator).filter(HttpValidator.url == url).one()
+        except NoResultFound:
+            return None
+
+    def headers_for(self, url):
+        """Headers that make a GET for url conditional. Empty if nothing usable is cached for url.
+        """
+        validator = self._get(url)
+        headers = {}
+        if validator is None or validator.body is None:
+            return headers
+        if validator.etag:
+            headers['If-None-Match'] = validator.etag
+        if validator.last_modified:
+            headers['If-Modified-Since'] = validator.last_modified
+        return headers
+
+    def cached_json(self, url):
+        validator = self._get(url)
+        return validator.body if validator else None
+
+    def store(self, url, response_headers, json_body):
+        """Remember the validators and body of a 200 response. Responses without validators are forgotten.
+        """
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+        validator = self._get(url)
+
+        if not etag and not last_modified:
+            if validator is not None:
+                self.session.delete(validator)
+                self.unit_of_work.save()
+            return
+
+        if validator is None:
+            validator = HttpValidator(url=url)
+        validator.etag = etag
+        validator.last_modified = last_modified
+        validator.body = json_body
+        self.unit_of_work.save(validator)
+
+    def forget(self, url):
+        validator = self._get(url)
+        if validator is not None:
+            self.session.delete(validator)
+            self.unit_of_work.save()
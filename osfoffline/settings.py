@@ -13,6 +13,65 @@ PROJECT_DB_PATH = user_data_dir(PROJECT_NAME, PROJECT_AUTHOR)
 API_BASE = 'https://staging-api.osf.io'
 FILE_BASE = 'https://staging-files.osf.io'
 
+# Polling
+POLL_MAX_CONCURRENCY = 8  # number of remote nodes/folders that are checked at the same time
+POLL_FULL_WALK_INTERVAL = 60 * 60  # seconds. nodes whose date_modified did not change are still walked this often
+POLL_MIN_INTERVAL = 5  # seconds between checks of a project that just changed
+POLL_MAX_INTERVAL = 30 * 60  # upper bound in seconds between checks of a project that does not change
+POLL_BACKOFF_FACTOR = 2  # wait between checks is multiplied by this every time a project is found unchanged
+POLL_MAX_REQUESTS_PER_CYCLE = 500  # a walk that needs more requests is continued next cycle. None for no cap
+POLL_MAX_SECONDS_PER_CYCLE = 60  # a walk that takes longer is continued next cycle. None for no cap
+POLL_CHANGE_FEED = False  # find remote changes in the logs of each node instead of walking its whole tree
+POLL_CHANGE_FEED_MAX_LOGS = 200  # a node with more new log entries than this is walked instead
+
+# Requests
+CONDITIONAL_REQUESTS = False  # send If-None-Match/If-Modified-Since for listings and replay cached pages on 304
+LISTING_PAGE_SIZE = 100  # items per page of a listing. the osf caps this at its own maximum
+SPARSE_FIELDSETS = True  # ask the osf for only the attributes and relationships that are used
+HTTP_MAX_CONNECTIONS_PER_HOST = 8  # open connections to one host, shared by polling, uploads and downloads
+HTTP_KEEPALIVE_TIMEOUT = 60  # seconds an idle connection is kept open for the next request
+HTTP_CONNECT_TIMEOUT = 30  # seconds to wait for a new connection, including the tls handshake
+HTTP_DNS_CACHE_SECONDS = 10 * 60  # resolved addresses are reused for this long
+HTTP_WARM_UP_URLS = [API_BASE, FILE_BASE]  # connected to when the app starts, before the first poll
+HTTP_REQUEST_TIMEOUT = 180  # seconds to wait for the response to a single attempt of a request
+RETRY_MAX_ATTEMPTS = 4  # attempts of an idempotent request that times out, fails to connect or gets a 502/503/504
+RETRY_BASE_DELAY = 0.5  # seconds. the wait before the n-th retry is random, up to RETRY_BASE_DELAY * 2 ** n
+RETRY_MAX_DELAY = 30  # upper bound in seconds of the wait between two attempts
+CIRCUIT_FAILURE_THRESHOLD = 5  # failures in a row after which requests to a host fail without being sent
+CIRCUIT_RESET_TIMEOUT = 5  # seconds until a host that stopped answering is probed again
+CIRCUIT_MAX_RESET_TIMEOUT = 5 * 60  # the wait between probes doubles up to this while the host stays down
+RATE_LIMIT_PER_SECOND = 10  # requests per second to one host, averaged. None for no limit
+RATE_LIMIT_BURST = 20  # requests that can be sent to one host at once after a quiet period
+RATE_LIMIT_DEFAULT_PAUSE = 5  # seconds to hold requests to a host that throttles without a Retry-After header
+RATE_LIMIT_MAX_PAUSE = 300  # most seconds to hold requests to a host, whatever its Retry-After header asks for
+RATE_LIMIT_MAX_THROTTLED_RETRIES = 10  # a request that is throttled more often than this fails
+
+# Transfers
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # bytes of a file that are read and sent at a time
+RESUMABLE_UPLOADS = False  # upload large files in resumable sessions. only for servers that offer them
+RESUMABLE_UPLOAD_MIN_SIZE = 32 * 1024 * 1024  # bytes. smaller files are uploaded in one request
+UPLOAD_MAX_RESUMES = 5  # times a resumable upload continues after its connection broke, before it fails
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # most bytes of a download that are read from the connection at a time
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024  # bytes of a download that are collected before they are written to disk
+DOWNLOAD_BUFFERS = 4  # buffers per download. when all wait for the disk, the download waits too
+DOWNLOAD_WRITER_THREADS = 4  # threads that write downloads to disk
+DOWNLOAD_PREALLOCATE = True  # reserve the disk space of a download before writing it, when its size is known
+DOWNLOAD_MAX_RESUMES = 5  # times a download continues after its connection broke, before it fails
+PARALLEL_DOWNLOAD_MIN_SIZE = 64 * 1024 * 1024  # bytes. larger files are downloaded in several ranges at once
+PARALLEL_DOWNLOAD_CONNECTIONS = 4  # most connections one file is downloaded over. 1 to never split downloads
+PARALLEL_DOWNLOAD_MIN_RANGE = 16 * 1024 * 1024  # bytes. a file is not split into ranges smaller than this
+
+# Local changes
+ECHO_SUPPRESSION_SECONDS = 30  # how long watchdog events for a change made by the sync engine itself are dropped
+
+# Database
+DB_BATCH_MAX_ITEMS = 500  # saves of the sync engine that are committed together. 1 to commit every save
+DB_BATCH_MAX_SECONDS = 1  # most seconds a save waits to be committed. what is not committed is lost on a crash
+DB_JOURNAL_MODE = 'WAL'  # readers go on while the sync engine commits. 'DELETE' for the sqlite default
+DB_SYNCHRONOUS = 'NORMAL'  # with WAL a crash can lose the last commits, not the db. 'FULL' to sync every commit
+DB_MMAP_SIZE = 256 * 1024 * 1024  # bytes of the db file that are read through a memory map. 0 to read it with calls
+DB_CACHE_SIZE = 64 * 1024  # KiB of db pages each connection keeps in memory
+
 
 
 # import hashlib
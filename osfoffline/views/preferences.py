@@ -2,13 +2,12 @@ from PyQt5.QtWidgets import (QAction, QDialog, QFileDialog, QTreeWidgetItem)
 from PyQt5.QtCore import QCoreApplication, QRect, Qt
 from PyQt5.QtCore import pyqtSignal
 from osfoffline.views.rsc.preferences_rc import Ui_Preferences  # REQUIRED FOR GUI
-from osfoffline.database_manager.db import session
-from osfoffline.database_manager.utils import save, session_scope
+from osfoffline.database_manager.utils import save, session_scope, reader_scope, writer_scope
 from osfoffline.database_manager.models import User, Node
 from osfoffline.polling_osf_manager.api_url_builder import api_url_for, NODES, USERS
 from osfoffline.polling_osf_manager.osf_query import OSFQuery
 from osfoffline.polling_osf_manager.remote_objects import RemoteNode
-import requests
+from osfoffline.polling_osf_manager.transport import get_blocking_session
 import os
 import logging
 import asyncio
@@ -87,8 +86,11 @@ class Preferences(QDialog):
             logging.warning("An OSF file exists where you would like to create the OSF folder.")
             return
 
-        user = session.query(User).filter(User.logged_in).one()
-        user.osf_local_folder_path = os.path.join(osf_path)
+        # not through the session of the sync engine, which belongs to its thread.
+        # committed right away. the window reads the user through a reader session, which only sees commits.
+        with writer_scope() as writer:
+            user = writer.query(User).filter(User.logged_in).one()
+            user.osf_local_folder_path = os.path.join(osf_path)
 
         self.preferences_window.containingFolderTextEdit.setText(self._translate("Preferences", self.containing_folder))
         self.open_window(tab=Preferences.GENERAL) # todo: dynamically update ui????
@@ -98,7 +100,6 @@ class Preferences(QDialog):
 
 
     def update_sync_nodes(self):
-        user = session.query(User).filter(User.logged_in).one()
         guid_list = []
 
         for tree_item in self.tree_items:
@@ -106,7 +107,9 @@ class Preferences(QDialog):
                 if name == tree_item.text(self.PROJECT_NAME_COLUMN):
                     if tree_item.checkState(self.PROJECT_SYNC_COLUMN) == Qt.Checked:
                         guid_list.append(id)
-        user.guid_for_top_level_nodes_to_sync = guid_list
+        with writer_scope() as writer:
+            user = writer.query(User).filter(User.logged_in).one()
+            user.guid_for_top_level_nodes_to_sync = guid_list
 
     def open_window(self, tab=GENERAL):
         if self.isVisible():
@@ -119,12 +122,16 @@ class Preferences(QDialog):
 
     def selector(self, selected_index):
         if selected_index == self.GENERAL:
-            user = session.query(User).filter(User.logged_in).one()
-            containing_folder = os.path.dirname(user.osf_local_folder_path)
+            with reader_scope() as reader:
+                user = reader.query(User).filter(User.logged_in).one()
+                osf_local_folder_path = user.osf_local_folder_path
+            containing_folder = os.path.dirname(osf_local_folder_path)
             self.preferences_window.containingFolderTextEdit.setText(self._translate("Preferences", containing_folder))
         elif selected_index == self.OSF:
-            user = session.query(User).filter(User.logged_in).one()
-            self.preferences_window.label.setText(self._translate("Preferences", user.full_name))
+            with reader_scope() as reader:
+                user = reader.query(User).filter(User.logged_in).one()
+                full_name = user.full_name
+            self.preferences_window.label.setText(self._translate("Preferences", full_name))
             self.create_tree_item_for_each_top_level_node()
 
     def reset_tree_widget(self):
@@ -137,13 +144,15 @@ class Preferences(QDialog):
         _translate = QCoreApplication.translate
 
 
-        user = session.query(User).filter(User.logged_in).one()
+        with reader_scope() as reader:
+            user = reader.query(User).filter(User.logged_in).one()
+            guids_to_sync = user.guid_for_top_level_nodes_to_sync
         for node in self.remote_top_level_nodes:
             tree_item = QTreeWidgetItem(self.preferences_window.treeWidget)
             tree_item.setCheckState(self.PROJECT_SYNC_COLUMN, Qt.Unchecked)
             tree_item.setText(self.PROJECT_NAME_COLUMN, _translate("Preferences", node.name))
 
-            if node.id in user.guid_for_top_level_nodes_to_sync:
+            if node.id in guids_to_sync:
                 tree_item.setCheckState(self.PROJECT_SYNC_COLUMN, Qt.Checked)
             self.preferences_window.treeWidget.resizeColumnToContents(self.PROJECT_NAME_COLUMN)
 
@@ -153,17 +162,21 @@ class Preferences(QDialog):
         remote_top_level_nodes = []
         try:
 
-            user = session.query(User).filter(User.logged_in).one()
+            with reader_scope() as reader:
+                user = reader.query(User).filter(User.logged_in).one()
+                user_osf_id = user.osf_id
+                oauth_token = user.oauth_token
             if user:
                 user_nodes = []
-                url = api_url_for(USERS, related_type=NODES, user_id=user.osf_id)
-                # headers={'Authorization': 'Bearer {}'.format(user.oauth_token)}
-                headers={'Cookie':'osf_staging={}'.format(user.oauth_token)}
-                resp = requests.get(url, headers=headers).json()
+                url = api_url_for(USERS, related_type=NODES, user_id=user_osf_id)
+                # headers={'Authorization': 'Bearer {}'.format(oauth_token)}
+                headers={'Cookie':'osf_staging={}'.format(oauth_token)}
+                http = get_blocking_session()
+                resp = http.get(url, headers=headers).json()
                 logging.warning(resp)
                 user_nodes.extend(resp['data'])
                 while resp['links']['next']:
-                    resp = requests.get(resp['links']['next'], headers=headers).json()
+                    resp = http.get(resp['links']['next'], headers=headers).json()
                     user_nodes.extend(resp['data'])
                 for node in user_nodes:
                     verified_node = RemoteNode(node)
@@ -0,0 +1,4 @@
+"""
+Micro-benchmarks. They are not collected as tests. Run one with:
+python -m tests.benchmarks.<module name>
+"""
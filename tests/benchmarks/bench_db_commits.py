@@ -0,0 +1,118 @@
+"""
+Saves the rows of two workloads into a sqlite file, committing every save the way database_manager.utils.save does,
+and through a UnitOfWork that commits them in batches, with the default sqlite pragmas and with the storage profile
+of settings.py (WAL, synchronous, mmap and cache sizes). Reports the seconds each took and the number of commits,
+each of which waits for the disk. The batched saves still flush one by one, which is most of what they cost.
+
+initial sync: the first poll of a project creates a File for every file and folder of the osf.
+event storm: a folder of files is copied into the osf folder. the event handler looks up every file and its parent
+by rel_path and saves the new File.
+
+python -m tests.benchmarks.bench_db_commits
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from osfoffline.database_manager.db import apply_storage_profile
+from osfoffline.database_manager.models import Base, User, Node, File, item_at_rel_path
+from osfoffline.database_manager.utils import UnitOfWork
+
+OSF_FOLDER = os.path.abspath(os.path.join(os.sep, 'osf'))
+FILES_PER_FOLDER = 100
+
+
+class CommitEverySave(object):
+    """The commits save() does."""
+    def __init__(self, session):
+        self.session = session
+        self.commits = 0
+
+    def save(self, *items_to_save):
+        for item in items_to_save:
+            self.session.add(item)
+        self.session.commit()
+        self.commits += 1
+
+    def flush(self):
+        pass
+
+
+def make_db(directory, profile):
+    engine = create_engine('sqlite:///{}'.format(os.path.join(directory, 'osf.db')))
+    if profile:
+        apply_storage_profile(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    user = User(full_name='bench user', osf_local_folder_path=OSF_FOLDER)
+    node = Node(title='project', user=user)
+    session.add_all([user, node])
+    session.commit()
+    return session, user, node
+
+
+def initial_sync(session, user, node, unit_of_work, num_files):
+    folder = None
+    for i in range(num_files):
+        if i % FILES_PER_FOLDER == 0:
+            folder = File(name='folder_{}'.format(i // FILES_PER_FOLDER), type=File.FOLDER, user=user, node=node)
+            unit_of_work.save(folder)
+        unit_of_work.save(File(name='file_{}.txt'.format(i), type=File.FILE, user=user, node=node, parent=folder))
+    unit_of_work.flush()
+
+
+def event_storm(session, user, node, unit_of_work, num_files):
+    copied = File(name='copied', type=File.FOLDER, user=user, node=node)
+    unit_of_work.save(copied)
+    for i in range(num_files):
+        folder_rel_path = os.path.join('project', 'copied', 'folder_{}'.format(i // FILES_PER_FOLDER))
+        file_name = 'file_{}.txt'.format(i)
+        # _already_exists, then _get_parent_item_from_path
+        assert item_at_rel_path(session, user, os.path.join(folder_rel_path, file_name), False) is None
+        parent = item_at_rel_path(session, user, folder_rel_path, True)
+        if parent is None:
+            parent = File(name=os.path.basename(folder_rel_path), type=File.FOLDER, user=user, node=node, parent=copied)
+            unit_of_work.save(parent)
+        unit_of_work.save(File(name=file_name, type=File.FILE, user=user, node=node, parent=parent))
+    unit_of_work.flush()
+
+
+def measure(workload, make_unit_of_work, num_files, profile):
+    directory = tempfile.mkdtemp()
+    try:
+        session, user, node = make_db(directory, profile)
+        unit_of_work = make_unit_of_work(session)
+        start = time.perf_counter()
+        workload(session, user, node, unit_of_work, num_files)
+        took = time.perf_counter() - start
+        session.close()
+        return took, unit_of_work.commits
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(sizes=(1000, 10000)):
+    # the unit of work is only flushed by the workloads and by max_items, so the loop does not need to run
+    loop = asyncio.new_event_loop()
+    print('{:>14} {:>8} {:>8} {:>16} {:>8} {:>12} {:>16}'.format(
+        'workload', 'files', 'pragmas', 'commit each (s)', 'commits', 'batched (s)', 'batched commits'
+    ))
+    for workload in (initial_sync, event_storm):
+        for size in sizes:
+            for profile in (False, True):
+                each, each_commits = measure(workload, CommitEverySave, size, profile)
+                batched, batched_commits = measure(workload, lambda session: UnitOfWork(session, loop), size, profile)
+                print('{:>14} {:>8} {:>8} {:>16.2f} {:>8} {:>12.2f} {:>16}'.format(
+                    workload.__name__, size, 'profile' if profile else 'default', each, each_commits, batched,
+                    batched_commits
+                ))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
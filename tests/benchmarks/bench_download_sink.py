@@ -0,0 +1,128 @@
+"""
+Downloads a large file from the mock osf server the way _download_file used to (2048 byte reads, written with
+blocking writes on the event loop) and through a DownloadSink. Reports the time of each download and how late a
+coroutine that wakes up every millisecond ran, which is how long the event loop was held up.
+
+python -m tests.benchmarks.bench_download_sink
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import aiohttp
+import requests
+from werkzeug.serving import make_server
+
+from osfoffline.polling_osf_manager import polling_events
+from osfoffline.utils.path import ProperPath
+from tests.fixtures.mock_osf_api_server.osf import app
+
+
+class BenchQuery(object):
+    """The part of OSFQuery that downloads use, logged in to the mock server."""
+    def __init__(self, loop, user_id):
+        self.loop = loop
+        self.session = aiohttp.ClientSession(loop=loop, headers={'Authorization': 'Bearer {}'.format(user_id)})
+
+    @asyncio.coroutine
+    def make_request(self, url, headers=None, expects=None):
+        return (yield from self.session.request('GET', url, headers=headers))
+
+    def close(self):
+        self.session.close()
+
+
+def start_server():
+    server = make_server('localhost', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://localhost:{}'.format(server.server_port)
+
+
+def upload_file(base, size):
+    """A user with a project that has one file of size bytes. returns (user id, download url)."""
+    user_id = requests.post(base + '/v2/users/', data={'fullname': 'bench user'}).json()['data']['id']
+    headers = {'Authorization': 'Bearer {}'.format(user_id)}
+    body = {'data': {'type': 'nodes', 'attributes': {'title': 'bench project', 'category': 'project'}}}
+    node_id = requests.post(
+        base + '/v2/nodes/', data=json.dumps(body), headers=dict(headers, **{'Content-Type': 'application/json'})
+    ).json()['data']['id']
+    file_id = requests.put(
+        base + '/v1/resources/{}/providers/osfstorage/?kind=file&name=big.bin'.format(node_id),
+        data=os.urandom(size),
+        headers=headers
+    ).json()['data']['id']
+    return user_id, base + '/v1/resources/{}/providers/osfstorage/{}/'.format(node_id, file_id)
+
+
+@asyncio.coroutine
+def legacy_download(path, url, osf_query, size):
+    resp = yield from osf_query.make_request(url)
+    with open(path.full_path, 'wb') as fd:
+        while True:
+            chunk = yield from resp.content.read(2048)
+            if not chunk:
+                break
+            fd.write(chunk)
+    resp.close()
+
+
+@asyncio.coroutine
+def sink_download(path, url, osf_query, size):
+    yield from polling_events._download_to_part(path, url, osf_query, size)
+    os.replace(polling_events.part_path(path.full_path), path.full_path)
+
+
+@asyncio.coroutine
+def measure(download, path, url, osf_query, size, loop):
+    """(seconds the download took, most milliseconds the event loop was held up)"""
+    most_late = 0
+    done = False
+
+    @asyncio.coroutine
+    def heartbeat():
+        nonlocal most_late
+        while not done:
+            before = time.perf_counter()
+            yield from asyncio.sleep(0.001, loop=loop)
+            most_late = max(most_late, time.perf_counter() - before - 0.001)
+
+    beat = loop.create_task(heartbeat())
+    start = time.perf_counter()
+    yield from download(path, url, osf_query, size)
+    took = time.perf_counter() - start
+    done = True
+    yield from beat
+    assert os.path.getsize(path.full_path) == size
+    return took, most_late * 1000
+
+
+def main(sizes=(16 * 1024 * 1024, 128 * 1024 * 1024)):
+    server, base = start_server()
+    loop = asyncio.new_event_loop()
+    directory = tempfile.mkdtemp()
+    try:
+        print('{:>8} {:>12} {:>12} {:>16} {:>16}'.format(
+            'MB', 'legacy (s)', 'sink (s)', 'legacy stall (ms)', 'sink stall (ms)'
+        ))
+        for size in sizes:
+            user_id, url = upload_file(base, size)
+            osf_query = BenchQuery(loop, user_id)
+            path = ProperPath(os.path.join(directory, 'big.bin'), is_dir=False)
+            legacy, legacy_stall = loop.run_until_complete(measure(legacy_download, path, url, osf_query, size, loop))
+            sink, sink_stall = loop.run_until_complete(measure(sink_download, path, url, osf_query, size, loop))
+            osf_query.close()
+            print('{:>8} {:>12.2f} {:>12.2f} {:>16.1f} {:>16.1f}'.format(
+                size // (1024 * 1024), legacy, sink, legacy_stall, sink_stall
+            ))
+    finally:
+        loop.close()
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
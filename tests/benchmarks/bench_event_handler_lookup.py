@@ -0,0 +1,102 @@
+"""
+Replays the created events of copying a folder of many files into the osf folder. For each event, the handler
+checks that the item is not in the db yet, finds its parent folder, and saves the new File.
+Compares the lookup OSFEventHandler._get_item_by_path used to do (build the path of every Node and File and compare
+them one by one) with the indexed rel_path lookup, and reports the time of the whole replay with the indexed lookup.
+
+python -m tests.benchmarks.bench_event_handler_lookup
+"""
+import os
+import timeit
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from osfoffline.database_manager.models import Base, User, Node, File, item_at_rel_path
+from osfoffline.utils.path import ProperPath
+
+OSF_FOLDER = os.path.abspath(os.path.join(os.sep, 'osf'))
+FILES_PER_FOLDER = 100
+
+
+def legacy_get_item_by_path(session, path):
+    for node in session.query(Node):
+        if ProperPath(node.path, True) == path:
+            return node
+    for file_folder in session.query(File):
+        file_path = ProperPath(file_folder.path, file_folder.is_folder)
+        if file_path == path:
+            return file_folder
+    return None
+
+
+def indexed_get_item_by_path(session, user, path):
+    rel_path = os.path.relpath(path.full_path, OSF_FOLDER)
+    return item_at_rel_path(session, user, rel_path, path.is_dir)
+
+
+def make_db():
+    session = sessionmaker(bind=create_engine('sqlite://'))()
+    Base.metadata.create_all(session.bind)
+    user = User(full_name='bench user', osf_local_folder_path=OSF_FOLDER)
+    node = Node(title='project', user=user)
+    copied = File(name='copied', type=File.FOLDER, user=user, node=node)
+    session.add_all([user, node, copied])
+    session.commit()
+    return session, user, node
+
+
+def copy_events(num_files):
+    """(folder path, file path) of each file of the copied folder, FILES_PER_FOLDER files to a sub folder."""
+    for i in range(num_files):
+        folder = os.path.join(OSF_FOLDER, 'project', 'copied', 'folder_{}'.format(i // FILES_PER_FOLDER))
+        yield ProperPath(folder, True), ProperPath(os.path.join(folder, 'file_{}.txt'.format(i)), False)
+
+
+def replay(session, user, node, events, get_item_by_path):
+    for folder_path, file_path in events:
+        # _already_exists
+        assert get_item_by_path(file_path) is None
+        # _get_parent_item_from_path
+        parent = get_item_by_path(folder_path)
+        if parent is None:
+            # the folder itself was created first
+            parent = File(
+                name=folder_path.name, type=File.FOLDER, user=user, node=node,
+                parent=get_item_by_path(folder_path.parent)
+            )
+            session.add(parent)
+        session.add(File(name=file_path.name, type=File.FILE, user=user, node=node, parent=parent))
+        session.commit()
+
+
+def main(sizes=(1000, 10000), sample=20):
+    print('{:>8} {:>18} {:>18} {:>18}'.format(
+        'files', 'replay (s)', 'legacy event (ms)', 'indexed event (ms)'
+    ))
+    for size in sizes:
+        session, user, node = make_db()
+        events = list(copy_events(size + sample))
+        replay_time = timeit.timeit(
+            lambda: replay(session, user, node, events[:size], lambda path: indexed_get_item_by_path(session, user, path)),
+            number=1
+        )
+        # the cost of one more event, once size files are in the db
+        folder_path, file_path = events[size]
+        legacy = timeit.timeit(
+            lambda: (legacy_get_item_by_path(session, file_path), legacy_get_item_by_path(session, folder_path)),
+            number=sample
+        )
+        indexed = timeit.timeit(
+            lambda: (indexed_get_item_by_path(session, user, file_path),
+                     indexed_get_item_by_path(session, user, folder_path)),
+            number=sample
+        )
+        print('{:>8} {:>18.2f} {:>18.2f} {:>18.3f}'.format(
+            size, replay_time, legacy / sample * 1000, indexed / sample * 1000
+        ))
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares the sort-and-scan matching that Poll.make_local_remote_tuple_list used to do with the
+dictionary-keyed Reconciler, for folders with many children.
+
+python -m tests.benchmarks.bench_reconciliation
+"""
+import random
+import timeit
+
+from osfoffline.polling_osf_manager.reconciliation import Reconciler
+
+
+class FakeBase(object):
+    """Stands in for the sql alchemy declarative base."""
+
+
+class FakeRemoteObject(object):
+    """Stands in for RemoteObject."""
+
+
+class FakeLocal(FakeBase):
+    def __init__(self, osf_id, name):
+        self.osf_id = osf_id
+        self.name = name
+        self.is_file = False
+        self.locally_created = False
+        self.locally_deleted = False
+
+
+class FakeRemote(FakeRemoteObject):
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+def get_id(item):
+    """Same rules as Poll.get_id."""
+    if isinstance(item, FakeRemoteObject):
+        return item.id
+    elif isinstance(item, FakeBase):
+        if item.osf_id:
+            return item.osf_id
+        else:
+            assert item.locally_created
+            return "FAKE{}FAKE".format(item.id)
+    raise TypeError
+
+
+def legacy_make_local_remote_tuple_list(local_list, remote_list):
+    """The matching that Poll.make_local_remote_tuple_list used to do."""
+    assert None not in local_list
+    assert None not in remote_list
+
+    sorted_combined_list = sorted(local_list + remote_list, key=get_id)
+
+    local_remote_tuple_list = []
+    i = 0
+    while i < len(sorted_combined_list):
+        both_exist = i + 1 < len(sorted_combined_list) and \
+            get_id(sorted_combined_list[i]) == get_id(sorted_combined_list[i + 1])
+        if both_exist:
+            if isinstance(sorted_combined_list[i], FakeRemote):
+                new_tuple = (sorted_combined_list[i + 1], sorted_combined_list[i])
+            else:
+                new_tuple = (sorted_combined_list[i], sorted_combined_list[i + 1])
+            i += 1
+        elif isinstance(sorted_combined_list[i], FakeRemote):
+            new_tuple = (None, sorted_combined_list[i])
+        else:
+            new_tuple = (sorted_combined_list[i], None)
+        local_remote_tuple_list.append(new_tuple)
+        i += 1
+
+    for local, remote in local_remote_tuple_list:
+        assert isinstance(local, FakeLocal) or local is None
+        assert isinstance(remote, FakeRemote) or remote is None
+
+    return local_remote_tuple_list
+
+
+def make_folder(num_children):
+    """90% of the children are on both sides, 5% only local, 5% only remote. Neither side is sorted by id."""
+    rand = random.Random(num_children)
+    ids = ['{:024x}'.format(rand.getrandbits(96)) for _ in range(num_children)]
+    local_list = [FakeLocal(id, id) for id in ids[:int(num_children * 0.95)]]
+    remote_list = [FakeRemote(id, id) for id in ids[int(num_children * 0.05):]]
+    rand.shuffle(local_list)
+    rand.shuffle(remote_list)
+    return local_list, remote_list
+
+
+def main(sizes=(1000, 10000, 50000), repeat=5):
+    reconciler = Reconciler(get_id=get_id)
+    print('{:>8} {:>14} {:>14} {:>8}'.format('children', 'legacy (ms)', 'reconcile (ms)', 'speedup'))
+    for size in sizes:
+        local_list, remote_list = make_folder(size)
+        legacy = min(timeit.repeat(lambda: legacy_make_local_remote_tuple_list(local_list, remote_list), number=1, repeat=repeat))
+        new = min(timeit.repeat(lambda: reconciler.reconcile(local_list, remote_list), number=1, repeat=repeat))
+        print('{:>8} {:>14.2f} {:>14.2f} {:>7.1f}x'.format(size, legacy * 1000, new * 1000, legacy / new))
+
+
+if __name__ == '__main__':
+    main()
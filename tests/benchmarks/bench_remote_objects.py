@@ -0,0 +1,175 @@
+"""
+Compares building RemoteObjects for a large listing the way remote_objects.py used to (instance dicts, validate()
+on construction, date parsed eagerly) with the current __slots__ classes and page_to_remote_objects.
+Reports time and memory per listed item.
+
+python -m tests.benchmarks.bench_remote_objects
+"""
+import timeit
+import tracemalloc
+
+from osfoffline.polling_osf_manager.remote_objects import page_to_remote_objects, remote_to_local_datetime
+
+
+class LegacyRemoteObject(object):
+    def __init__(self, remote_dict):
+        assert isinstance(remote_dict, dict)
+        assert 'type' in remote_dict
+        self.id = None
+        self.name = None
+
+    def validate(self):
+        assert self.id
+        assert self.name
+
+
+class LegacyRemoteNode(LegacyRemoteObject):
+    def __init__(self, remote_dict):
+        super().__init__(remote_dict)
+        assert remote_dict['type'] == 'nodes'
+        self.id = remote_dict['id']
+        self.name = remote_dict['attributes']['title']
+        self.category = remote_dict['attributes']['category']
+        self.child_files_url = remote_dict['relationships']['files']['links']['related']['href']
+        self.is_top_level = remote_dict['relationships']['parent']['links']['related']['href'] is None
+        self.child_nodes_url = remote_dict['relationships']['children']['links']['related']['href']
+        self.last_modified = remote_to_local_datetime(remote_dict['attributes']['date_modified'])
+
+        self.validate()
+
+    def validate(self):
+        super().validate()
+        assert self.child_files_url
+        assert self.is_top_level is not None
+        assert self.child_nodes_url
+        assert self.last_modified
+
+
+class LegacyRemoteFileFolder(LegacyRemoteObject):
+    def __init__(self, remote_dict):
+        super().__init__(remote_dict)
+        assert remote_dict['type'] == 'files'
+        self.id = remote_dict['id']
+        if '/' in self.id:
+            self.id = self.id.split('/')[1]
+        self.name = remote_dict['attributes']['name']
+        self.provider = remote_dict['attributes']['provider']
+        self.move_url = remote_dict['links']['move'] if 'move' in remote_dict['links'] else None
+        self.delete_url = remote_dict['links']['delete'] if 'delete' in remote_dict['links'] else None
+
+    def validate(self):
+        super().validate()
+        assert self.provider
+        assert self.move_url if not self.id else True
+        assert self.delete_url if not self.id else True
+
+
+class LegacyRemoteFile(LegacyRemoteFileFolder):
+    def __init__(self, remote_dict):
+        super().__init__(remote_dict)
+        assert remote_dict['attributes']['kind'] == 'file'
+        self.download_url = remote_dict['links']['download']
+        self.overwrite_url = remote_dict['links']['upload']
+        self.size = remote_dict['attributes']['size']
+
+        self.validate()
+
+    def validate(self):
+        super().validate()
+        assert self.download_url
+        assert self.delete_url
+        assert self.size >= 0
+        assert self.overwrite_url
+
+
+def legacy_page_to_remote_objects(remote_dicts):
+    remote_objects = []
+    for remote_dict in remote_dicts:
+        assert isinstance(remote_dict, dict)
+        if remote_dict['type'] == 'files':
+            remote_objects.append(LegacyRemoteFile(remote_dict))
+        else:
+            remote_objects.append(LegacyRemoteNode(remote_dict))
+    return remote_objects
+
+
+def file_dicts(num_files):
+    return [
+        {
+            'id': 'osfstorage/{:024x}'.format(i),
+            'type': 'files',
+            'attributes': {
+                'name': 'file_{}.txt'.format(i),
+                'provider': 'osfstorage',
+                'kind': 'file',
+                'size': i,
+                'path': '/{:024x}'.format(i),
+                'last_touched': None,
+                'extra': {'hashes': {'md5': None, 'sha256': None}},
+            },
+            'relationships': {},
+            'links': {
+                'info': 'https://staging-api.osf.io/v2/files/{:024x}/'.format(i),
+                'move': 'https://staging-files.osf.io/v1/resources/abcde/providers/osfstorage/{:024x}'.format(i),
+                'delete': 'https://staging-files.osf.io/v1/resources/abcde/providers/osfstorage/{:024x}'.format(i),
+                'upload': 'https://staging-files.osf.io/v1/resources/abcde/providers/osfstorage/{:024x}'.format(i),
+                'download': 'https://staging-files.osf.io/v1/resources/abcde/providers/osfstorage/{:024x}'.format(i),
+            },
+        }
+        for i in range(num_files)
+    ]
+
+
+def node_dicts(num_nodes):
+    return [
+        {
+            'id': '{:05x}'.format(i),
+            'type': 'nodes',
+            'attributes': {
+                'title': 'node {}'.format(i),
+                'category': 'project',
+                'date_created': '2015-07-24T19:35:16.502000',
+                'date_modified': '2015-07-24T19:35:16.502000',
+                'description': '',
+                'public': False,
+                'tags': [],
+            },
+            'relationships': {
+                'files': {'links': {'related': {'href': 'https://staging-api.osf.io/v2/nodes/{:05x}/files/'.format(i)}}},
+                'parent': {'links': {'related': {'href': None}}},
+                'children': {'links': {'related': {'href': 'https://staging-api.osf.io/v2/nodes/{:05x}/children/'.format(i)}}},
+            },
+            'links': {},
+        }
+        for i in range(num_nodes)
+    ]
+
+
+def measure_memory(build, remote_dicts):
+    tracemalloc.start()
+    remote_objects = build(remote_dicts)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del remote_objects
+    return size
+
+
+def main(num_items=100000, repeat=3):
+    print('{:>6} {:>8} {:>14} {:>14} {:>14} {:>14}'.format(
+        'kind', 'items', 'legacy (us)', 'slots (us)', 'legacy (B)', 'slots (B)'
+    ))
+    for kind, remote_dicts in (('files', file_dicts(num_items)), ('nodes', node_dicts(num_items // 10))):
+        legacy = min(timeit.repeat(lambda: legacy_page_to_remote_objects(remote_dicts), number=1, repeat=repeat))
+        new = min(timeit.repeat(lambda: page_to_remote_objects(remote_dicts), number=1, repeat=repeat))
+        legacy_memory = measure_memory(legacy_page_to_remote_objects, remote_dicts)
+        new_memory = measure_memory(page_to_remote_objects, remote_dicts)
+        count = len(remote_dicts)
+        print('{:>6} {:>8} {:>14.2f} {:>14.2f} {:>14.0f} {:>14.0f}'.format(
+            kind, count,
+            legacy / count * 10 ** 6, new / count * 10 ** 6,
+            legacy_memory / count, new_memory / count
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+-- the tables as the first released version created them, before node and file gained columns
+CREATE TABLE user (
+	id INTEGER NOT NULL,
+	full_name VARCHAR,
+	osf_login VARCHAR,
+	osf_password VARCHAR,
+	osf_local_folder_path VARCHAR,
+	oauth_token VARCHAR,
+	osf_id VARCHAR,
+	logged_in BOOLEAN,
+	guid_for_top_level_nodes_to_sync VARCHAR(512),
+	PRIMARY KEY (id),
+	UNIQUE (osf_login),
+	UNIQUE (osf_id),
+	CHECK (logged_in IN (0, 1))
+);
+CREATE TABLE node (
+	id INTEGER NOT NULL,
+	title VARCHAR,
+	hash VARCHAR,
+	category VARCHAR(9),
+	date_modified DATETIME,
+	osf_id VARCHAR,
+	locally_created BOOLEAN,
+	locally_deleted BOOLEAN,
+	locally_moved BOOLEAN,
+	user_id INTEGER NOT NULL,
+	parent_id INTEGER,
+	PRIMARY KEY (id),
+	CHECK (category IN ('project', 'component')),
+	UNIQUE (osf_id),
+	CHECK (locally_created IN (0, 1)),
+	CHECK (locally_deleted IN (0, 1)),
+	CHECK (locally_moved IN (0, 1)),
+	FOREIGN KEY(user_id) REFERENCES user (id),
+	FOREIGN KEY(parent_id) REFERENCES node (id)
+);
+CREATE TABLE file (
+	id INTEGER NOT NULL,
+	name VARCHAR,
+	hash VARCHAR,
+	type VARCHAR(6) NOT NULL,
+	date_modified DATETIME,
+	osf_id VARCHAR,
+	provider VARCHAR,
+	osf_path VARCHAR,
+	locally_created BOOLEAN,
+	locally_deleted BOOLEAN,
+	locally_renamed BOOLEAN,
+	locally_moved BOOLEAN,
+	previous_node_osf_id VARCHAR,
+	previous_provider VARCHAR,
+	user_id INTEGER NOT NULL,
+	node_id INTEGER NOT NULL,
+	parent_id INTEGER,
+	PRIMARY KEY (id),
+	CHECK (type IN ('folder', 'file')),
+	CHECK (locally_created IN (0, 1)),
+	CHECK (locally_deleted IN (0, 1)),
+	CHECK (locally_renamed IN (0, 1)),
+	CHECK (locally_moved IN (0, 1)),
+	FOREIGN KEY(user_id) REFERENCES user (id),
+	FOREIGN KEY(node_id) REFERENCES node (id),
+	FOREIGN KEY(parent_id) REFERENCES file (id)
+);
+INSERT INTO user (id, full_name, osf_local_folder_path, logged_in, guid_for_top_level_nodes_to_sync)
+	VALUES (1, 'old user', '/osf', 1, '["proj"]');
+INSERT INTO node (id, title, category, osf_id, locally_created, locally_deleted, locally_moved, user_id)
+	VALUES (1, 'project', 'project', 'proj', 0, 0, 0, 1);
+INSERT INTO file (id, name, type, osf_id, provider, locally_created, locally_deleted, locally_renamed, locally_moved,
+		user_id, node_id, parent_id)
+	VALUES (1, 'folder', 'folder', 'folder', 'osfstorage', 0, 0, 0, 0, 1, 1, NULL);
+INSERT INTO file (id, name, type, osf_id, provider, locally_created, locally_deleted, locally_renamed, locally_moved,
+		user_id, node_id, parent_id)
+	VALUES (2, 'file.txt', 'file', 'file', 'osfstorage', 0, 0, 0, 0, 1, 1, 1);
@@ -0,0 +1,176 @@
+"""
+A remote tree kept in memory, served through the part of OSFQuery that Poll and SyncPlanner use. FakeQuery is an
+OSFQuery, so the polling events that Poll makes accept it, but it sends no requests.
+Listings of the ids in FakeQuery.failing raise FakeQuery.failure, by default a connection error, the way an unreachable
+host or an open circuit does.
+"""
+import asyncio
+import datetime
+
+import aiohttp
+import pytz
+
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.remote_objects import RemoteNode, RemoteFolder, RemoteFile, RemoteLog
+from osfoffline.polling_osf_manager.instrumentation import CycleStats
+
+DATE_MODIFIED = '2015-10-21T07:28:00.000000'
+
+
+def node_dict(node_id, title, date_modified=DATE_MODIFIED):
+    def link(href):
+        return {'links': {'related': {'href': href}}}
+    return {
+        'id': node_id,
+        'type': 'nodes',
+        'attributes': {'title': title, 'category': 'project', 'date_modified': date_modified},
+        'relationships': {
+            'files': link('/v2/nodes/{}/files/'.format(node_id)),
+            'parent': link(None),
+            'children': link('/v2/nodes/{}/children/'.format(node_id)),
+        },
+    }
+
+
+def folder_dict(folder_id, name):
+    return {
+        'id': folder_id,
+        'type': 'files',
+        'attributes': {'name': name, 'kind': 'folder', 'provider': 'osfstorage'},
+        'links': {'move': '/move', 'delete': '/delete', 'upload': '/upload', 'new_folder': '/new_folder'},
+        'relationships': {'files': {'links': {'related': {'href': '/files/{}/'.format(folder_id)}}}},
+    }
+
+
+def file_dict(file_id, name, size=0):
+    # local files are not written by these tests, and have size 0. files of the same size are not compared further
+    return {
+        'id': file_id,
+        'type': 'files',
+        'attributes': {'name': name, 'kind': 'file', 'provider': 'osfstorage', 'size': size},
+        'links': {'move': '/move', 'delete': '/delete', 'upload': '/upload', 'download': '/download/{}'.format(file_id)},
+    }
+
+
+def log_dict(log_id, action, date, **params):
+    return {
+        'id': log_id,
+        'type': 'logs',
+        'attributes': {'action': action, 'date': date.strftime('%Y-%m-%dT%H:%M:%S.%f'), 'params': params},
+    }
+
+
+class FakePages(object):
+    """PageIterator of a listing that is already in memory, one page."""
+    def __init__(self, page, error=None):
+        self._page = page
+        self._error = error
+
+    @asyncio.coroutine
+    def next_page(self):
+        if self._error is not None:
+            raise self._error
+        page, self._page = self._page, None
+        return page
+
+    def close(self):
+        pass
+
+
+class FakeQuery(OSFQuery):
+    def __init__(self, loop):
+        # not OSFQuery.__init__, which opens a transport and a validator cache
+        self._loop = loop
+        self.stats = CycleStats()
+        # node id -> RemoteNode
+        self.nodes = {}
+        # node id -> [RemoteNode]
+        self.child_nodes = {}
+        # node or folder id -> [RemoteFile/RemoteFolder]. a node id lists the top of its osfstorage
+        self.children = {}
+        # node id -> [RemoteLog], newest first
+        self.logs = {}
+        # node or folder ids whose listings fail, and the error they fail with
+        self.failing = set()
+        self.failure = aiohttp.errors.ClientConnectionError
+        # (method name, id) of every listing
+        self.listed = []
+
+    def add_node(self, node_id, title, date_modified=DATE_MODIFIED):
+        node = RemoteNode(node_dict(node_id, title, date_modified))
+        self.nodes[node_id] = node
+        self.child_nodes.setdefault(node_id, [])
+        self.children.setdefault(node_id, [])
+        return node
+
+    def add(self, parent_id, remote_dict):
+        item = RemoteFolder(remote_dict) if remote_dict['attributes']['kind'] == 'folder' else RemoteFile(remote_dict)
+        self.children.setdefault(parent_id, []).append(item)
+        if isinstance(item, RemoteFolder):
+            self.children.setdefault(item.id, [])
+        return item
+
+    def add_log(self, node_id, log_id, action, date, **params):
+        self.logs.setdefault(node_id, []).insert(0, RemoteLog(log_dict(log_id, action, date, **params)))
+
+    def _listing(self, name, item_id):
+        self.listed.append((name, item_id))
+        if item_id in self.failing:
+            raise self.failure('{} is unreachable'.format(item_id))
+
+    @asyncio.coroutine
+    def get_top_level_nodes(self, url):
+        return list(self.nodes.values())
+
+    @asyncio.coroutine
+    def get_child_nodes(self, remote_node):
+        self._listing('get_child_nodes', remote_node.id)
+        return list(self.child_nodes[remote_node.id])
+
+    @asyncio.coroutine
+    def get_child_files(self, remote_node_or_folder):
+        self._listing('get_child_files', remote_node_or_folder.id)
+        if isinstance(remote_node_or_folder, RemoteNode):
+            # the providers of the node. the osfstorage folder lists the top of the node.
+            return [RemoteFolder(folder_dict(remote_node_or_folder.id, 'osfstorage'))]
+        return list(self.children[remote_node_or_folder.id])
+
+    def iter_child_files(self, remote_folder):
+        try:
+            self._listing('iter_child_files', remote_folder.id)
+        except Exception as e:
+            # like a PageIterator, the error arrives with the first page
+            return FakePages(None, e)
+        return FakePages(list(self.children[remote_folder.id]))
+
+    def iter_local_folder_children(self, local_node, local_folder=None):
+        remote_id = local_folder.osf_id if local_folder else local_node.osf_id
+        return self.iter_child_files(RemoteFolder(folder_dict(remote_id, 'osfstorage')))
+
+    @asyncio.coroutine
+    def get_log_cursor(self, node_id):
+        self._listing('get_log_cursor', node_id)
+        logs = self.logs.get(node_id)
+        if not logs:
+            return None
+        return logs[0].date, [log.id for log in logs if log.date == logs[0].date]
+
+    @asyncio.coroutine
+    def get_node_logs(self, node_id, since, since_ids, max_logs):
+        self._listing('get_node_logs', node_id)
+        new_logs = [
+            log for log in self.logs.get(node_id, [])
+            if log.date > since or (log.date == since and log.id not in since_ids)
+        ]
+        return None if len(new_logs) > max_logs else new_logs
+
+    @asyncio.coroutine
+    def make_request(self, url, *args, **kwargs):
+        raise AssertionError('FakeQuery sends no requests, but {} was asked for'.format(url))
+
+    def close(self):
+        pass
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=pytz.utc)
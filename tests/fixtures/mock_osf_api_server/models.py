@@ -1,6 +1,7 @@
 __author__ = 'himanshu'
 import hashlib
 import datetime
+import json
 import os
 from sqlalchemy import create_engine, ForeignKey, Enum
 from sqlalchemy.orm import sessionmaker, relationship, backref, scoped_session, validates
@@ -96,6 +97,11 @@ class Node(Base):
         backref=backref('node'),
         cascade="all, delete-orphan"
     )
+    logs = relationship(
+        "Log",
+        backref=backref('node'),
+        cascade="all, delete-orphan"
+    )
 
     @hybrid_property
     def top_level(self):
@@ -246,6 +252,16 @@ class File(Base):
     def has_parent(self):
         return self.parent is not None
 
+    @hybrid_property
+    def materialized_path(self):
+        """human readable path below the provider, as used in logs. e.g. /folder/file.txt or /folder/"""
+        if not self.has_parent:
+            return '/'
+        path = '{}{}'.format(self.parent.materialized_path, self.name)
+        if self.is_folder:
+            path += '/'
+        return path
+
     @hybrid_property
     def is_provider(self):
         return self.is_folder and not self.has_parent
@@ -327,4 +343,39 @@ class File(Base):
         )
 
 
+class Log(Base):
+    __tablename__ = "log"
 
+    id = Column(Integer, primary_key=True)
+    action = Column(String, nullable=False)
+    date = Column(DateTime, default=datetime.datetime.utcnow)
+    params = Column(String, default='{}')  # json
+
+    node_id = Column(Integer, ForeignKey('node.id'), nullable=False)
+
+    def as_dict(self):
+        return {
+            "id": str(self.id),
+            "type": "logs",
+            "attributes": {
+                "action": self.action,
+                "date": self.date.isoformat(),
+                "params": json.loads(self.params)
+            },
+            "relationships": {
+                "nodes": {
+                    "links": {
+                        "related": {
+                            "href": "http://localhost:5000/v2/nodes/{}/".format(self.node_id),
+                            "meta": {}
+                        }
+                    }
+                }
+            },
+            "links": {}
+        }
+
+    def __repr__(self):
+        return "<Log ({}), action={}, date={}, node_id={}>".format(
+            self.id, self.action, self.date, self.node_id
+        )
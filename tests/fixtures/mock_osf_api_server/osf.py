@@ -1,5 +1,8 @@
-from tests.fixtures.mock_osf_api_server.models import User, Node, File
-from flask import Flask, jsonify, request, make_response
+import hashlib
+import itertools
+import json
+from tests.fixtures.mock_osf_api_server.models import User, Node, File, Log
+from flask import Flask, jsonify, request, make_response, url_for
 from tests.fixtures.mock_osf_api_server.utils import (
     session,
     must_be_logged_in,
@@ -17,7 +20,7 @@ def paginate_response(data):
     :param data:
     :return:
     """
-    return jsonify({
+    response = jsonify({
         "data":data,
         "links": {
             "first": None,
@@ -30,6 +33,73 @@ def paginate_response(data):
             }
         }
     })
+    # emit an ETag so clients can make conditional requests. answers 304 if If-None-Match matches.
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def add_log(node, action, **params):
+    """record an action in the node's log, the way the osf does. params describe files by materialized path."""
+    params['node'] = str(node.id)
+    save(Log(node=node, action=action, params=json.dumps(params)))
+
+
+def file_log_params(file_folder):
+    return {'materialized': file_folder.materialized_path, 'node': {'_id': str(file_folder.node_id)}}
+
+
+def create_file_folder(parent, provider, kind, name, contents):
+    new_file_folder = File(
+        type=File.FOLDER if kind == 'folder' else File.FILE,
+        node=parent.node,
+        user=parent.user,
+        parent=parent,
+        name=name,
+        provider=provider,
+        contents=contents
+    )
+    save(new_file_folder)
+    session.refresh(new_file_folder)
+    add_log(
+        new_file_folder.node,
+        'osf_storage_folder_created' if kind == 'folder' else 'osf_storage_file_added',
+        path=new_file_folder.materialized_path
+    )
+    return new_file_folder
+
+
+RANGE_NOT_SATISFIABLE = 'not satisfiable'
+
+
+def requested_range(range_header, length):
+    """
+    (first byte, last byte) of a single range Range header, RANGE_NOT_SATISFIABLE if it starts after the content,
+    or None if there is no such header.
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, last = range_header[len('bytes='):].split('-')
+    if not first:
+        # the last n bytes
+        first, last = max(0, length - int(last)), length - 1
+    else:
+        first = int(first)
+        last = min(int(last), length - 1) if last else length - 1
+    if first >= length or first > last:
+        return RANGE_NOT_SATISFIABLE
+    return first, last
+
+
+# upload id -> the resumable upload. see osfoffline/polling_osf_manager/transfers.py for the protocol.
+resumable_uploads = {}
+upload_ids = itertools.count(1)
+
+
+def upload_status(upload):
+    response = make_response('', 308)
+    if upload['received']:
+        response.headers['Range'] = 'bytes=0-{}'.format(len(upload['received']) - 1)
+    return response
 
 
 @app.route("/v2/users/", methods=['POST']) # create user
@@ -68,6 +138,7 @@ def node(node_id=None):
         node.files.append(provider)
         save(node)
         save(provider)
+        add_log(node, 'project_created')
         session.refresh(node)
     elif request.method =='GET':
         node = session.query(Node).filter(Node.user==get_user() and Node.id==node_id).one()
@@ -75,6 +146,13 @@ def node(node_id=None):
 
 
 
+@app.route("/v2/nodes/<node_id>/logs/", methods=['GET'])  # node's logs, newest first
+@must_be_logged_in
+def node_logs(node_id):
+    logs = session.query(Log).filter(Log.node_id == node_id).order_by(Log.date.desc(), Log.id.desc()).all()
+    return paginate_response([log.as_dict() for log in logs])
+
+
 @app.route("/v2/users/<user_id>/nodes/", methods=['GET'])  # user's nodes
 @must_be_logged_in
 def user_nodes(user_id):
@@ -83,6 +161,8 @@ def user_nodes(user_id):
         user = get_user()
         assert str(user_id) == str(user.id)
         users_nodes = session.query(Node).filter(Node.user == user).all()
+        if request.args.get('filter[parent]') == 'null':
+            users_nodes = [node for node in users_nodes if node.top_level]
         return paginate_response([node.as_dict() for node in users_nodes])
 
 @app.route("/v2/nodes/<node_id>/files/", methods=['GET'])  # node's files
@@ -140,7 +220,7 @@ def files(file_id):
         save(file_folder)
     return paginate_response(file_folder.as_dict())
 
-@app.route("/v1/resources/<node_id>/providers/<provider>/", methods=['GET','PUT']) # get list of things in provider folder, upload to provider folder
+@app.route("/v1/resources/<node_id>/providers/<provider>/", methods=['GET','PUT','POST']) # get list of things in provider folder, upload to provider folder
 @app.route("/v1/resources/<node_id>/providers/<provider>/<file_id>/", methods=['PUT','POST', 'GET', 'DELETE'])  # download file, update existing file, move/rename file/folder
 @must_be_logged_in
 def resources(node_id, provider, file_id=None):
@@ -151,26 +231,38 @@ def resources(node_id, provider, file_id=None):
     if request.method=='GET': # download
         assert file_folder.is_file
         #make it so that the returned content is actually downloadable.
-        content = file_folder.contents
-        response = make_response(content)
+        content = file_folder.contents or b''
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+        # a range is only sent if the client still has the same version of the file, or does not ask about it.
+        byte_range = None
+        if request.if_range.etag is None or request.if_range.etag == etag.strip('"'):
+            byte_range = requested_range(request.headers.get('Range'), len(content))
+        if byte_range == RANGE_NOT_SATISFIABLE:
+            response = make_response('', 416)
+            response.headers['Content-Range'] = 'bytes */{}'.format(len(content))
+        elif byte_range is not None:
+            first, last = byte_range
+            response = make_response(content[first:last + 1], 206)
+            response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(first, last, len(content))
+        else:
+            response = make_response(content)
+        response.headers['ETag'] = etag
+        response.headers['Accept-Ranges'] = 'bytes'
         # Set the right header for the response
         response.headers["Content-Disposition"] = "attachment; filename={}".format(file_folder.name)
         return response
     elif request.method == 'PUT': # upload new file, upload new folder, update existing file
         if file_folder.is_folder: # upload new file, upload new folder
-            parent = file_folder
             kind = request.args.get('kind','file')
-            new_file_folder = File(
-                type=File.FOLDER if kind == 'folder' else File.FILE,
-                node=parent.node,
-                user=parent.user,
-                parent=parent,
-                name=request.args.get('name'),
-                provider=provider,
-                contents=request.get_data() if kind == 'file' else None
+            new_file_folder = create_file_folder(
+                file_folder,
+                provider,
+                kind,
+                request.args.get('name'),
+                request.get_data() if kind == 'file' else None
             )
-            save(new_file_folder)
-            session.refresh(new_file_folder)
             return paginate_response(new_file_folder.as_dict())
         else: # update existing file
             assert request.args.get('kind') == 'file'
@@ -180,13 +272,29 @@ def resources(node_id, provider, file_id=None):
             file_folder.content = request.get_data()
             file_folder.name = request.args.get('name')
             session.refresh(file_folder)
+            add_log(file_folder.node, 'osf_storage_file_updated', path=file_folder.materialized_path)
             return paginate_response(file_folder.as_dict())
+    elif request.method == 'POST' and request.args.get('uploadType') == 'resumable': # start a resumable upload
+        assert file_folder.is_folder
+        upload_id = str(next(upload_ids))
+        resumable_uploads[upload_id] = {
+            'parent_id': file_folder.id,
+            'provider': provider,
+            'name': request.args.get('name'),
+            'size': int(request.headers['X-Upload-Content-Length']),
+            'received': bytearray(),
+        }
+        response = make_response('', 201)
+        response.headers['Location'] = url_for('resumable_upload', upload_id=upload_id, _external=True)
+        return response
     elif request.method=='POST': # rename, move
         assert file_folder.has_parent
+        source = file_log_params(file_folder)
         if request.json['action'] == 'rename':
             file_folder.name = request.json['rename']
             save(file_folder)
             session.refresh(file_folder)
+            add_log(file_folder.node, 'addon_file_renamed', source=source, destination=file_log_params(file_folder))
             return paginate_response(file_folder.as_dict())
         elif request.json['action'] == 'move':
             new_parent_id = request.json['path'].split('/')[1]
@@ -198,17 +306,37 @@ def resources(node_id, provider, file_id=None):
 
             save(file_folder)
             session.refresh(file_folder)
+            add_log(file_folder.node, 'addon_file_moved', source=source, destination=file_log_params(file_folder))
             return paginate_response(file_folder.as_dict())
     elif request.method=='DELETE':
+        add_log(file_folder.node, 'osf_storage_file_removed', path=file_folder.materialized_path)
         session.query(File).filter(File.id==file_id and File.user==get_user()).delete()
         #todo: unclear what to return in this case right now.
         return jsonify({'success':'true'})
 
 
+@app.route("/v1/uploads/<upload_id>/", methods=['PUT'])  # send a chunk of a resumable upload, or ask for its status
+@must_be_logged_in
+def resumable_upload(upload_id):
+    upload = resumable_uploads[upload_id]
+    content_range = request.headers['Content-Range']
+    assert content_range.startswith('bytes ')
+    byte_range, size = content_range[len('bytes '):].split('/')
+    assert int(size) == upload['size']
+    if byte_range != '*':
+        first, last = (int(position) for position in byte_range.split('-'))
+        chunk = request.get_data()
+        assert len(chunk) == last - first + 1
+        # a chunk that does not continue where the upload is gets the status, so the client can continue from there.
+        if first != len(upload['received']):
+            return upload_status(upload)
+        upload['received'].extend(chunk)
+    if len(upload['received']) < upload['size']:
+        return upload_status(upload)
 
-
-
-
-
-
-
+    del resumable_uploads[upload_id]
+    parent = session.query(File).filter(File.id == upload['parent_id']).one()
+    new_file = create_file_folder(parent, upload['provider'], 'file', upload['name'], bytes(upload['received']))
+    response = paginate_response(new_file.as_dict())
+    response.status_code = 201
+    return response
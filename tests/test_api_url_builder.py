@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from furl import furl
+
+from osfoffline.polling_osf_manager.api_url_builder import api_url_for, with_listing_params, USERS, NODES, FILES
+from osfoffline.settings import API_BASE
+
+
+class TestApiUrlFor(TestCase):
+
+    def test_plain_url_unchanged(self):
+        self.assertEqual(api_url_for(USERS, related_type=NODES, user_id='abcde'), API_BASE + '/v2/users/abcde/nodes/')
+
+    def test_provider_listing(self):
+        self.assertEqual(
+            api_url_for(NODES, related_type=FILES, node_id='abcde', provider='osfstorage'),
+            API_BASE + '/v2/nodes/abcde/files/osfstorage/'
+        )
+        self.assertEqual(
+            api_url_for(NODES, related_type=FILES, node_id='abcde', provider='osfstorage', file_id='123'),
+            API_BASE + '/v2/nodes/abcde/files/osfstorage/123/'
+        )
+
+    def test_listing_params(self):
+        url = furl(api_url_for(
+            USERS,
+            related_type=NODES,
+            user_id='abcde',
+            filters={'parent': 'null'},
+            fields={NODES: ['title', 'category']},
+            page_size=100
+        ))
+        self.assertEqual(str(url.path), '/v2/users/abcde/nodes/')
+        self.assertEqual(url.args['filter[parent]'], 'null')
+        self.assertEqual(url.args['fields[nodes]'], 'title,category')
+        self.assertEqual(url.args['page[size]'], '100')
+
+
+class TestWithListingParams(TestCase):
+
+    def test_replaces_existing_params(self):
+        url = furl(with_listing_params('http://localhost:5000/v2/nodes/abcde/children/?page[size]=10&page=2', page_size=50))
+        self.assertEqual(url.args['page[size]'], '50')
+        self.assertEqual(url.args['page'], '2')
@@ -0,0 +1,297 @@
+import asyncio
+import json
+from unittest import TestCase, mock
+
+import aiohttp
+
+from osfoffline.database_manager.models import File
+from osfoffline.polling_osf_manager import polling
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.instrumentation import CycleStats
+from osfoffline.polling_osf_manager.remote_objects import RemoteLog, page_to_remote_objects
+from tests.fixtures.fake_query import file_dict, utc
+from tests.fixtures.fake_query import log_dict as fake_log_dict
+from tests.fixtures.mock_osf_api_server.osf import app
+from tests.test_poll_walk import PollTestCase, PROJECT
+
+
+def log_dict(action, **params):
+    return {
+        'id': '1',
+        'type': 'logs',
+        'attributes': {'action': action, 'date': '2015-10-21T07:28:00.000000', 'params': params},
+    }
+
+
+class TestRemoteLog(TestCase):
+
+    def test_file_action(self):
+        log = RemoteLog(log_dict('osf_storage_file_added', path='/folder/file.txt'))
+        self.assertEqual(log.name, 'osf_storage_file_added')
+        self.assertEqual(log.materialized_paths, ['/folder/file.txt'])
+        self.assertTrue(log.describes_file_folders)
+        self.assertEqual(log.date.year, 2015)
+
+    def test_move_within_node(self):
+        log = RemoteLog(log_dict(
+            'addon_file_moved',
+            source={'materialized': '/a/file.txt', 'node': {'_id': 'abcde'}},
+            destination={'materialized': '/b/file.txt', 'node': {'_id': 'abcde'}}
+        ))
+        self.assertEqual(log.materialized_paths, ['/a/file.txt', '/b/file.txt'])
+        self.assertTrue(log.describes_file_folders)
+
+    def test_move_between_nodes_is_not_described(self):
+        log = RemoteLog(log_dict(
+            'addon_file_moved',
+            source={'materialized': '/a/file.txt', 'node': {'_id': 'abcde'}},
+            destination={'materialized': '/file.txt', 'node': {'_id': 'fghij'}}
+        ))
+        self.assertFalse(log.describes_file_folders)
+
+    def test_node_action_is_not_described(self):
+        log = RemoteLog(log_dict('node_created'))
+        self.assertFalse(log.describes_file_folders)
+        self.assertNotIn(log.name, RemoteLog.IGNORED_ACTIONS)
+
+    def test_page_to_remote_objects(self):
+        logs = page_to_remote_objects([log_dict('wiki_updated'), log_dict('osf_storage_file_removed', path='/x')])
+        self.assertEqual([type(log) for log in logs], [RemoteLog, RemoteLog])
+
+
+class TestMockServerLogs(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        resp = self.client.post('/v2/users/', data={'fullname': 'log user'})
+        user_id = json.loads(resp.data.decode())['data']['id']
+        self.headers = {'Authorization': 'Bearer {}'.format(user_id), 'Content-Type': 'application/json'}
+        body = {'data': {'type': 'nodes', 'attributes': {'title': 'log project', 'category': 'project'}}}
+        resp = self.client.post('/v2/nodes/', data=json.dumps(body), headers=self.headers)
+        self.node_id = json.loads(resp.data.decode())['data']['id']
+
+    def get_logs(self):
+        resp = self.client.get('/v2/nodes/{}/logs/'.format(self.node_id), headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        return [RemoteLog(log) for log in json.loads(resp.data.decode())['data']]
+
+    def test_created_node_has_log(self):
+        logs = self.get_logs()
+        self.assertEqual([log.name for log in logs], ['project_created'])
+
+    def test_file_changes_are_logged_newest_first(self):
+        url = '/v1/resources/{}/providers/osfstorage/'.format(self.node_id)
+        self.client.put(url + '?kind=folder&name=folder', headers=self.headers)
+        self.client.put(url + '?kind=file&name=file.txt', data=b'contents', headers=self.headers)
+
+        logs = self.get_logs()
+        self.assertEqual(
+            [log.name for log in logs],
+            ['osf_storage_file_added', 'osf_storage_folder_created', 'project_created']
+        )
+        self.assertEqual(logs[0].materialized_paths, ['/file.txt'])
+        self.assertEqual(logs[1].materialized_paths, ['/folder/'])
+        self.assertGreaterEqual(logs[0].date, logs[1].date)
+
+
+class LogPages(object):
+    """Serves pages of log entries, in order, to OSFQuery.get_node_logs"""
+    def __init__(self, *pages):
+        self.pages = list(pages)
+        self.stats = CycleStats()
+
+    @asyncio.coroutine
+    def make_request(self, url, get_json=False):
+        page = self.pages.pop(0)
+        return {'data': page, 'links': {'next': 'next' if self.pages else None}}
+
+
+class TestGetNodeLogs(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.cursor = utc(2015, 10, 21, 7)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def get_node_logs(self, query, since_ids, max_logs=10):
+        return self.loop.run_until_complete(OSFQuery.get_node_logs(query, 'node', self.cursor, since_ids, max_logs))
+
+    def test_entries_at_the_cursor_are_deduplicated_by_id(self):
+        query = LogPages([
+            fake_log_dict('new', 'wiki_updated', utc(2015, 10, 21, 8)),
+            fake_log_dict('tie', 'wiki_updated', self.cursor),
+            fake_log_dict('known', 'wiki_updated', self.cursor),
+            fake_log_dict('old', 'wiki_updated', utc(2015, 10, 21, 6)),
+        ])
+        self.assertEqual([log.id for log in self.get_node_logs(query, ['known'])], ['new', 'tie'])
+
+    def test_entries_at_the_cursor_on_the_next_page(self):
+        query = LogPages(
+            [fake_log_dict('known', 'wiki_updated', self.cursor)],
+            [fake_log_dict('tie', 'wiki_updated', self.cursor), fake_log_dict('old', 'wiki_updated', utc(2015, 1, 1))],
+        )
+        self.assertEqual([log.id for log in self.get_node_logs(query, ['known'])], ['tie'])
+
+    def test_too_many_entries(self):
+        query = LogPages([fake_log_dict(str(hour), 'wiki_updated', utc(2015, 10, 21, hour)) for hour in (10, 9, 8)])
+        self.assertIsNone(self.get_node_logs(query, [], max_logs=2))
+
+
+class ChangeFeedTestCase(PollTestCase):
+    """A PollTestCase whose project was walked once with the change feed on."""
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(polling, 'POLL_CHANGE_FEED', True),
+            mock.patch.object(polling, 'POLL_CHANGE_FEED_MAX_LOGS', 2),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.query.add_log(PROJECT, 'created', 'project_created', utc(2015, 10, 21, 7))
+        self.walk(full_walk=True)
+
+    def remote_change(self, log_id, action, date, **params):
+        """Log an action on the project. The osf updates the date_modified of the node with it."""
+        self.query.add_log(PROJECT, log_id, action, date, **params)
+        self.remote_node = self.query.add_node(PROJECT, 'project', date_modified=date.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+
+    def file_names(self):
+        return sorted(file_folder.name for file_folder in self.session.query(File))
+
+
+class TestLogCursor(ChangeFeedTestCase):
+
+    def test_walk_records_the_cursor(self):
+        local_node = self.local_node()
+        self.assertEqual(local_node.log_cursor, self.poll._as_naive_utc(utc(2015, 10, 21, 7)))
+        self.assertEqual(local_node.log_cursor_ids, ['created'])
+
+    def test_failed_walk_records_no_cursor(self):
+        self.remote_change('tagged', 'tag_added', utc(2015, 10, 21, 8))
+        self.query.failing.add('folder')
+        self.walk(full_walk=True)
+        self.assertEqual(self.local_node().log_cursor_ids, ['created'])
+
+    def test_unchanged_node_keeps_its_cursor_without_a_request(self):
+        self.walk(full_walk=True)
+        self.assertIn(('get_child_files', PROJECT), self.query.listed)
+        self.assertNotIn(('get_log_cursor', PROJECT), self.query.listed)
+        self.assertEqual(self.local_node().log_cursor_ids, ['created'])
+
+    def test_changed_node_reads_its_cursor(self):
+        self.remote_change('tagged', 'tag_added', utc(2015, 10, 21, 8))
+        self.walk(full_walk=True)
+        self.assertIn(('get_log_cursor', PROJECT), self.query.listed)
+        self.assertEqual(self.local_node().log_cursor_ids, ['tagged'])
+
+    def test_cursor_keeps_the_entries_at_its_date(self):
+        self.remote_change('tagged', 'tag_added', utc(2015, 10, 21, 7))
+        self.walk(full_walk=False)
+        self.assertEqual(sorted(self.local_node().log_cursor_ids), ['created', 'tagged'])
+
+
+class TestCheckNodeChanges(ChangeFeedTestCase):
+
+    def test_new_file_rechecks_its_folder_only(self):
+        self.query.add('folder', file_dict('new', 'new.txt'))
+        self.remote_change('added', 'osf_storage_file_added', utc(2015, 10, 21, 8), path='/folder/new.txt')
+        self.walk(full_walk=False)
+
+        self.assertIn(('iter_child_files', 'folder'), self.query.listed)
+        self.assertNotIn(('get_child_files', PROJECT), self.query.listed)
+        self.assertEqual(self.file_names(), ['file.txt', 'folder', 'new.txt'])
+        self.assertEqual(self.local_node().log_cursor_ids, ['added'])
+
+    def test_entry_at_the_cursor_date_is_synced(self):
+        self.query.add('folder', file_dict('new', 'new.txt'))
+        self.remote_change('added', 'osf_storage_file_added', utc(2015, 10, 21, 7), path='/folder/new.txt')
+        self.walk(full_walk=False)
+        self.assertEqual(self.file_names(), ['file.txt', 'folder', 'new.txt'])
+
+    def test_no_new_entries(self):
+        self.walk(full_walk=False)
+        self.assertEqual(self.query.listed, [('get_node_logs', PROJECT)])
+
+    def test_too_many_entries_walk_the_node(self):
+        for hour in (8, 9, 10):
+            self.remote_change(str(hour), 'tag_added', utc(2015, 10, 21, hour))
+        self.walk(full_walk=False)
+        self.assertIn(('get_child_files', PROJECT), self.query.listed)
+        self.assertEqual(self.local_node().log_cursor_ids, ['10'])
+
+    def test_entry_that_is_not_about_files_walks_the_node(self):
+        self.remote_change('component', 'node_created', utc(2015, 10, 21, 8))
+        self.walk(full_walk=False)
+        self.assertIn(('get_child_files', PROJECT), self.query.listed)
+
+    def test_node_without_cursor_is_walked(self):
+        local_node = self.local_node()
+        local_node.log_cursor = None
+        self.session.commit()
+        self.remote_change('tagged', 'tag_added', utc(2015, 10, 21, 8))
+        self.walk(full_walk=False)
+        self.assertNotIn(('get_node_logs', PROJECT), self.query.listed)
+        self.assertIn(('get_child_files', PROJECT), self.query.listed)
+        self.assertEqual(self.local_node().log_cursor_ids, ['tagged'])
+
+
+class TestRecheckFolder(ChangeFeedTestCase):
+
+    def recheck(self, local_folder):
+        self.query.listed = []
+        self.poll.traversal.push(self.poll._recheck_folder, self.local_node(), local_folder)
+        self.loop.run_until_complete(self.poll.traversal.run())
+
+    def test_child_folders_are_not_descended_into(self):
+        self.recheck(None)
+        self.assertEqual(self.query.listed, [('iter_child_files', PROJECT)])
+
+    def test_new_children_are_created(self):
+        self.query.add(PROJECT, file_dict('top', 'top.txt'))
+        self.recheck(None)
+        self.assertEqual(self.file_names(), ['file.txt', 'folder', 'top.txt'])
+
+    def test_deleted_folder_is_an_error_of_the_walk(self):
+        self.query.failing.add('folder')
+        self.query.failure = lambda message: aiohttp.errors.HttpBadRequest(message=message)
+        self.poll._walk_errors = 0
+        folder = self.session.query(File).filter(File.name == 'folder').one()
+        self.recheck(folder)
+        self.assertEqual(self.poll._walk_errors, 1)
+
+
+class TestLocallyChangedFolders(ChangeFeedTestCase):
+
+    def test_no_changes(self):
+        self.assertEqual(self.poll._locally_changed_folders(self.local_node()), [])
+
+    def test_changed_file(self):
+        changed = self.session.query(File).filter(File.name == 'file.txt').one()
+        changed.locally_renamed = True
+        self.session.commit()
+        self.assertEqual(
+            [folder.name for folder in self.poll._locally_changed_folders(self.local_node())],
+            ['folder']
+        )
+
+    def test_changed_top_level_folder(self):
+        changed = self.session.query(File).filter(File.name == 'folder').one()
+        changed.locally_renamed = True
+        self.session.commit()
+        self.assertEqual(self.poll._locally_changed_folders(self.local_node()), [None])
+
+    def test_new_folder_is_listed_from_the_nearest_folder_on_the_osf(self):
+        local_node = self.local_node()
+        folder = self.session.query(File).filter(File.name == 'folder').one()
+        new_folder = File(name='new', type=File.FOLDER, user=self.user, node=local_node, parent=folder,
+                          locally_created=True)
+        new_file = File(name='new.txt', type=File.FILE, user=self.user, node=local_node, parent=new_folder,
+                        locally_created=True)
+        self.session.add_all([new_folder, new_file])
+        self.session.commit()
+        self.assertEqual(
+            [changed.name for changed in self.poll._locally_changed_folders(local_node)],
+            ['folder', 'folder']
+        )
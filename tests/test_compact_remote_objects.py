@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+import iso8601
+
+from osfoffline.polling_osf_manager.remote_objects import RemoteFile, RemoteFolder, RemoteNode, page_to_remote_objects
+
+
+def node_dict(id, date_modified='2015-07-24T19:35:16.502000'):
+    return {
+        'id': id,
+        'type': 'nodes',
+        'attributes': {'title': 'node {}'.format(id), 'category': 'project', 'date_modified': date_modified},
+        'relationships': {
+            'files': {'links': {'related': {'href': 'http://localhost:8000/v2/nodes/{}/files/'.format(id)}}},
+            'parent': {'links': {'related': {'href': None}}},
+            'children': {'links': {'related': {'href': 'http://localhost:8000/v2/nodes/{}/children/'.format(id)}}},
+        },
+    }
+
+
+def file_dict(id, kind='file'):
+    links = {'move': 'http://localhost:7777/move', 'delete': 'http://localhost:7777/delete', 'upload': 'http://localhost:7777/upload'}
+    if kind == 'file':
+        links['download'] = 'http://localhost:7777/download'
+    else:
+        links['new_folder'] = 'http://localhost:7777/new_folder'
+    return {
+        'id': 'osfstorage/{}'.format(id),
+        'type': 'files',
+        'attributes': {'name': 'file {}'.format(id), 'provider': 'osfstorage', 'kind': kind, 'size': 10},
+        'relationships': {'files': {'links': {'related': {'href': 'http://localhost:8000/v2/files/{}/'.format(id)}}}},
+        'links': links,
+    }
+
+
+class TestCompactRemoteObjects(TestCase):
+
+    def test_no_instance_dict(self):
+        for remote in (RemoteNode(node_dict('abcde')), RemoteFile(file_dict('1')), RemoteFolder(file_dict('2', 'folder'))):
+            self.assertFalse(hasattr(remote, '__dict__'))
+            remote.validate()
+
+    def test_last_modified_is_parsed_on_demand(self):
+        node = RemoteNode(node_dict('abcde', date_modified='not a date'))
+        self.assertEqual(node.id, 'abcde')
+        with self.assertRaises(iso8601.ParseError):
+            node.last_modified
+
+        node = RemoteNode(node_dict('abcde'))
+        self.assertEqual(node.last_modified.year, 2015)
+        self.assertIs(node.last_modified, node.last_modified)
+
+    def test_page_to_remote_objects(self):
+        remote_objects = page_to_remote_objects([file_dict('1'), file_dict('2', 'folder'), node_dict('abcde')])
+        self.assertEqual([type(remote) for remote in remote_objects], [RemoteFile, RemoteFolder, RemoteNode])
+        self.assertEqual(remote_objects[0].id, '1')
+        self.assertEqual(remote_objects[1].child_files_url, 'http://localhost:8000/v2/files/2/')
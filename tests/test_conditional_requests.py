@@ -0,0 +1,147 @@
+import asyncio
+import json
+from unittest import TestCase
+
+from osfoffline.database_manager.models import HttpValidator
+from osfoffline.database_manager.utils import UnitOfWork
+from osfoffline.polling_osf_manager.osf_query import OSFQuery, NOT_MODIFIED
+from osfoffline.polling_osf_manager.transport import Transport
+from osfoffline.polling_osf_manager.validator_cache import ValidatorCache
+from tests.fixtures.factories import common
+from tests.fixtures.mock_osf_api_server.osf import app
+
+
+class ValidatorCacheTestCase(TestCase):
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.session = common.Session()
+        self.unit_of_work = UnitOfWork(self.session, self._loop)
+        self.cache = ValidatorCache(self.session, self.unit_of_work)
+        self.url = 'http://localhost:5000/v2/nodes/1/children/'
+        self.page = {'data': [], 'links': {'next': None}}
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(HttpValidator).delete()
+        self.session.commit()
+        common.Session.remove()
+        self._loop.close()
+
+
+class TestValidatorCache(ValidatorCacheTestCase):
+
+    def test_nothing_cached(self):
+        self.assertEqual(self.cache.headers_for(self.url), {})
+        self.assertIsNone(self.cache.cached_json(self.url))
+
+    def test_store_and_replay(self):
+        self.cache.store(self.url, {'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}, self.page)
+
+        self.assertEqual(self.cache.headers_for(self.url), {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'
+        })
+        self.assertEqual(self.cache.cached_json(self.url), self.page)
+
+    def test_response_without_validators_is_forgotten(self):
+        self.cache.store(self.url, {'ETag': '"abc"'}, self.page)
+        self.cache.store(self.url, {}, self.page)
+
+        self.assertEqual(self.cache.headers_for(self.url), {})
+        self.assertEqual(self.session.query(HttpValidator).count(), 0)
+
+    def test_changes_are_committed_with_the_next_batch(self):
+        self.cache.store(self.url, {'ETag': '"abc"'}, self.page)
+        self.cache.forget(self.url)
+        self.assertEqual(self.unit_of_work.commits, 0)
+        self.assertEqual(self.unit_of_work.pending, 2)
+        self.unit_of_work.flush()
+        self.assertEqual(self.unit_of_work.commits, 1)
+
+
+class FakeJsonResponse(object):
+    def __init__(self, status, headers=None, body=None):
+        self.status = status
+        self.headers = headers or {}
+        self.body = json.dumps(body).encode('utf-8') if body is not None else b''
+
+    @asyncio.coroutine
+    def read(self):
+        return self.body
+
+    def close(self):
+        pass
+
+
+class TestConditionalMakeRequest(ValidatorCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport = Transport(self._loop)
+        self.osf_query = OSFQuery(self._loop, 'token', transport=self.transport)
+        self.osf_query.validator_cache = self.cache
+        self.osf_query._send = self.send
+        # (answer, function called before it is given) in order
+        self.answers = []
+        self.sent_headers = []
+
+    def tearDown(self):
+        self.transport.close()
+        super().tearDown()
+
+    @asyncio.coroutine
+    def send(self, url, method, params, data, headers, timeout):
+        self.sent_headers.append(headers or {})
+        answer, before = self.answers.pop(0)
+        if before is not None:
+            before()
+        return answer
+
+    def get(self):
+        return self._loop.run_until_complete(self.osf_query.make_request(self.url, get_json=True))
+
+    def test_not_modified_page_is_replayed_from_the_cache(self):
+        self.answers = [
+            (FakeJsonResponse(200, {'ETag': '"abc"'}, self.page), None),
+            (FakeJsonResponse(NOT_MODIFIED), None),
+        ]
+        self.assertEqual(self.get(), self.page)
+        self.assertEqual(self.get(), self.page)
+        self.assertEqual(self.sent_headers[1], {'If-None-Match': '"abc"'})
+
+    def test_asks_again_when_the_cached_page_disappeared(self):
+        self.cache.store(self.url, {'ETag': '"abc"'}, {'data': ['old'], 'links': {'next': None}})
+        validator = self.session.query(HttpValidator).one()
+
+        def lose_cached_page():
+            validator.body = None
+
+        self.answers = [
+            (FakeJsonResponse(NOT_MODIFIED), lose_cached_page),
+            (FakeJsonResponse(200, {'ETag': '"def"'}, self.page), None),
+        ]
+        self.assertEqual(self.get(), self.page)
+        self.assertEqual(self.sent_headers, [{'If-None-Match': '"abc"'}, {}])
+        self.assertEqual(self.cache.headers_for(self.url), {'If-None-Match': '"def"'})
+
+
+class TestMockServerValidators(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        resp = self.client.post('/v2/users/', data={'fullname': 'etag user'})
+        user_id = json.loads(resp.data.decode())['data']['id']
+        self.headers = {'Authorization': 'Bearer {}'.format(user_id)}
+        self.url = '/v2/users/{}/'.format(user_id)
+
+    def test_emits_etag(self):
+        resp = self.client.get(self.url, headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers.get('ETag'))
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url, headers=self.headers).headers['ETag']
+        headers = dict(self.headers, **{'If-None-Match': etag})
+
+        resp = self.client.get(self.url, headers=headers)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
@@ -0,0 +1,211 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from watchdog.events import (
+    FileModifiedEvent, FileCreatedEvent, FileDeletedEvent, FileMovedEvent, DirDeletedEvent
+)
+
+from osfoffline.database_manager.models import User
+from osfoffline.filesystem_manager import osf_event_handler
+from osfoffline.filesystem_manager.echo_suppression import (
+    EchoRegistry, fingerprint, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED
+)
+from osfoffline.polling_osf_manager.transfers import part_path
+from tests.fixtures.factories import common
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestEchoRegistry(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.registry = EchoRegistry(timeout=10, clock=self.clock)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_tree(self, *rel_paths):
+        """Create the files at rel_paths below self.dir, with their folders."""
+        for rel_path in rel_paths:
+            path = os.path.join(self.dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fd:
+                fd.write(b'contents')
+
+    def test_exact_path(self):
+        self.registry.expect(EVENT_TYPE_CREATED, '/osf/project/folder/')
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_DELETED, '/osf/project/folder'))
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_CREATED, '/osf/project/folder/file.txt'))
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_CREATED, '/osf/project/folder'))
+
+    def test_exact_path_is_used_up(self):
+        self.registry.expect(EVENT_TYPE_DELETED, '/osf/project/file.txt')
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_DELETED, '/osf/project/file.txt'))
+        # the user deletes a file of the same name afterwards
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_DELETED, '/osf/project/file.txt'))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_tree(self):
+        self.make_tree('folder/sub/file.txt', 'folder/other.txt')
+        folder = os.path.join(self.dir, 'folder')
+        self.registry.expect(EVENT_TYPE_DELETED, folder + os.sep, tree=True)
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_DELETED, os.path.join(self.dir, 'folder2', 'file.txt')))
+        for path in ('folder/sub/file.txt', 'folder/sub', 'folder/other.txt', 'folder'):
+            self.assertTrue(self.registry.is_echo(EVENT_TYPE_DELETED, os.path.join(self.dir, path)))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_tree_delete_leaves_later_deletes_to_the_user(self):
+        self.make_tree('folder/file.txt')
+        folder = os.path.join(self.dir, 'folder')
+        self.registry.expect(EVENT_TYPE_DELETED, folder, tree=True)
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_DELETED, os.path.join(folder, 'file.txt')))
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_DELETED, folder))
+        # the folder is made again and the user deletes a file in it
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_DELETED, os.path.join(folder, 'new.txt')))
+
+    def test_moved_tree(self):
+        self.make_tree('old/a/b.txt')
+        old = os.path.join(self.dir, 'old')
+        new = os.path.join(self.dir, 'new')
+        self.registry.expect(EVENT_TYPE_MOVED, old + os.sep, new + os.sep, tree=True)
+        self.assertFalse(self.registry.is_echo(
+            EVENT_TYPE_MOVED, os.path.join(old, 'b.txt'), os.path.join(self.dir, 'other', 'b.txt')
+        ))
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_MOVED, old, new))
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_MOVED, os.path.join(old, 'a'), os.path.join(new, 'a')))
+        self.assertTrue(self.registry.is_echo(
+            EVENT_TYPE_MOVED, os.path.join(old, 'a', 'b.txt'), os.path.join(new, 'a', 'b.txt')
+        ))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_expires(self):
+        self.registry.expect(EVENT_TYPE_DELETED, '/osf/project/file.txt')
+        self.clock.now = 11
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_DELETED, '/osf/project/file.txt'))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_renewed_registration_outlives_the_first(self):
+        self.registry.expect(EVENT_TYPE_DELETED, '/osf/project/file.txt')
+        self.clock.now = 5
+        self.registry.expect(EVENT_TYPE_DELETED, '/osf/project/file.txt')
+        self.clock.now = 11
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_DELETED, '/osf/project/file.txt'))
+
+    def test_file_written_by_the_engine(self):
+        path = os.path.join(self.dir, 'file.txt')
+        with open(path, 'wb') as fd:
+            fd.write(b'downloaded')
+        self.registry.expect_file(path, fingerprint(path))
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_MODIFIED, path))
+        self.assertTrue(self.registry.is_echo(EVENT_TYPE_CREATED, path))
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_MODIFIED, path))
+
+    def test_file_changed_by_the_user_before_the_echo(self):
+        path = os.path.join(self.dir, 'file.txt')
+        with open(path, 'wb') as fd:
+            fd.write(b'downloaded')
+        self.registry.expect_file(path, fingerprint(path))
+        with open(path, 'ab') as fd:
+            fd.write(b' and edited')
+        self.assertFalse(self.registry.is_echo(EVENT_TYPE_MODIFIED, path))
+
+
+class TestDispatch(TestCase):
+    """OSFEventHandler.dispatch, with the handlers it hands events to replaced by mocks."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.session = common.Session()
+        self.session.add(User(full_name='user', osf_local_folder_path=self.dir, logged_in=True))
+        self.session.commit()
+        self.registry = EchoRegistry(timeout=10)
+        for patcher in (
+            mock.patch.object(osf_event_handler, 'session', self.session),
+            mock.patch.object(osf_event_handler, 'echo_registry', self.registry),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # the handlers are called right away, and what they return is scheduled on the loop
+        self.handler = osf_event_handler.OSFEventHandler(self.dir, mock.Mock())
+        for name in ('on_any_event', 'on_modified', 'on_moved', 'on_created', 'on_deleted'):
+            setattr(self.handler, name, mock.Mock())
+        self.path = os.path.join(self.dir, 'file.txt')
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(User).delete()
+        self.session.commit()
+        common.Session.remove()
+        shutil.rmtree(self.dir)
+
+    def write(self, path, contents):
+        with open(path, 'ab') as fd:
+            fd.write(contents)
+
+    def handled(self, name):
+        """[(event type, src path)] of the events given to the handler called name"""
+        return [(call[0][0].event_type, call[0][0].src_path) for call in getattr(self.handler, name).call_args_list]
+
+    def test_user_change_is_handled(self):
+        self.handler.dispatch(FileModifiedEvent(self.path))
+        self.assertEqual(self.handled('on_modified'), [(EVENT_TYPE_MODIFIED, self.path)])
+        self.assertEqual(len(self.handled('on_any_event')), 1)
+
+    def test_echo_is_dropped_once(self):
+        self.registry.expect(EVENT_TYPE_DELETED, self.path)
+        self.handler.dispatch(FileDeletedEvent(self.path))
+        self.assertEqual(self.handled('on_deleted'), [])
+        # the user deletes a file of the same name afterwards
+        self.handler.dispatch(FileDeletedEvent(self.path))
+        self.assertEqual(self.handled('on_deleted'), [(EVENT_TYPE_DELETED, self.path)])
+
+    def test_tree_delete_is_dropped(self):
+        folder = os.path.join(self.dir, 'folder')
+        os.mkdir(folder)
+        self.write(os.path.join(folder, 'file.txt'), b'contents')
+        self.registry.expect(EVENT_TYPE_DELETED, folder, tree=True)
+        shutil.rmtree(folder)
+        self.handler.dispatch(FileDeletedEvent(os.path.join(folder, 'file.txt')))
+        self.handler.dispatch(DirDeletedEvent(folder))
+        self.assertEqual(self.handled('on_deleted'), [])
+
+        self.handler.dispatch(FileDeletedEvent(os.path.join(folder, 'new.txt')))
+        self.assertEqual(self.handled('on_deleted'), [(EVENT_TYPE_DELETED, os.path.join(folder, 'new.txt'))])
+
+    def test_staging_file_is_not_synced(self):
+        part = part_path(self.path)
+        self.handler.dispatch(FileCreatedEvent(part))
+        self.handler.dispatch(FileModifiedEvent(part))
+        self.assertEqual(self.handled('on_any_event'), [])
+
+    def test_download_moved_into_place_is_a_modify(self):
+        part = part_path(self.path)
+        self.write(part, b'downloaded')
+        os.replace(part, self.path)
+        self.handler.dispatch(FileMovedEvent(part, self.path))
+        self.assertEqual(self.handled('on_moved'), [])
+        self.assertEqual(self.handled('on_modified'), [(EVENT_TYPE_MODIFIED, self.path)])
+
+    def test_download_of_the_engine_is_dropped(self):
+        part = part_path(self.path)
+        self.write(part, b'downloaded')
+        self.registry.expect_file(self.path, fingerprint(part))
+        os.replace(part, self.path)
+        self.handler.dispatch(FileMovedEvent(part, self.path))
+        self.assertEqual(self.handled('on_any_event'), [])
+
+        # the user edits the file afterwards
+        self.write(self.path, b' and edited')
+        self.handler.dispatch(FileModifiedEvent(self.path))
+        self.assertEqual(self.handled('on_modified'), [(EVENT_TYPE_MODIFIED, self.path)])
@@ -0,0 +1,58 @@
+from unittest import TestCase
+import json
+
+from osfoffline.polling_osf_manager.instrumentation import (
+    CycleStats, endpoint_type, LISTING, EVENT_EXECUTION, metrics_logger
+)
+
+
+class FakeEvent(object):
+    pass
+
+
+class TestEndpointType(TestCase):
+    def test_api_urls(self):
+        self.assertEqual(endpoint_type('get', 'https://staging-api.osf.io/v2/users/abcde/'), 'GET users')
+        self.assertEqual(endpoint_type('GET', 'https://staging-api.osf.io/v2/users/abcde/nodes/'), 'GET users/nodes')
+        self.assertEqual(endpoint_type('GET', 'https://staging-api.osf.io/v2/nodes/abcde/children/'), 'GET nodes/children')
+        self.assertEqual(
+            endpoint_type('GET', 'https://staging-api.osf.io/v2/nodes/abcde/files/osfstorage/123/?page=2'),
+            'GET nodes/files'
+        )
+
+    def test_file_urls(self):
+        self.assertEqual(
+            endpoint_type('PUT', 'https://staging-files.osf.io/v1/resources/abcde/providers/osfstorage/123/'),
+            'PUT resources'
+        )
+
+
+class TestCycleStats(TestCase):
+    def test_record(self):
+        stats = CycleStats()
+        stats.count_request('GET', 'https://staging-api.osf.io/v2/nodes/abcde/children/', 100)
+        stats.count_request('GET', 'https://staging-api.osf.io/v2/nodes/fghij/children/', 50)
+        stats.count_event(FakeEvent())
+        with stats.timed(LISTING):
+            pass
+        stats.info['full_walk'] = True
+
+        record = stats.as_record()
+        self.assertEqual(record['requests'], {'GET nodes/children': 2})
+        self.assertEqual(record['total_requests'], 2)
+        self.assertEqual(record['response_bytes'], 150)
+        self.assertEqual(record['events'], {'FakeEvent': 1})
+        self.assertIn(LISTING, record['phase_seconds'])
+        self.assertNotIn(EVENT_EXECUTION, record['phase_seconds'])
+        self.assertTrue(record['info']['full_walk'])
+
+    def test_emit_logs_json_and_resets(self):
+        stats = CycleStats()
+        stats.count_request('GET', 'https://staging-api.osf.io/v2/users/abcde/', 10)
+
+        with self.assertLogs(metrics_logger, level='INFO') as logs:
+            stats.emit()
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['total_requests'], 1)
+        self.assertEqual(stats.as_record()['total_requests'], 0)
@@ -0,0 +1,83 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from osfoffline.database_manager.db import add_missing_columns, upgrade_db
+from osfoffline.database_manager.models import Base, Node, File
+
+BASELINE_SCHEMA = os.path.join(os.path.dirname(__file__), 'fixtures', 'baseline_schema.sql')
+
+
+class BaselineDbTestCase(TestCase):
+    """A db that the first released version made, with a project and a file in it."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        db_path = os.path.join(self.dir, 'osf.db')
+        connection = sqlite3.connect(db_path)
+        with open(BASELINE_SCHEMA) as fd:
+            connection.executescript(fd.read())
+        connection.close()
+        self.engine = create_engine('sqlite:///{}'.format(db_path))
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.dir)
+
+
+class TestAddMissingColumns(BaselineDbTestCase):
+
+    def upgrade(self):
+        added = add_missing_columns(self.engine)
+        Base.metadata.create_all(self.engine)
+        return added
+
+    def test_new_columns_are_added(self):
+        self.assertEqual(sorted(self.upgrade()), [
+            ('file', 'rel_path'),
+            ('node', 'log_cursor'),
+            ('node', 'log_cursor_ids'),
+            ('node', 'rel_path'),
+            ('node', 'remote_date_modified'),
+        ])
+        indexes = {row[0] for row in self.engine.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('ix_node_rel_path', indexes)
+        self.assertIn('ix_file_rel_path', indexes)
+
+    def test_old_rows_can_be_read(self):
+        self.upgrade()
+        session = sessionmaker(bind=self.engine)()
+        node = session.query(Node).one()
+        self.assertEqual(node.title, 'project')
+        self.assertIsNone(node.remote_date_modified)
+        self.assertIsNone(node.log_cursor)
+        self.assertEqual(session.query(File).count(), 2)
+        session.close()
+
+    def test_new_tables_are_made_by_create_all(self):
+        self.upgrade()
+        tables = {row[0] for row in self.engine.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertIn('http_validator', tables)
+
+    def test_up_to_date_db_is_left_alone(self):
+        self.upgrade()
+        self.assertEqual(self.upgrade(), [])
+
+
+class TestUpgradeDb(BaselineDbTestCase):
+
+    def stored_rel_paths(self, table):
+        return {row[0]: row[1] for row in self.engine.execute('SELECT id, rel_path FROM {}'.format(table))}
+
+    def test_old_rows_get_their_rel_path(self):
+        upgrade_db(self.engine)
+        self.assertEqual(self.stored_rel_paths('node'), {1: 'project'})
+        self.assertEqual(self.stored_rel_paths('file'), {
+            1: os.path.join('project', 'folder'),
+            2: os.path.join('project', 'folder', 'file.txt'),
+        })
@@ -2,7 +2,8 @@ __author__ = 'himanshu'
 
 from unittest import TestCase
 from osfoffline.polling_osf_manager.remote_objects import RemoteFile,RemoteFileFolder,RemoteObject,RemoteFolder,RemoteNode,RemoteUser
-from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.osf_query import OSFQuery, PageIterator
+from osfoffline.polling_osf_manager.instrumentation import CycleStats
 import asyncio
 from tests.utils.decorators import async
 from osfoffline.polling_osf_manager.api_url_builder import api_url_for, NODES, USERS, CHILDREN
@@ -22,4 +23,69 @@ class TestRemoteObjects(TestCase):
         url = api_url_for(NODES,related_type=CHILDREN, node_id=1)
         print(url)
         children = yield from self.osf_query._get_all_paginated_members(url)
-        self.assertEquals(children, [])
\ No newline at end of file
+        self.assertEquals(children, [])
+
+def folder_page(ids, next_url):
+    return {
+        'data': [
+            {
+                'id': 'osfstorage/{}'.format(id),
+                'type': 'files',
+                'attributes': {'name': id, 'provider': 'osfstorage', 'kind': 'folder'},
+                'relationships': {'files': {'links': {'related': {'href': 'http://localhost:5000/{}/'.format(id)}}}},
+                'links': {'upload': 'http://localhost:5000/upload', 'new_folder': 'http://localhost:5000/new_folder'},
+            }
+            for id in ids
+        ],
+        'links': {'next': next_url},
+    }
+
+
+class FakeOSFQuery(object):
+    def __init__(self, pages, loop):
+        self.pages = pages
+        self.requested = []
+        self.stats = CycleStats()
+        self._loop = loop
+
+    @asyncio.coroutine
+    def make_request(self, url, get_json=False):
+        self.requested.append(url)
+        yield from asyncio.sleep(0, loop=self._loop)
+        return self.pages[url]
+
+
+class TestPageIterator(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.osf_query = FakeOSFQuery({
+            'page1': folder_page(['a', 'b'], 'page2'),
+            'page2': folder_page(['c'], None),
+        }, self._loop)
+
+    def tearDown(self):
+        self._loop.close()
+
+    def test_pages_and_prefetch(self):
+        pages = PageIterator(self.osf_query, 'page1', self._loop)
+
+        @asyncio.coroutine
+        def read():
+            first = yield from pages.next_page()
+            # the second page is requested before the caller asks for it
+            yield from asyncio.sleep(0.01, loop=self._loop)
+            self.assertEqual(self.osf_query.requested, ['page1', 'page2'])
+            second = yield from pages.next_page()
+            done = yield from pages.next_page()
+            return first, second, done
+
+        first, second, done = self._loop.run_until_complete(read())
+        self.assertEqual([folder.id for folder in first], ['a', 'b'])
+        self.assertEqual([folder.id for folder in second], ['c'])
+        self.assertIsNone(done)
+
+    def test_no_url(self):
+        pages = PageIterator(self.osf_query, None, self._loop)
+        self.assertIsNone(self._loop.run_until_complete(pages.next_page()))
+        self.assertEqual(self.osf_query.requested, [])
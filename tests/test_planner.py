@@ -0,0 +1,94 @@
+import os
+from unittest import TestCase
+
+from osfoffline.database_manager.models import User, Node, File, HttpValidator
+from osfoffline.polling_osf_manager.planner import PlannedOperation, SyncPlan, SyncPlanner
+from tests.fixtures.fake_query import file_dict, folder_dict
+from tests.test_poll_walk import PollTestCase, PROJECT
+
+
+class TestSyncPlan(TestCase):
+    def setUp(self):
+        self.stats = {'total_requests': 7, 'phase_seconds': {'listing': 1.5}}
+        self.plan = SyncPlan(
+            [
+                PlannedOperation(PlannedOperation.CREATE_LOCAL_FOLDER, '/osf/project'),
+                PlannedOperation(PlannedOperation.DOWNLOAD, '/osf/project/a.txt', size=100),
+                PlannedOperation(PlannedOperation.DOWNLOAD, '/osf/project/b.txt', size=50),
+                PlannedOperation(PlannedOperation.UPLOAD, '/osf/project/c.txt', size=10),
+                PlannedOperation(PlannedOperation.RENAME_LOCAL, '/osf/project/d.txt', new_path='/osf/project/e.txt'),
+            ],
+            self.stats
+        )
+
+    def test_bytes(self):
+        self.assertEqual(self.plan.download_bytes, 150)
+        self.assertEqual(self.plan.upload_bytes, 10)
+
+    def test_summary(self):
+        summary = self.plan.summary()
+        self.assertEqual(summary['operations'], {
+            PlannedOperation.CREATE_LOCAL_FOLDER: 1,
+            PlannedOperation.DOWNLOAD: 2,
+            PlannedOperation.UPLOAD: 1,
+            PlannedOperation.RENAME_LOCAL: 1,
+        })
+        self.assertEqual(summary['download_bytes'], 150)
+        self.assertEqual(summary['upload_bytes'], 10)
+        self.assertEqual(summary['requests'], 7)
+
+    def test_operation_size_defaults_to_zero(self):
+        self.assertEqual(PlannedOperation(PlannedOperation.DOWNLOAD, '/osf/a', size=None).size, 0)
+
+
+class TestSyncPlanner(PollTestCase):
+    """SyncPlanner against a FakeQuery, after a walk has recorded the remote tree in the db."""
+
+    def setUp(self):
+        super().setUp()
+        self.walk(full_walk=True)
+        self.poll.polling_event_queue.events = []
+
+        self.query.add(PROJECT, file_dict('new', 'new.txt', size=5))
+        self.query.add(PROJECT, folder_dict('docs', 'docs'))
+        self.query.add('docs', file_dict('a', 'a.txt', size=7))
+        self.query.children['folder'] = []
+        self.query.add('folder', file_dict('file', 'renamed.txt'))
+
+    def rows(self):
+        return {
+            model.__name__: [
+                tuple(getattr(row, column.name) for column in model.__table__.columns)
+                for row in self.session.query(model).order_by(*model.__table__.primary_key.columns)
+            ]
+            for model in (User, Node, File, HttpValidator)
+        }
+
+    def plan(self):
+        planner = SyncPlanner(self.poll)
+        planner.osf_query.close()
+        planner.osf_query = self.query
+        return self.loop.run_until_complete(planner.plan('user', [PROJECT]))
+
+    def test_operations(self):
+        project = os.path.join(self.osf_folder, 'project')
+        operations = sorted(
+            (op.action, op.path, op.size, op.new_path) for op in self.plan().operations
+        )
+        self.assertEqual(operations, sorted([
+            (PlannedOperation.CREATE_LOCAL_FOLDER, os.path.join(project, 'docs'), 0, None),
+            (PlannedOperation.DOWNLOAD, os.path.join(project, 'docs', 'a.txt'), 7, None),
+            (PlannedOperation.DOWNLOAD, os.path.join(project, 'new.txt'), 5, None),
+            (
+                PlannedOperation.RENAME_LOCAL, os.path.join(project, 'folder', 'file.txt'), 0,
+                os.path.join(project, 'folder', 'renamed.txt')
+            ),
+        ]))
+
+    def test_nothing_is_queued_or_saved(self):
+        before = self.rows()
+        self.plan()
+        self.assertEqual(self.poll.polling_event_queue.events, [])
+        self.assertEqual(list(self.session.new), [])
+        self.assertEqual(list(self.session.dirty), [])
+        self.assertEqual(self.rows(), before)
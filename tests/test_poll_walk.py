@@ -0,0 +1,180 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from osfoffline.database_manager.models import User, Node, File
+from osfoffline.database_manager.utils import UnitOfWork
+from osfoffline.exceptions.osf_exceptions import ServerUnavailable
+from osfoffline.polling_osf_manager import polling
+from osfoffline.settings import POLL_FULL_WALK_INTERVAL
+from tests.fixtures.factories import common
+from tests.fixtures.fake_query import FakeQuery, folder_dict, file_dict
+
+PROJECT = 'proj'
+
+
+class EventsNotRun(object):
+    """PollingEventQueue that keeps the events it is given instead of running them."""
+    def __init__(self):
+        self.events = []
+
+    def put(self, event):
+        self.events.append(event)
+
+    @asyncio.coroutine
+    def run(self):
+        pass
+
+
+class PollTestCase(TestCase):
+    """A Poll of a user who syncs PROJECT, against a FakeQuery."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = common.Session()
+        self.osf_folder = tempfile.mkdtemp()
+        self.user = User(
+            full_name='poll user',
+            osf_local_folder_path=self.osf_folder,
+            logged_in=True,
+            guid_for_top_level_nodes_to_sync=[PROJECT]
+        )
+        self.session.add(self.user)
+        self.session.commit()
+
+        for patcher in (
+            mock.patch.object(polling, 'session', self.session),
+            mock.patch('osfoffline.alerts.up_to_date'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.poll = polling.Poll(self.user, self.loop)
+        self.poll.osf_query.close()
+        self.poll.osf_query = self.query = FakeQuery(self.loop)
+        self.poll.unit_of_work = UnitOfWork(self.session, self.loop)
+        self.poll.polling_event_queue = EventsNotRun()
+
+        self.remote_node = self.query.add_node(PROJECT, 'project')
+        self.query.add(PROJECT, folder_dict('folder', 'folder'))
+        self.query.add('folder', file_dict('file', 'file.txt'))
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(File).delete()
+        self.session.query(Node).delete()
+        self.session.query(User).delete()
+        self.session.commit()
+        common.Session.remove()
+        self.loop.close()
+        shutil.rmtree(self.osf_folder)
+
+    def walk(self, full_walk, guids=(PROJECT,)):
+        """One cycle of a walk that is not cut short."""
+        self.poll._full_walk = full_walk
+        self.query.listed = []
+        self.loop.run_until_complete(
+            self.poll._check_projects('/v2/users/me/nodes/', list(guids), time.monotonic())
+        )
+
+    def local_node(self):
+        return self.session.query(Node).filter(Node.osf_id == PROJECT).one()
+
+    def node_was_listed(self):
+        return ('get_child_files', PROJECT) in self.query.listed
+
+
+class TestSkipUnchangedNodes(PollTestCase):
+
+    def test_full_walk_records_the_node(self):
+        self.walk(full_walk=True)
+        self.assertTrue(self.node_was_listed())
+        self.assertEqual(self.local_node().remote_date_modified, self.poll._as_naive_utc(self.remote_node.last_modified))
+        self.assertEqual(self.session.query(File).filter(File.name == 'file.txt').count(), 1)
+
+    def test_unchanged_node_is_skipped(self):
+        self.walk(full_walk=True)
+        self.walk(full_walk=False)
+        self.assertFalse(self.node_was_listed())
+
+    def test_unchanged_node_is_walked_in_a_full_walk(self):
+        self.walk(full_walk=True)
+        self.walk(full_walk=True)
+        self.assertTrue(self.node_was_listed())
+
+    def test_changed_node_is_walked(self):
+        self.walk(full_walk=True)
+        self.query.add_node(PROJECT, 'project', date_modified='2015-10-22T07:28:00.000000')
+        self.walk(full_walk=False)
+        self.assertTrue(self.node_was_listed())
+
+    def test_node_with_local_changes_is_walked(self):
+        self.walk(full_walk=True)
+        local_file = self.session.query(File).filter(File.name == 'file.txt').one()
+        local_file.locally_renamed = True
+        self.session.commit()
+        self.walk(full_walk=False)
+        self.assertTrue(self.node_was_listed())
+
+
+class TestFailedListings(PollTestCase):
+
+    def assert_nothing_recorded(self):
+        self.assertGreater(self.poll._walk_errors, 0)
+        self.assertIsNone(self.local_node().remote_date_modified)
+        self.assertTrue(self.poll.scheduler.is_due(PROJECT))
+
+    def test_failed_file_listing(self):
+        self.query.failing.add(PROJECT)
+        self.walk(full_walk=True)
+        self.assert_nothing_recorded()
+
+    def test_failed_folder_listing(self):
+        self.query.failing.add('folder')
+        self.walk(full_walk=True)
+        self.assert_nothing_recorded()
+
+    def test_open_circuit(self):
+        self.query.failure = ServerUnavailable
+        self.query.failing.add('folder')
+        self.walk(full_walk=True)
+        self.assert_nothing_recorded()
+
+    def test_node_is_walked_again_after_a_failure(self):
+        self.query.failing.add('folder')
+        self.walk(full_walk=True)
+        self.query.failing.clear()
+        self.walk(full_walk=False)
+        self.assertTrue(self.node_was_listed())
+        self.assertEqual(self.poll._walk_errors, 0)
+        self.assertIsNotNone(self.local_node().remote_date_modified)
+
+
+class TestFullWalkCadence(PollTestCase):
+
+    def test_first_cycle_is_a_full_walk(self):
+        self.assertEqual(self.poll._due_projects([PROJECT], time.monotonic()), [PROJECT])
+        self.assertTrue(self.poll._full_walk)
+
+    def test_full_walk_after_interval(self):
+        start = time.monotonic()
+        self.walk(full_walk=True)
+        self.poll._last_full_walk = start
+
+        self.poll._due_projects([PROJECT], start + 1)
+        self.assertFalse(self.poll._full_walk)
+        # past the interval, since start + interval - start can round to just below it
+        self.poll._due_projects([PROJECT], start + POLL_FULL_WALK_INTERVAL + 1)
+        self.assertTrue(self.poll._full_walk)
+
+    def test_recently_walked_project_is_not_due(self):
+        self.walk(full_walk=True)
+        self.poll._last_full_walk = time.monotonic()
+        self.assertEqual(self.poll._due_projects([PROJECT], time.monotonic()), [])
+
+    def test_failed_walk_does_not_count_as_full_walk(self):
+        self.query.failing.add(PROJECT)
+        self.walk(full_walk=True)
+        self.assertIsNone(self.poll._last_full_walk)
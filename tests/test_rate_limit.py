@@ -0,0 +1,116 @@
+import asyncio
+import email.utils
+import time
+from unittest import TestCase
+
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.rate_limit import TokenBucket, retry_after_seconds, is_throttled
+from osfoffline.polling_osf_manager.retry import RetryPolicy
+from osfoffline.polling_osf_manager.transport import Transport
+from tests.test_retry import FakeResponse, FakeSession
+
+
+class TestRetryAfter(TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(retry_after_seconds({'Retry-After': '120'}), 120)
+
+    def test_http_date(self):
+        date = email.utils.formatdate(time.time() + 60, usegmt=True)
+        self.assertAlmostEqual(retry_after_seconds({'Retry-After': date}), 60, delta=2)
+
+    def test_missing_or_invalid(self):
+        self.assertEqual(retry_after_seconds({}, default=3), 3)
+        self.assertEqual(retry_after_seconds({'Retry-After': 'soon'}, default=3), 3)
+
+    def test_not_finite(self):
+        for value in ('inf', '-inf', 'nan', 'Infinity'):
+            self.assertEqual(retry_after_seconds({'Retry-After': value}, default=3), 3)
+
+    def test_clamped(self):
+        self.assertEqual(retry_after_seconds({'Retry-After': '1e9'}, maximum=300), 300)
+        self.assertEqual(retry_after_seconds({'Retry-After': '-5'}), 0)
+        date = email.utils.formatdate(time.time() + 10 ** 6, usegmt=True)
+        self.assertEqual(retry_after_seconds({'Retry-After': date}, maximum=300), 300)
+
+    def test_is_throttled(self):
+        self.assertTrue(is_throttled(FakeResponse(429)))
+        self.assertTrue(is_throttled(FakeResponse(503, {'Retry-After': '1'})))
+        self.assertFalse(is_throttled(FakeResponse(503)))
+        self.assertFalse(is_throttled(FakeResponse(200)))
+
+
+class TestTokenBucket(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self._loop.close()
+
+    def acquire(self, bucket, times):
+        @asyncio.coroutine
+        def run():
+            start = self._loop.time()
+            for _ in range(times):
+                yield from bucket.acquire()
+            return self._loop.time() - start
+        return self._loop.run_until_complete(run())
+
+    def test_burst_is_not_delayed(self):
+        bucket = TokenBucket(self._loop, rate=1, burst=5)
+        self.assertLess(self.acquire(bucket, 5), 0.5)
+
+    def test_rate_after_burst(self):
+        bucket = TokenBucket(self._loop, rate=50, burst=1)
+        self.assertGreaterEqual(self.acquire(bucket, 6), 0.09)
+
+    def test_pause_holds_requests(self):
+        bucket = TokenBucket(self._loop, rate=None, burst=1)
+        bucket.pause(0.1)
+        self.assertEqual(bucket.as_record()['throttled'], 1)
+        self.assertGreaterEqual(self.acquire(bucket, 1), 0.09)
+        self.assertEqual(bucket.as_record()['waiting'], 0)
+
+
+class TestThrottledRequests(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.transport = Transport(self._loop)
+        self.osf_query = OSFQuery(self._loop, 'token', transport=self.transport, retry_policy=RetryPolicy(base_delay=0))
+
+    def tearDown(self):
+        self.transport.close()
+        self._loop.close()
+
+    def send(self, answers, data=None):
+        self.osf_query.request_session = FakeSession(answers)
+        return self._loop.run_until_complete(
+            self.osf_query._send('http://localhost:5000/v2/', 'POST', None, data, None, 1)
+        )
+
+    def test_throttled_request_waits_and_is_sent_again(self):
+        ok = FakeResponse(200)
+        start = time.monotonic()
+        self.assertIs(self.send([FakeResponse(429, {'Retry-After': '0.1'}), ok]), ok)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(self.osf_query.stats.throttled, 1)
+        limiter = self.transport.host_states()['http://localhost:5000']['rate_limit']
+        self.assertEqual(limiter['throttled'], 1)
+
+    def test_too_many_requests_is_not_a_failure(self):
+        self.send([FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)])
+        self.assertEqual(self.transport.breaker_for('http://localhost:5000/v2/').failures, 0)
+
+    def test_unavailable_opens_the_circuit(self):
+        breaker = self.transport.breaker_for('http://localhost:5000/v2/')
+        unavailable = [FakeResponse(503, {'Retry-After': '0'}) for _ in range(breaker.failure_threshold)]
+        self.assertIs(self.send(unavailable + [FakeResponse(200)]), unavailable[-1])
+        self.assertTrue(breaker.is_open)
+        breaker.stop()
+
+    def test_throttled_upload_is_returned(self):
+        throttled = FakeResponse(429, {'Retry-After': '0'})
+        with open(__file__, 'rb') as body:
+            self.assertIs(self.send([throttled, FakeResponse(200)], data=body), throttled)
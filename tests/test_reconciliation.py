@@ -0,0 +1,116 @@
+from unittest import TestCase
+
+from osfoffline.polling_osf_manager.reconciliation import (
+    Reconciler, CreateLocal, CreateRemote, DeleteLocal, DeleteRemote, Rename, Modify, Unchanged
+)
+
+
+class FakeLocal(object):
+    def __init__(self, osf_id, name, size=None, locally_created=False, locally_deleted=False):
+        self.osf_id = osf_id
+        self.name = name
+        self.size = size
+        self.is_file = size is not None
+        self.locally_created = locally_created
+        self.locally_deleted = locally_deleted
+
+
+class FakeRemote(object):
+    def __init__(self, id, name, size=None):
+        self.id = id
+        self.name = name
+        self.size = size
+
+
+def get_id(item):
+    return item.id if isinstance(item, FakeRemote) else item.osf_id
+
+
+class TestReconciler(TestCase):
+    def setUp(self):
+        self.reconciler = Reconciler(get_id=get_id)
+
+    def diff_for(self, local, remote):
+        diffs = self.reconciler.reconcile([local] if local else [], [remote] if remote else [])
+        self.assertEqual(len(diffs), 1)
+        return diffs[0]
+
+    def test_remote_only(self):
+        remote = FakeRemote('a', 'a.txt', 1)
+        diff = self.diff_for(None, remote)
+        self.assertIsInstance(diff, CreateLocal)
+        self.assertIs(diff.remote, remote)
+        self.assertIsNone(diff.local)
+
+    def test_locally_created(self):
+        self.assertIsInstance(self.diff_for(FakeLocal('FAKE1FAKE', 'a.txt', 1, locally_created=True), None), CreateRemote)
+
+    def test_local_only(self):
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'a.txt', 1), None), DeleteLocal)
+
+    def test_locally_deleted(self):
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'a.txt', 1, locally_deleted=True), FakeRemote('a', 'a.txt', 1)), DeleteRemote)
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'a.txt', 1, locally_deleted=True), None), DeleteRemote)
+
+    def test_rename(self):
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'a.txt', 1), FakeRemote('a', 'b.txt', 2)), Rename)
+
+    def test_modify(self):
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'a.txt', 1), FakeRemote('a', 'a.txt', 2)), Modify)
+
+    def test_unchanged(self):
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'a.txt', 1), FakeRemote('a', 'a.txt', 1)), Unchanged)
+        # folders have no size
+        self.assertIsInstance(self.diff_for(FakeLocal('a', 'folder'), FakeRemote('a', 'folder')), Unchanged)
+
+    def test_custom_local_name(self):
+        class FakeNode(object):
+            osf_id = 'n'
+            title = 'project'
+        reconciler = Reconciler(get_id=lambda item: item.osf_id if isinstance(item, FakeNode) else item.id,
+                                get_local_name=lambda node: node.title)
+        diffs = reconciler.reconcile([FakeNode()], [FakeRemote('n', 'project')])
+        self.assertIsInstance(diffs[0], Unchanged)
+
+    def test_every_item_appears_once(self):
+        locals = [FakeLocal(str(i), str(i), 1) for i in range(0, 100)]
+        remotes = [FakeRemote(str(i), str(i), 1) for i in range(50, 150)]
+        diffs = self.reconciler.reconcile(locals, remotes)
+
+        self.assertEqual(len(diffs), 150)
+        self.assertEqual(len([d for d in diffs if isinstance(d, DeleteLocal)]), 50)
+        self.assertEqual(len([d for d in diffs if isinstance(d, CreateLocal)]), 50)
+        self.assertEqual(len([d for d in diffs if isinstance(d, Unchanged)]), 50)
+
+
+class TestIncrementalReconciliation(TestCase):
+    def setUp(self):
+        self.reconciler = Reconciler(get_id=get_id)
+
+    def test_pages_match_locals_as_they_arrive(self):
+        locals = [FakeLocal('a', 'a.txt', 1), FakeLocal('b', 'b.txt', 1), FakeLocal('c', 'c.txt', 1)]
+        reconciliation = self.reconciler.start(locals)
+
+        first = reconciliation.feed([FakeRemote('b', 'b.txt', 1), FakeRemote('d', 'd.txt', 1)])
+        self.assertEqual([type(diff) for diff in first], [Unchanged, CreateLocal])
+        self.assertIs(first[0].local, locals[1])
+
+        second = reconciliation.feed([FakeRemote('a', 'a.txt', 2)])
+        self.assertEqual([type(diff) for diff in second], [Modify])
+
+        rest = reconciliation.finish()
+        self.assertEqual([type(diff) for diff in rest], [DeleteLocal])
+        self.assertIs(rest[0].local, locals[2])
+        self.assertEqual(reconciliation.finish(), [])
+
+    def test_same_result_as_reconcile(self):
+        locals = [FakeLocal(str(i), str(i), 1) for i in range(0, 20)]
+        remotes = [FakeRemote(str(i), str(i), 1) for i in range(10, 30)]
+
+        reconciliation = self.reconciler.start(locals)
+        diffs = reconciliation.feed(remotes[:7]) + reconciliation.feed(remotes[7:]) + reconciliation.finish()
+
+        def key(diff):
+            return type(diff).__name__, get_id(diff.local or diff.remote)
+
+        self.assertEqual(sorted(map(key, diffs)), sorted(map(key, self.reconciler.reconcile(locals, remotes))))
@@ -0,0 +1,107 @@
+import os
+from unittest import TestCase
+
+from osfoffline.database_manager.models import User, Node, File, item_at_rel_path, backfill_rel_paths
+from tests.fixtures.factories import common
+
+
+class TestRelPath(TestCase):
+    def setUp(self):
+        self.session = common.Session()
+        self.user = User(full_name='path user', osf_local_folder_path='/osf')
+        self.node = Node(title='project', user=self.user)
+        self.folder = File(name='folder', type=File.FOLDER, user=self.user, node=self.node)
+        self.sub_folder = File(name='sub', type=File.FOLDER, user=self.user, node=self.node, parent=self.folder)
+        self.file = File(name='file.txt', type=File.FILE, user=self.user, node=self.node, parent=self.sub_folder)
+        self.session.add_all([self.user, self.node, self.folder, self.sub_folder, self.file])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(File).delete()
+        self.session.query(Node).delete()
+        self.session.query(User).delete()
+        self.session.commit()
+        common.Session.remove()
+
+    def stored_rel_path(self, item):
+        table = type(item).__table__
+        return self.session.execute(
+            table.select().with_only_columns([table.c.rel_path]).where(table.c.id == item.id)
+        ).scalar()
+
+    def test_stored_on_create(self):
+        self.assertEqual(self.file.rel_path, os.path.join('project', 'folder', 'sub', 'file.txt'))
+        self.assertEqual(self.file.path, os.path.join('/osf', 'project', 'folder', 'sub', 'file.txt'))
+        self.assertEqual(self.stored_rel_path(self.node), 'project')
+
+    def test_component_path(self):
+        component = Node(title='component', user=self.user, parent=self.node)
+        self.session.add(component)
+        self.session.commit()
+        self.assertEqual(component.rel_path, os.path.join('project', 'Components', 'component'))
+
+    def test_path_is_built_until_flushed(self):
+        self.file.name = 'renamed.txt'
+        self.assertIsNone(self.file.rel_path)
+        self.assertEqual(self.file.path, os.path.join('/osf', 'project', 'folder', 'sub', 'renamed.txt'))
+
+    def test_rename_folder_rewrites_subtree(self):
+        self.folder.name = 'renamed'
+        self.session.commit()
+        expected = os.path.join('project', 'renamed', 'sub', 'file.txt')
+        self.assertEqual(self.file.rel_path, expected)
+        self.assertEqual(self.stored_rel_path(self.file), expected)
+
+    def test_rename_node_rewrites_its_files(self):
+        self.node.title = 'new title'
+        self.session.commit()
+        self.assertEqual(self.stored_rel_path(self.sub_folder), os.path.join('new title', 'folder', 'sub'))
+
+    def test_move_and_rename_inside_renamed_folder(self):
+        self.folder.name = 'renamed'
+        self.sub_folder.name = 'sub2'
+        self.session.commit()
+        self.assertEqual(self.stored_rel_path(self.file), os.path.join('project', 'renamed', 'sub2', 'file.txt'))
+
+    def test_move_file(self):
+        self.file.parent = self.folder
+        self.session.commit()
+        self.assertEqual(self.stored_rel_path(self.file), os.path.join('project', 'folder', 'file.txt'))
+        self.assertEqual(self.stored_rel_path(self.sub_folder), os.path.join('project', 'folder', 'sub'))
+
+    def test_similar_names_are_not_rewritten(self):
+        other = File(name='folder2', type=File.FOLDER, user=self.user, node=self.node)
+        self.session.add(other)
+        self.session.commit()
+        self.folder.name = 'renamed'
+        self.session.commit()
+        self.assertEqual(self.stored_rel_path(other), os.path.join('project', 'folder2'))
+
+    def test_item_at_rel_path(self):
+        self.assertEqual(item_at_rel_path(self.session, self.user, 'project', True), self.node)
+        self.assertEqual(item_at_rel_path(self.session, self.user, os.path.join('project', 'folder'), True), self.folder)
+        file_rel_path = os.path.join('project', 'folder', 'sub', 'file.txt')
+        self.assertEqual(item_at_rel_path(self.session, self.user, file_rel_path, False), self.file)
+        self.assertIsNone(item_at_rel_path(self.session, self.user, file_rel_path, True))
+        self.assertIsNone(item_at_rel_path(self.session, self.user, os.path.join('project', 'missing'), True))
+
+    def test_item_at_rel_path_after_rename(self):
+        self.folder.name = 'renamed'
+        file_rel_path = os.path.join('project', 'renamed', 'sub', 'file.txt')
+        # the query flushes the rename first
+        self.assertEqual(item_at_rel_path(self.session, self.user, file_rel_path, False), self.file)
+
+    def test_backfill_rel_paths(self):
+        # a db from before rel_path was stored
+        for table in (Node.__table__, File.__table__):
+            self.session.execute(table.update().values(rel_path=None))
+        self.session.commit()
+        file_rel_path = os.path.join('project', 'folder', 'sub', 'file.txt')
+        self.assertIsNone(item_at_rel_path(self.session, self.user, file_rel_path, False))
+
+        self.assertEqual(backfill_rel_paths(self.session), 4)
+        self.assertEqual(self.stored_rel_path(self.file), file_rel_path)
+        self.assertEqual(self.stored_rel_path(self.node), 'project')
+        self.assertEqual(item_at_rel_path(self.session, self.user, file_rel_path, False), self.file)
+        self.assertEqual(backfill_rel_paths(self.session), 0)
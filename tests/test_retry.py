@@ -0,0 +1,164 @@
+import asyncio
+from unittest import TestCase
+
+import aiohttp
+
+from osfoffline.exceptions.osf_exceptions import ServerUnavailable
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.retry import RetryPolicy, CircuitBreaker, host_of
+from osfoffline.polling_osf_manager.transport import Transport
+
+
+class FakeResponse(object):
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.released = False
+
+    @asyncio.coroutine
+    def release(self):
+        self.released = True
+
+
+class FakeSession(object):
+    """Answers requests with the given responses in order. An exception in the list is raised instead."""
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.sent = 0
+
+    @asyncio.coroutine
+    def request(self, **kwargs):
+        self.sent += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class TestRetryPolicy(TestCase):
+
+    def test_can_retry(self):
+        self.assertTrue(RetryPolicy.can_retry('get'))
+        self.assertTrue(RetryPolicy.can_retry('DELETE'))
+        self.assertTrue(RetryPolicy.can_retry('PUT', data='{}'))
+        self.assertFalse(RetryPolicy.can_retry('POST', data='{}'))
+        with open(__file__, 'rb') as body:
+            self.assertFalse(RetryPolicy.can_retry('PUT', data=body))
+
+    def test_delay_is_capped(self):
+        policy = RetryPolicy(base_delay=1, max_delay=4)
+        for attempt in range(10):
+            self.assertTrue(0 <= policy.delay(attempt) <= min(4, 2 ** attempt))
+
+    def test_host_of(self):
+        self.assertEqual(host_of('https://staging-api.osf.io/v2/nodes/?page=2'), 'https://staging-api.osf.io')
+        self.assertEqual(host_of('http://localhost:5000/v2/'), 'http://localhost:5000')
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.probes = []
+
+    def tearDown(self):
+        self._loop.close()
+
+    def breaker(self, reachable):
+        @asyncio.coroutine
+        def probe():
+            self.probes.append(reachable)
+            return reachable
+        return CircuitBreaker(self._loop, 'http://host', probe, failure_threshold=2, reset_timeout=0.01)
+
+    def test_opens_after_threshold(self):
+        breaker = self.breaker(True)
+        breaker.record_failure()
+        breaker.check()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(aiohttp.errors.ClientConnectionError):
+            breaker.check()
+        breaker.stop()
+
+    def test_success_resets_failures(self):
+        breaker = self.breaker(True)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+
+    def test_probe_closes(self):
+        breaker = self.breaker(True)
+        breaker.record_failure()
+        breaker.record_failure()
+        self._loop.run_until_complete(asyncio.sleep(0.05, loop=self._loop))
+        self.assertEqual(self.probes, [True])
+        self.assertFalse(breaker.is_open)
+        breaker.check()
+
+    def test_failed_probe_keeps_open(self):
+        breaker = self.breaker(False)
+        breaker.record_failure()
+        breaker.record_failure()
+        self._loop.run_until_complete(asyncio.sleep(0.05, loop=self._loop))
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(self.probes)
+        breaker.stop()
+
+
+class TestMakeRequestRetries(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.transport = Transport(self._loop)
+        self.osf_query = OSFQuery(
+            self._loop, 'token', transport=self.transport, retry_policy=RetryPolicy(max_attempts=3, base_delay=0)
+        )
+
+    def tearDown(self):
+        self.transport.close()
+        self._loop.close()
+
+    def send(self, answers, method='GET'):
+        self.osf_query.request_session = FakeSession(answers)
+        return self._loop.run_until_complete(
+            self.osf_query._send('http://localhost:5000/v2/', method, None, None, None, 1)
+        )
+
+    def test_retries_connection_errors(self):
+        ok = FakeResponse(200)
+        self.assertIs(self.send([aiohttp.errors.ClientOSError(), ok]), ok)
+        self.assertEqual(self.osf_query.request_session.sent, 2)
+        self.assertEqual(self.osf_query.stats.retries, 1)
+
+    def test_retries_server_errors(self):
+        unavailable = FakeResponse(503)
+        ok = FakeResponse(200)
+        self.assertIs(self.send([unavailable, ok]), ok)
+        self.assertTrue(unavailable.released)
+
+    def test_returns_last_server_error(self):
+        last = FakeResponse(502)
+        self.assertIs(self.send([FakeResponse(502), FakeResponse(502), last]), last)
+
+    def test_does_not_retry_post(self):
+        with self.assertRaises(aiohttp.errors.ClientOSError):
+            self.send([aiohttp.errors.ClientOSError(), FakeResponse(200)], method='POST')
+        self.assertEqual(self.osf_query.request_session.sent, 1)
+
+    def test_error_response_does_not_reset_failures(self):
+        breaker = self.transport.breaker_for('http://localhost:5000/v2/')
+        breaker.record_failure()
+        self.send([FakeResponse(404)])
+        self.assertEqual(breaker.failures, 1)
+        self.send([FakeResponse(200)])
+        self.assertEqual(breaker.failures, 0)
+
+    def test_open_circuit_fails_fast(self):
+        breaker = self.transport.breaker_for('http://localhost:5000/v2/')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        with self.assertRaises(ServerUnavailable):
+            self.send([FakeResponse(200)])
+        self.assertEqual(self.osf_query.request_session.sent, 0)
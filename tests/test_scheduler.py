@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from osfoffline.polling_osf_manager.scheduler import PollScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPollScheduler(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = PollScheduler(min_interval=5, max_interval=60, backoff_factor=2, clock=self.clock)
+
+    def test_new_project_is_due(self):
+        self.assertTrue(self.scheduler.is_due('abcde'))
+        self.assertEqual(self.scheduler.due(['abcde', 'fghij']), ['abcde', 'fghij'])
+
+    def test_not_due_until_interval_passed(self):
+        self.scheduler.record('abcde', changed=True)
+        self.clock.now = 4
+        self.assertFalse(self.scheduler.is_due('abcde'))
+        self.clock.now = 5
+        self.assertTrue(self.scheduler.is_due('abcde'))
+
+    def test_backs_off_when_unchanged(self):
+        intervals = []
+        for _ in range(6):
+            self.scheduler.record('abcde', changed=False)
+            intervals.append(self.scheduler.interval('abcde'))
+        self.assertEqual(intervals, [5, 10, 20, 40, 60, 60])
+
+    def test_change_resets_interval(self):
+        for _ in range(4):
+            self.scheduler.record('abcde', changed=False)
+        self.scheduler.record('abcde', changed=True)
+        self.assertEqual(self.scheduler.interval('abcde'), 5)
+
+    def test_projects_are_independent(self):
+        for _ in range(3):
+            self.scheduler.record('idle', changed=False)
+        self.scheduler.record('busy', changed=True)
+        self.clock.now = 5
+        self.assertEqual(self.scheduler.due(['idle', 'busy']), ['busy'])
+
+    def test_forget(self):
+        self.scheduler.record('abcde', changed=False)
+        self.scheduler.forget('abcde')
+        self.assertTrue(self.scheduler.is_due('abcde'))
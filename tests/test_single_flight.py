@@ -0,0 +1,93 @@
+import asyncio
+import json
+from unittest import TestCase
+
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.single_flight import SingleFlight
+from osfoffline.polling_osf_manager.transport import Transport
+from tests.test_retry import FakeResponse, FakeSession
+
+
+class JsonResponse(FakeResponse):
+    def __init__(self, body):
+        super().__init__(200)
+        self.body = json.dumps(body).encode('utf-8')
+
+    @asyncio.coroutine
+    def read(self):
+        return self.body
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.single_flight = SingleFlight(self._loop)
+        self.calls = 0
+
+    def tearDown(self):
+        self._loop.close()
+
+    @asyncio.coroutine
+    def slow_call(self):
+        self.calls += 1
+        yield from asyncio.sleep(0.01, loop=self._loop)
+        return {'call': self.calls}
+
+    def test_overlapping_calls_share(self):
+        first, second = self._loop.run_until_complete(asyncio.gather(
+            self.single_flight.do('key', self.slow_call),
+            self.single_flight.do('key', self.slow_call),
+            loop=self._loop
+        ))
+        self.assertEqual(self.calls, 1)
+        self.assertIs(first, second)
+        self.assertEqual(len(self.single_flight), 0)
+
+    def test_other_keys_and_later_calls_are_not_shared(self):
+        self._loop.run_until_complete(asyncio.gather(
+            self.single_flight.do('a', self.slow_call),
+            self.single_flight.do('b', self.slow_call),
+            loop=self._loop
+        ))
+        self._loop.run_until_complete(self.single_flight.do('a', self.slow_call))
+        self.assertEqual(self.calls, 3)
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        cancelled = self._loop.create_task(self.single_flight.do('key', self.slow_call))
+        waiting = self._loop.create_task(self.single_flight.do('key', self.slow_call))
+        self._loop.call_soon(cancelled.cancel)
+        self.assertEqual(self._loop.run_until_complete(waiting), {'call': 1})
+        self.assertTrue(cancelled.cancelled())
+
+    def test_last_caller_cancels_the_call(self):
+        caller = self._loop.create_task(self.single_flight.do('key', self.slow_call))
+        self._loop.call_soon(caller.cancel)
+        with self.assertRaises(asyncio.CancelledError):
+            self._loop.run_until_complete(caller)
+        self._loop.run_until_complete(asyncio.sleep(0.02, loop=self._loop))
+        self.assertEqual(len(self.single_flight), 0)
+
+
+class TestMakeRequestSingleFlight(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.transport = Transport(self._loop)
+        self.osf_query = OSFQuery(self._loop, 'token', transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self._loop.close()
+
+    def test_identical_gets_share_one_request(self):
+        self.osf_query.request_session = FakeSession([JsonResponse({'data': []}), JsonResponse({'data': []})])
+        url = 'http://localhost:5000/v2/nodes/'
+        first, second = self._loop.run_until_complete(asyncio.gather(
+            self.osf_query.make_request(url, get_json=True),
+            self.osf_query.make_request(url, get_json=True),
+            loop=self._loop
+        ))
+        self.assertIs(first, second)
+        self.assertEqual(self.osf_query.request_session.sent, 1)
+        self.assertEqual(self.osf_query.stats.as_record()['total_requests'], 1)
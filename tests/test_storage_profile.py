@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from osfoffline.database_manager.db import apply_storage_profile
+from osfoffline.database_manager.models import Base, User
+
+
+class TestStorageProfile(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite:///{}'.format(os.path.join(self.dir, 'osf.db')))
+        apply_storage_profile(self.engine, journal_mode='WAL', synchronous='NORMAL', mmap_size=1024 * 1024,
+                              cache_size=2048)
+        Base.metadata.create_all(self.engine)
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.dir)
+
+    def pragma(self, name):
+        return self.engine.execute('PRAGMA {}'.format(name)).scalar()
+
+    def test_pragmas_are_set_on_every_connection(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('mmap_size'), 1024 * 1024)
+        self.assertEqual(self.pragma('cache_size'), -2048)
+
+    def test_writer_commits_while_a_reader_reads(self):
+        writer = self.session_factory()
+        writer.add(User(full_name='first', osf_local_folder_path='/osf'))
+        writer.commit()
+
+        reader = self.engine.raw_connection()
+        cursor = reader.cursor()
+        # a read that stays open, like the preferences window reading while the sync engine works
+        cursor.execute('BEGIN')
+        cursor.execute('SELECT count(*) FROM user')
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+        writer.add(User(full_name='second', osf_local_folder_path='/osf'))
+        writer.commit()
+        writer.close()
+
+        # the reader keeps its snapshot until its transaction ends
+        cursor.execute('SELECT count(*) FROM user')
+        self.assertEqual(cursor.fetchone()[0], 1)
+        reader.rollback()
+        cursor.execute('SELECT count(*) FROM user')
+        self.assertEqual(cursor.fetchone()[0], 2)
+        reader.close()
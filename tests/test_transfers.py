@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import aiohttp
+
+from osfoffline.polling_osf_manager import polling_events
+from osfoffline.polling_osf_manager.transfers import (
+    read_chunks, received_bytes, content_range, content_range_start, content_range_total, part_path, validator_path,
+    is_part_file, saved_resume_validator, TransferProgress, DownloadSink, RESUME_INCOMPLETE
+)
+from osfoffline.utils.path import ProperPath
+from tests.fixtures.mock_osf_api_server.osf import app, requested_range, RANGE_NOT_SATISFIABLE
+
+
+class TestReadChunks(TestCase):
+
+    def test_chunks_and_progress(self):
+        progress = TransferProgress('file.txt', 10, 'uploading')
+        chunks = list(read_chunks(io.BytesIO(b'0123456789'), 4, 10, progress))
+        self.assertEqual(chunks, [b'0123', b'4567', b'89'])
+        self.assertEqual(progress.done, 10)
+        self.assertEqual(progress.percent, 100)
+
+    def test_limit(self):
+        self.assertEqual(b''.join(read_chunks(io.BytesIO(b'0123456789'), 4, 6)), b'012345')
+
+    def test_file_shorter_than_limit(self):
+        self.assertEqual(b''.join(read_chunks(io.BytesIO(b'012'), 4, 6)), b'012')
+
+
+class TestRangeHeaders(TestCase):
+
+    def test_content_range_start(self):
+        self.assertEqual(content_range_start('bytes 100-199/200'), 100)
+        self.assertIsNone(content_range_start(None))
+        self.assertIsNone(content_range_start('bytes */200'))
+
+    def test_content_range_total(self):
+        self.assertEqual(content_range_total('bytes 0-99/200'), 200)
+        self.assertIsNone(content_range_total('bytes 0-99/*'))
+        self.assertIsNone(content_range_total(None))
+
+    def test_requested_range(self):
+        self.assertEqual(requested_range('bytes=2-', 10), (2, 9))
+        self.assertEqual(requested_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(requested_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(requested_range('bytes=10-', 10), RANGE_NOT_SATISFIABLE)
+        self.assertIsNone(requested_range(None, 10))
+
+    def test_split_ranges(self):
+        self.assertEqual(polling_events._split_ranges(10, 3), [(0, 3), (4, 7), (8, 9)])
+        self.assertEqual(polling_events._split_ranges(10, 1), [(0, 9)])
+        self.assertEqual(polling_events._split_ranges(2, 4), [(0, 0), (1, 1)])
+
+    def test_part_files(self):
+        self.assertTrue(is_part_file(part_path('/osf/project/file.txt')))
+        self.assertTrue(is_part_file(validator_path('/osf/project/file.txt')))
+        self.assertFalse(is_part_file('/osf/project/file.txt'))
+
+
+class TestResumableHeaders(TestCase):
+
+    def test_received_bytes(self):
+        self.assertEqual(received_bytes(None), 0)
+        self.assertEqual(received_bytes('bytes=0-99'), 100)
+
+    def test_content_range(self):
+        self.assertEqual(content_range(100, 50, 1000), 'bytes 100-149/1000')
+        self.assertEqual(content_range(0, 0, 1000), 'bytes */1000')
+
+
+class TestMockServerResumableUpload(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        resp = self.client.post('/v2/users/', data={'fullname': 'upload user'})
+        user_id = json.loads(resp.data.decode())['data']['id']
+        self.headers = {'Authorization': 'Bearer {}'.format(user_id)}
+        body = {'data': {'type': 'nodes', 'attributes': {'title': 'upload project', 'category': 'project'}}}
+        resp = self.client.post(
+            '/v2/nodes/', data=json.dumps(body), headers=dict(self.headers, **{'Content-Type': 'application/json'})
+        )
+        self.node_id = json.loads(resp.data.decode())['data']['id']
+
+    def start(self, size):
+        resp = self.client.post(
+            '/v1/resources/{}/providers/osfstorage/?kind=file&name=big.bin&uploadType=resumable'.format(self.node_id),
+            headers=dict(self.headers, **{'X-Upload-Content-Length': str(size)})
+        )
+        self.assertEqual(resp.status_code, 201)
+        return resp.headers['Location']
+
+    def put(self, url, first, chunk, size):
+        return self.client.put(
+            url,
+            data=chunk,
+            headers=dict(self.headers, **{'Content-Range': content_range(first, len(chunk), size)})
+        )
+
+    def test_upload_in_chunks(self):
+        url = self.start(10)
+        resp = self.put(url, 0, b'01234', 10)
+        self.assertEqual(resp.status_code, RESUME_INCOMPLETE)
+        self.assertEqual(received_bytes(resp.headers['Range']), 5)
+
+        # a chunk that was already received is answered with the status
+        resp = self.put(url, 0, b'01234', 10)
+        self.assertEqual(received_bytes(resp.headers['Range']), 5)
+
+        resp = self.put(url, 5, b'', 10)
+        self.assertEqual(received_bytes(resp.headers['Range']), 5)
+
+        resp = self.put(url, 5, b'56789', 10)
+        self.assertEqual(resp.status_code, 201)
+        file_id = json.loads(resp.data.decode())['data']['id']
+        resp = self.client.get(
+            '/v1/resources/{}/providers/osfstorage/{}/'.format(self.node_id, file_id), headers=self.headers
+        )
+        self.assertEqual(resp.data, b'0123456789')
+
+    def test_download_range(self):
+        resp = self.client.put(
+            '/v1/resources/{}/providers/osfstorage/?kind=file&name=small.txt'.format(self.node_id),
+            data=b'0123456789',
+            headers=self.headers
+        )
+        url = '/v1/resources/{}/providers/osfstorage/{}/'.format(self.node_id, json.loads(resp.data.decode())['data']['id'])
+        etag = self.client.get(url, headers=self.headers).headers['ETag']
+
+        resp = self.client.get(url, headers=dict(self.headers, Range='bytes=4-', **{'If-Range': etag}))
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 4-9/10')
+        self.assertEqual(resp.data, b'456789')
+
+        # another version of the file is sent whole
+        resp = self.client.get(url, headers=dict(self.headers, Range='bytes=4-', **{'If-Range': '"other"'}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, b'0123456789')
+
+        resp = self.client.get(url, headers=dict(self.headers, Range='bytes=10-'))
+        self.assertEqual(resp.status_code, 416)
+
+
+class TestDownloadSink(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file.txt')
+
+    def tearDown(self):
+        self._loop.close()
+        shutil.rmtree(self.dir)
+
+    def write(self, sink, chunks):
+        @asyncio.coroutine
+        def write():
+            yield from sink.open()
+            for chunk in chunks:
+                yield from sink.write(chunk)
+            yield from sink.close()
+        self._loop.run_until_complete(write())
+        with open(self.path, 'rb') as fd:
+            return fd.read()
+
+    def test_chunks_are_written_in_order_through_few_buffers(self):
+        chunks = [bytes([i]) * 3 for i in range(100)]
+        sink = DownloadSink(self._loop, self.path, buffer_size=8, num_buffers=2)
+        self.assertEqual(self.write(sink, chunks), b''.join(chunks))
+        self.assertEqual(sink.flushed, 300)
+
+    def test_write_at_offset(self):
+        with open(self.path, 'wb') as fd:
+            fd.write(b'0123456789')
+        sink = DownloadSink(self._loop, self.path, 'r+b', offset=4, buffer_size=4)
+        self.assertEqual(self.write(sink, [b'ab', b'cd']), b'0123abcd89')
+
+    def test_preallocated_file_is_cut_back_to_what_was_written(self):
+        sink = DownloadSink(self._loop, self.path, size=10, buffer_size=4)
+        self.assertEqual(self.write(sink, [b'01234']), b'01234')
+        sink = DownloadSink(self._loop, self.path, size=10, buffer_size=4)
+        self.assertEqual(self.write(sink, [b'0123456789']), b'0123456789')
+
+
+class FakeContent(object):
+    """The body of a download, cut off with ClientDisconnectedError after break_after bytes."""
+    def __init__(self, body, break_after=None):
+        self.body = body
+        self.break_after = break_after
+        self.position = 0
+
+    @asyncio.coroutine
+    def read(self, num_bytes):
+        if self.break_after is not None and self.position >= self.break_after:
+            raise aiohttp.errors.ClientDisconnectedError()
+        end = self.position + num_bytes
+        if self.break_after is not None:
+            end = min(end, self.break_after)
+        chunk = self.body[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+class FakeDownload(object):
+    def __init__(self, status, headers, content):
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+    def close(self):
+        pass
+
+
+class FakeDownloadQuery(object):
+    """Serves a file like the mock server does. The first response breaks off after 4 bytes."""
+    def __init__(self, loop, body):
+        self.loop = loop
+        self.body = body
+        self.requests = []
+
+    @asyncio.coroutine
+    def make_request(self, url, headers=None, expects=None):
+        self.requests.append(headers)
+        headers = headers or {}
+        if 'Range' in headers and headers.get('If-Range') == '"v1"':
+            first = int(headers['Range'][len('bytes='):-1])
+            return FakeDownload(
+                206,
+                {'ETag': '"v1"', 'Content-Range': 'bytes {}-{}/{}'.format(first, len(self.body) - 1, len(self.body))},
+                FakeContent(self.body[first:])
+            )
+        return FakeDownload(200, {'ETag': '"v1"'}, FakeContent(self.body, break_after=4 if not self.requests[:-1] else None))
+
+
+class TestDownloadFile(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.dir = tempfile.mkdtemp()
+        self.path = ProperPath(os.path.join(self.dir, 'file.txt'), is_dir=False)
+
+    def tearDown(self):
+        self._loop.close()
+        shutil.rmtree(self.dir)
+
+    def test_broken_download_is_continued_and_moved_into_place(self):
+        with open(self.path.full_path, 'wb') as fd:
+            fd.write(b'old')
+        osf_query = FakeDownloadQuery(self._loop, b'0123456789')
+        self._loop.run_until_complete(polling_events._download_file(self.path, 'http://localhost/file', osf_query))
+
+        self.assertEqual(osf_query.requests[1], {'Range': 'bytes=4-', 'If-Range': '"v1"'})
+        with open(self.path.full_path, 'rb') as fd:
+            self.assertEqual(fd.read(), b'0123456789')
+        self.assertFalse(os.path.exists(part_path(self.path.full_path)))
+        self.assertFalse(os.path.exists(validator_path(self.path.full_path)))
+
+    @mock.patch.object(polling_events, 'DOWNLOAD_MAX_RESUMES', 0)
+    def test_broken_download_is_continued_after_a_restart(self):
+        with self.assertRaises(aiohttp.errors.ClientDisconnectedError):
+            self._loop.run_until_complete(polling_events._download_file(
+                self.path, 'http://localhost/file', FakeDownloadQuery(self._loop, b'0123456789')
+            ))
+        self.assertEqual(saved_resume_validator(self.path.full_path), '"v1"')
+
+        # a new download, as after the application restarted
+        osf_query = FakeDownloadQuery(self._loop, b'0123456789')
+        self._loop.run_until_complete(polling_events._download_file(self.path, 'http://localhost/file', osf_query))
+        self.assertEqual(osf_query.requests, [{'Range': 'bytes=4-', 'If-Range': '"v1"'}])
+        with open(self.path.full_path, 'rb') as fd:
+            self.assertEqual(fd.read(), b'0123456789')
+        self.assertIsNone(saved_resume_validator(self.path.full_path))
+
+
+class TestStagingFilesAreRemoved(TestCase):
+    """An unfinished download is removed along with the file it was for."""
+
+    def setUp(self):
+        patcher = mock.patch('osfoffline.alerts.info')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self._loop = asyncio.new_event_loop()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file.txt')
+        for path in (self.path, part_path(self.path), validator_path(self.path)):
+            with open(path, 'w') as fd:
+                fd.write('"v1"')
+
+    def tearDown(self):
+        self._loop.close()
+        shutil.rmtree(self.dir)
+
+    def assert_no_staging_files(self, path):
+        self.assertFalse(os.path.exists(part_path(path)))
+        self.assertFalse(os.path.exists(validator_path(path)))
+
+    def test_delete(self):
+        self._loop.run_until_complete(polling_events.DeleteFile(self.path).run())
+        self.assertFalse(os.path.exists(self.path))
+        self.assert_no_staging_files(self.path)
+
+    def test_rename(self):
+        new_path = os.path.join(self.dir, 'renamed.txt')
+        self._loop.run_until_complete(polling_events.RenameFile(self.path, new_path).run())
+        self.assertTrue(os.path.exists(new_path))
+        self.assert_no_staging_files(self.path)
+        self.assert_no_staging_files(new_path)
+
+
+class FakeRangeQuery(object):
+    """Serves byte ranges of a file. The first response of each range breaks off after break_after bytes."""
+    def __init__(self, loop, body, ranges=True, break_after=None):
+        self.loop = loop
+        self.body = body
+        self.ranges = ranges
+        self.break_after = break_after
+        self.requests = []
+
+    @asyncio.coroutine
+    def make_request(self, url, headers=None, expects=None):
+        self.requests.append(headers)
+        headers = headers or {}
+        if not self.ranges or 'Range' not in headers or headers.get('If-Range', '"v1"') != '"v1"':
+            return FakeDownload(200, {'ETag': '"v1"'}, FakeContent(self.body))
+        first, last = (int(byte) for byte in headers['Range'][len('bytes='):].split('-'))
+        first_try = not any(
+            (request or {}).get('Range', '').split('-')[-1] == str(last) for request in self.requests[:-1]
+        )
+        return FakeDownload(
+            206,
+            {'ETag': '"v1"', 'Content-Range': 'bytes {}-{}/{}'.format(first, last, len(self.body))},
+            FakeContent(self.body[first:last + 1], break_after=self.break_after if first_try else None)
+        )
+
+
+@mock.patch.object(polling_events, 'PARALLEL_DOWNLOAD_MIN_RANGE', 4)
+@mock.patch.object(polling_events, 'PARALLEL_DOWNLOAD_MIN_SIZE', 8)
+class TestParallelDownload(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.dir = tempfile.mkdtemp()
+        self.path = ProperPath(os.path.join(self.dir, 'file.txt'), is_dir=False)
+
+    def tearDown(self):
+        self._loop.close()
+        shutil.rmtree(self.dir)
+
+    def download(self, osf_query, size):
+        self.md5 = self._loop.run_until_complete(
+            polling_events._download_file(self.path, 'http://localhost/file', osf_query, size)
+        )
+        with open(self.path.full_path, 'rb') as fd:
+            return fd.read()
+
+    def test_ranges_are_downloaded_and_continued(self):
+        osf_query = FakeRangeQuery(self._loop, b'0123456789abcdef', break_after=2)
+        self.assertEqual(self.download(osf_query, 16), b'0123456789abcdef')
+        self.assertEqual(self.md5, hashlib.md5(b'0123456789abcdef').hexdigest())
+        ranges = [headers['Range'] for headers in osf_query.requests]
+        self.assertEqual(ranges[:1], ['bytes=0-3'])
+        self.assertEqual(
+            sorted(ranges),
+            sorted(['bytes=0-3', 'bytes=4-7', 'bytes=8-11', 'bytes=12-15', 'bytes=2-3', 'bytes=6-7', 'bytes=10-11',
+                    'bytes=14-15'])
+        )
+        self.assertTrue(all(headers.get('If-Range') == '"v1"' for headers in osf_query.requests[1:]))
+        self.assertFalse(os.path.exists(part_path(self.path.full_path)))
+
+    def test_small_files_are_downloaded_in_one_stream(self):
+        osf_query = FakeRangeQuery(self._loop, b'0123')
+        self.assertEqual(self.download(osf_query, 4), b'0123')
+        self.assertEqual(self.md5, hashlib.md5(b'0123').hexdigest())
+        self.assertEqual(osf_query.requests, [None])
+
+    def test_server_without_ranges_falls_back_to_one_stream(self):
+        osf_query = FakeRangeQuery(self._loop, b'0123456789abcdef', ranges=False)
+        self.assertEqual(self.download(osf_query, 16), b'0123456789abcdef')
+        self.assertEqual(osf_query.requests[-1], None)
+
+    def test_file_of_another_size_falls_back_to_one_stream(self):
+        # the listing said 16 bytes, but the file has grown since
+        osf_query = FakeRangeQuery(self._loop, b'0123456789abcdefghij')
+        self.assertEqual(self.download(osf_query, 16), b'0123456789abcdefghij')
+        self.assertEqual(osf_query.requests, [{'Range': 'bytes=0-3'}, None])
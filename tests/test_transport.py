@@ -0,0 +1,59 @@
+import asyncio
+from unittest import TestCase
+
+from osfoffline.polling_osf_manager.osf_query import OSFQuery
+from osfoffline.polling_osf_manager.transport import (
+    Transport, get_transport, close_transport, get_blocking_session, get_ssl_context
+)
+from osfoffline.settings import HTTP_MAX_CONNECTIONS_PER_HOST
+
+
+class TestTransport(TestCase):
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        close_transport()
+        self._loop.close()
+
+    def test_connector_settings(self):
+        transport = Transport(self._loop, max_connections_per_host=3, keepalive_timeout=10)
+        self.assertTrue(transport.connector.resolve)
+        self.assertEqual(transport.connector.limit, 3)
+        self.assertIs(transport.connector.ssl_context, get_ssl_context())
+        transport.close()
+        self.assertTrue(transport.closed)
+
+    def test_transport_is_shared_per_loop(self):
+        transport = get_transport(self._loop)
+        self.assertIs(get_transport(self._loop), transport)
+        self.assertEqual(transport.connector.limit, HTTP_MAX_CONNECTIONS_PER_HOST)
+
+        other_loop = asyncio.new_event_loop()
+        try:
+            self.assertIsNot(get_transport(other_loop), transport)
+            self.assertTrue(transport.closed)
+        finally:
+            close_transport()
+            other_loop.close()
+
+    def test_closed_transport_is_replaced(self):
+        transport = get_transport(self._loop)
+        close_transport()
+        self.assertIsNot(get_transport(self._loop), transport)
+
+    def test_closing_a_query_keeps_the_connections(self):
+        transport = get_transport(self._loop)
+        first = OSFQuery(self._loop, 'token')
+        second = OSFQuery(self._loop, 'token')
+        self.assertIs(first.request_session.connector, transport.connector)
+        self.assertIs(second.request_session.connector, transport.connector)
+
+        first.close()
+        self.assertTrue(first.request_session.closed)
+        self.assertFalse(transport.closed)
+        self.assertFalse(second.request_session.closed)
+        second.close()
+
+    def test_blocking_session_is_shared(self):
+        self.assertIs(get_blocking_session(), get_blocking_session())
@@ -0,0 +1,117 @@
+from unittest import TestCase, mock
+import asyncio
+
+import aiohttp
+
+from osfoffline.polling_osf_manager.traversal import TraversalEngine
+
+
+class TestTraversalEngine(TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self._loop.close()
+
+    def test_walks_children_pushed_by_work_items(self):
+        engine = TraversalEngine(loop=self._loop, max_concurrency=4)
+        visited = []
+
+        @asyncio.coroutine
+        def visit(depth, name):
+            yield from asyncio.sleep(0, loop=self._loop)
+            visited.append(name)
+            if depth < 2:
+                for i in range(3):
+                    engine.push(visit, depth + 1, '{}/{}'.format(name, i))
+
+        engine.push(visit, 0, 'root')
+        self._loop.run_until_complete(engine.run())
+
+        self.assertEqual(len(visited), 1 + 3 + 9)
+        self.assertEqual(visited[0], 'root')
+        self.assertEqual(engine.pending, 0)
+
+    def test_siblings_run_concurrently_up_to_cap(self):
+        engine = TraversalEngine(loop=self._loop, max_concurrency=3)
+        running = [0]
+        most_running = [0]
+
+        @asyncio.coroutine
+        def visit():
+            running[0] += 1
+            most_running[0] = max(most_running[0], running[0])
+            yield from asyncio.sleep(0.01, loop=self._loop)
+            running[0] -= 1
+
+        for _ in range(10):
+            engine.push(visit)
+        self._loop.run_until_complete(engine.run())
+
+        self.assertEqual(most_running[0], 3)
+
+    @mock.patch('osfoffline.alerts.warn')
+    def test_failing_work_item_does_not_stop_walk(self, warn):
+        engine = TraversalEngine(loop=self._loop, max_concurrency=2)
+        visited = []
+
+        @asyncio.coroutine
+        def fail():
+            yield from asyncio.sleep(0, loop=self._loop)
+            raise aiohttp.errors.ClientConnectionError('no connection')
+
+        @asyncio.coroutine
+        def visit(name):
+            yield from asyncio.sleep(0, loop=self._loop)
+            visited.append(name)
+
+        engine.push(fail)
+        engine.push(visit, 'a')
+        engine.push(visit, 'b')
+        self._loop.run_until_complete(engine.run())
+
+        self.assertEqual(sorted(visited), ['a', 'b'])
+        self.assertEqual(engine.errors, 1)
+
+    def test_unexpected_error_is_raised(self):
+        engine = TraversalEngine(loop=self._loop, max_concurrency=2)
+
+        @asyncio.coroutine
+        def broken():
+            yield from asyncio.sleep(0, loop=self._loop)
+            raise AssertionError('broken')
+
+        @asyncio.coroutine
+        def slow():
+            yield from asyncio.sleep(10, loop=self._loop)
+
+        engine.push(broken)
+        engine.push(slow)
+        with self.assertRaises(AssertionError):
+            self._loop.run_until_complete(engine.run())
+
+    def test_stopped_run_resumes_from_frontier(self):
+        engine = TraversalEngine(loop=self._loop, max_concurrency=2)
+        visited = []
+
+        @asyncio.coroutine
+        def visit(depth, name):
+            yield from asyncio.sleep(0, loop=self._loop)
+            visited.append(name)
+            if depth < 2:
+                for i in range(3):
+                    engine.push(visit, depth + 1, '{}/{}'.format(name, i))
+
+        engine.push(visit, 0, 'root')
+        self._loop.run_until_complete(engine.run(should_stop=lambda: len(visited) >= 4))
+
+        self.assertGreaterEqual(len(visited), 4)
+        self.assertLess(len(visited), 13)
+        self.assertGreater(engine.pending, 0)
+
+        self._loop.run_until_complete(engine.run())
+
+        self.assertEqual(sorted(visited), sorted(set(visited)))
+        self.assertEqual(len(visited), 13)
+        self.assertEqual(engine.pending, 0)
@@ -0,0 +1,107 @@
+import asyncio
+from unittest import TestCase, mock
+
+from sqlalchemy.exc import OperationalError
+
+from osfoffline.database_manager import utils
+from osfoffline.database_manager.models import User
+from osfoffline.database_manager.utils import UnitOfWork, writer_scope
+from tests.fixtures.factories import common
+
+
+class TestUnitOfWork(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = common.Session()
+        # sees only what was committed
+        self.reader = common.session_factory()
+        self.unit_of_work = UnitOfWork(self.session, self.loop, max_items=3, max_delay=0.05)
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(User).delete()
+        self.session.commit()
+        common.Session.remove()
+        self.reader.close()
+        self.loop.close()
+
+    def committed_users(self):
+        count = self.reader.query(User).count()
+        self.reader.commit()
+        return count
+
+    def save_user(self, name):
+        user = User(full_name=name, osf_local_folder_path='/osf')
+        self.unit_of_work.save(user)
+        return user
+
+    def test_saves_wait_for_flush(self):
+        user = self.save_user('first')
+        # flushed right away
+        self.assertIsNotNone(user.id)
+        self.assertEqual(self.session.query(User).count(), 1)
+        self.assertEqual(self.committed_users(), 0)
+
+        self.unit_of_work.flush()
+        self.assertEqual(self.committed_users(), 1)
+        self.assertEqual(self.unit_of_work.commits, 1)
+
+    def test_commits_once_max_items_wait(self):
+        for name in ('first', 'second', 'third'):
+            self.save_user(name)
+        self.assertEqual(self.committed_users(), 3)
+        self.assertEqual(self.unit_of_work.pending, 0)
+        self.assertEqual(self.unit_of_work.commits, 1)
+
+    def test_commits_after_max_delay(self):
+        self.save_user('first')
+        self.save_user('second')
+        self.loop.run_until_complete(asyncio.sleep(0.1, loop=self.loop))
+        self.assertEqual(self.committed_users(), 2)
+        self.assertEqual(self.unit_of_work.commits, 1)
+
+    def test_flush_without_saves_does_not_commit(self):
+        self.unit_of_work.flush()
+        self.assertEqual(self.unit_of_work.commits, 0)
+
+    def test_failed_commit_rolls_back_the_batch(self):
+        self.save_user('first')
+        self.save_user('second')
+        error = OperationalError('COMMIT', {}, Exception('disk I/O error'))
+        with mock.patch.object(self.session, 'commit', side_effect=error):
+            with self.assertRaises(OperationalError):
+                self.unit_of_work.flush()
+        self.assertEqual(self.unit_of_work.pending, 0)
+        self.assertEqual(self.session.query(User).count(), 0)
+
+
+@mock.patch.object(utils, 'session_factory', common.session_factory)
+class TestWriterScope(TestCase):
+    def setUp(self):
+        # the session of the sync engine
+        self.session = common.Session()
+        self.user = User(full_name='user', osf_local_folder_path='/osf', logged_in=True)
+        self.session.add(self.user)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.rollback()
+        self.session.query(User).delete()
+        self.session.commit()
+        common.Session.remove()
+
+    def test_write_is_committed_in_a_session_of_its_own(self):
+        with writer_scope() as writer:
+            self.assertIsNot(writer, self.session)
+            writer.query(User).filter(User.logged_in).one().osf_local_folder_path = '/elsewhere'
+        self.assertNotIn(self.user, self.session.dirty)
+        self.session.refresh(self.user)
+        self.assertEqual(self.user.osf_local_folder_path, '/elsewhere')
+
+    def test_failed_write_is_rolled_back(self):
+        with self.assertRaises(ValueError):
+            with writer_scope() as writer:
+                writer.query(User).filter(User.logged_in).one().osf_local_folder_path = '/elsewhere'
+                raise ValueError()
+        self.session.refresh(self.user)
+        self.assertEqual(self.user.osf_local_folder_path, '/osf')